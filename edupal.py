@@ -1,33 +1,3336 @@
 import os
+import sys
 import json
+import argparse
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog, colorchooser
 from datetime import datetime
 import random
 import time
 import threading
+import tempfile
+import atexit
+import queue
+import hashlib
+import math
+import ast
+import bisect
+import csv
+import wave
+import sqlite3
+import mmap
+import heapq
+from array import array
+import re
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
 
+try:
+    import speech_recognition as sr
+    SPEECH_RECOGNITION_AVAILABLE = True
+except ImportError:
+    SPEECH_RECOGNITION_AVAILABLE = False
+
+# Minimum delay between redraws while an essay is streaming in (~30 fps)
+ESSAY_STREAM_FRAME_MS = 33
+
+# Upper bound on calculator plot/tabulation sizes
+MAX_PLOT_POINTS = 5000000
+
+# Chat answers go stale faster than essays
+CHAT_CACHE_TTL = 24 * 3600
+
+# Chat transcript paging: messages per page and most kept in the widget
+CHAT_PAGE_SIZE = 50
+CHAT_MAX_LOADED = 200
+
+# Token budget for the conversation history sent with each chat prompt,
+# of which the running summary of older turns may take up to a quarter
+CHAT_CONTEXT_TOKENS = 1200
+CHAT_SUMMARY_TOKENS = 300
+
+# Seconds to wait for background jobs to stop before closing the stores on exit
+JOB_SHUTDOWN_TIMEOUT = 2.0
+
+# Fixed height of a to-do row so the list can be virtualized
+TASK_ROW_HEIGHT = 36
+
+# To-do sort menu labels -> TaskModel sort names
+TASK_SORT_LABELS = {"Created": "created", "Due date": "due", "A-Z": "alpha"}
+TASK_FILE_TYPES = [("CSV files", "*.csv"), ("JSON Lines files", "*.jsonl"), ("All files", "*.*")]
+
+
+class SettingsStore:
+    """In-memory settings with debounced, atomic writes to a JSON file.
+
+    Changes only mark the store dirty; a background writer flushes them once
+    no further change has arrived for `delay` seconds, so slider drags and
+    theme previews cost no disk I/O until the user stops. The data is copied
+    under the lock but written after releasing it, and every snapshot carries
+    a generation so an older write never replaces a newer file.
+    """
+
+    def __init__(self, path, defaults=None, delay=0.5):
+        self.path = path
+        self.delay = delay
+        self.data = dict(defaults or {})
+        self.dirty = False
+        self.last_change = 0.0
+        self.closed = False
+        self.generation = 0  # Bumped by every change
+        self.written = 0  # Generation of the file on disk
+        self.lock = threading.Lock()
+        self.write_lock = threading.Lock()  # Orders file writes; never held with self.lock
+        self.changed = threading.Condition(self.lock)
+        self.writer = None
+
+    def load(self):
+        """Merge the settings file over the defaults without writing it back"""
+        try:
+            if os.path.exists(self.path):
+                with open(self.path, 'r') as f:
+                    loaded = json.load(f)
+                with self.lock:
+                    self.data.update(loaded)
+                    # Only persist if the file lacked some of the defaults
+                    self.dirty = any(key not in loaded for key in self.data)
+            else:
+                self.dirty = True
+        except Exception as e:
+            print(f"Error loading settings: {e}")
+        if self.dirty:
+            self.save()
+
+    def get(self, key, default=None):
+        with self.lock:
+            return self.data.get(key, default)
+
+    def __getitem__(self, key):
+        with self.lock:
+            return self.data[key]
+
+    def __setitem__(self, key, value):
+        with self.lock:
+            if key in self.data and self.data[key] == value:
+                return
+            self.data[key] = value
+            self.generation += 1
+            self.dirty = True
+            self.last_change = time.monotonic()
+            self._ensure_writer()
+            self.changed.notify()
+
+    def __contains__(self, key):
+        with self.lock:
+            return key in self.data
+
+    def save(self):
+        """Schedule a flush of any pending changes"""
+        with self.lock:
+            if not self.dirty:
+                return
+            self.last_change = time.monotonic()
+            self._ensure_writer()
+            self.changed.notify()
+
+    def _ensure_writer(self):
+        # Called with the lock held
+        if self.writer is None and not self.closed:
+            self.writer = threading.Thread(target=self._writer_loop, daemon=True)
+            self.writer.start()
+
+    def _writer_loop(self):
+        while True:
+            with self.lock:
+                while True:
+                    if self.closed:
+                        return
+                    if not self.dirty:
+                        self.changed.wait()
+                        continue
+                    # Wait until changes have settled for `delay` seconds
+                    remaining = self.last_change + self.delay - time.monotonic()
+                    if remaining > 0:
+                        self.changed.wait(remaining)
+                        continue
+                    generation, snapshot = self._take_snapshot()
+                    break
+            self._write(generation, snapshot)
+
+    def _take_snapshot(self):
+        # Called with the lock held
+        self.dirty = False
+        return self.generation, dict(self.data)
+
+    def _write(self, generation, snapshot):
+        """Atomically replace the file with snapshot unless a newer one is already there"""
+        with self.write_lock:
+            if generation < self.written:
+                return
+            directory = os.path.dirname(os.path.abspath(self.path))
+            try:
+                fd, tmp_path = tempfile.mkstemp(prefix=".settings-", suffix=".tmp", dir=directory)
+                with os.fdopen(fd, 'w') as f:
+                    json.dump(snapshot, f)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, self.path)
+                self.written = generation
+            except Exception as e:
+                with self.lock:
+                    self.dirty = True
+                print(f"Error saving settings: {e}")
+
+    def flush(self):
+        """Write pending changes immediately on the calling thread"""
+        with self.lock:
+            if not self.dirty:
+                return
+            generation, snapshot = self._take_snapshot()
+        self._write(generation, snapshot)
+
+    def close(self):
+        """Stop the background writer and flush what is left"""
+        with self.lock:
+            self.closed = True
+            self.changed.notify_all()
+        self.flush()
+
+
+def classify_essay_line(line):
+    """Return the text tag for one essay line ("header", "bullet" or None)"""
+    stripped = line.strip()
+    # Headers start with # or are all caps
+    if stripped.startswith('#') or (stripped.isupper() and len(stripped) > 3):
+        return "header"
+    if stripped.startswith(('•', '-', '*')):
+        return "bullet"
+    return None
+
+
+def parse_essay_spans(essay_text):
+    """Classify every line once and merge runs of lines with the same tag.
+
+    Returns {tag: [start, end, start, end, ...]} as Tk line indices for text
+    inserted as `essay_text + "\n"`, so each tag needs a single tag_add call.
+    """
+    spans = {}
+    run_tag = None
+    run_start = 1
+    number = 0
+    for number, line in enumerate(essay_text.split("\n"), start=1):
+        tag = classify_essay_line(line)
+        if tag != run_tag:
+            if run_tag:
+                spans.setdefault(run_tag, []).extend((f"{run_start}.0", f"{number}.0"))
+            run_tag, run_start = tag, number
+    if run_tag:
+        spans.setdefault(run_tag, []).extend((f"{run_start}.0", f"{number + 1}.0"))
+    return spans
+
+
+class EssayStreamFormatter:
+    """Split streamed text into complete, tagged lines as chunks arrive.
+
+    The unfinished last line is kept in `pending` until its newline shows up,
+    so each line is classified exactly once.
+    """
 
-class EduPal:
     def __init__(self):
-        self.root = tk.Tk()
-        self.root.title("EduPal - Your Educational Assistant")
-        self.root.geometry("900x700")  # Adjusted window size
-        self.root.minsize(800, 600)  # Set minimum window size
+        self.pending = ""
+        self.parts = []
+
+    def feed(self, chunk):
+        """Return a list of (line, tag) pairs completed by this chunk"""
+        self.parts.append(chunk)
+        self.pending += chunk
+        if "\n" not in self.pending:
+            return []
+        *lines, self.pending = self.pending.split("\n")
+        return [(line + "\n", classify_essay_line(line)) for line in lines]
+
+    def finish(self):
+        """Flush the trailing partial line"""
+        if not self.pending:
+            return []
+        line, self.pending = self.pending, ""
+        return [(line + "\n", classify_essay_line(line))]
+
+    def text(self):
+        return "".join(self.parts)
+
+
+def simulate_stream(text, first_chunk_delay=0.3, chunk_delay=0.02):
+    """Yield text word by word, like a streaming API would"""
+    time.sleep(first_chunk_delay)
+    start = 0
+    for i, char in enumerate(text):
+        if char in " \n":
+            yield text[start:i + 1]
+            start = i + 1
+            time.sleep(chunk_delay)
+    if start < len(text):
+        yield text[start:]
+
+
+class ResponseCache:
+    """Two-tier cache for generated text, keyed on a hash of the request.
+
+    Recent entries live in an in-memory LRU; everything is also written to a
+    cache directory whose total size is capped, oldest files evicted first.
+    The directory is scanned once at startup; after that a running byte
+    total is kept, so a put never lists the directory.
+    """
+
+    def __init__(self, directory, max_memory_entries=128, max_disk_bytes=20 * 1024 * 1024,
+                 default_ttl=7 * 24 * 3600):
+        self.directory = directory
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_bytes = max_disk_bytes
+        self.default_ttl = default_ttl
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0}
+        self.disk_files = OrderedDict()  # key -> size in bytes, oldest write first
+        self.disk_bytes = 0
+        self._scan_disk()
+
+    def _scan_disk(self):
+        files = []
+        try:
+            with os.scandir(self.directory) as entries:
+                for entry in entries:
+                    if entry.name.endswith(".json"):
+                        info = entry.stat()
+                        files.append((info.st_mtime, entry.name[:-len(".json")], info.st_size))
+        except OSError:
+            return  # No cache directory yet
+        for _, key, size in sorted(files):
+            self.disk_files[key] = size
+            self.disk_bytes += size
+
+    @staticmethod
+    def make_key(kind, **params):
+        """Content-addressed key for a request of the given kind"""
+        payload = json.dumps({"kind": kind, **params}, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + ".json")
+
+    def get(self, key):
+        now = time.time()
+        with self.lock:
+            entry = self.memory.get(key)
+            if entry is not None:
+                if entry["expires"] > now:
+                    self.memory.move_to_end(key)
+                    self.stats["memory_hits"] += 1
+                    return entry["value"]
+                del self.memory[key]
+
+        # Fall back to the disk tier
+        try:
+            with open(self._path(key), 'r', encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            entry = None
+        with self.lock:
+            if entry is None or entry["expires"] <= now:
+                self.stats["misses"] += 1
+                if entry is not None:
+                    self._remove_file(key)
+                return None
+            self.stats["disk_hits"] += 1
+            self._remember(key, entry)
+        return entry["value"]
+
+    def put(self, key, value, ttl=None):
+        entry = {"value": value, "expires": time.time() + (ttl or self.default_ttl)}
+        with self.lock:
+            self._remember(key, entry)
+        try:
+            data = json.dumps(entry).encode("utf-8")
+            os.makedirs(self.directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(suffix=".tmp", dir=self.directory)
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, self._path(key))
+            with self.lock:
+                self.disk_bytes += len(data) - self.disk_files.pop(key, 0)
+                self.disk_files[key] = len(data)
+            self._evict_disk()
+        except Exception as e:
+            print(f"Error writing response cache: {e}")
+
+    def _remember(self, key, entry):
+        # Called with the lock held
+        self.memory[key] = entry
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_memory_entries:
+            self.memory.popitem(last=False)
+
+    def _remove_file(self, key):
+        # Called with the lock held
+        self.disk_bytes -= self.disk_files.pop(key, 0)
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def _evict_disk(self):
+        """Delete the least recently written files until under the size cap"""
+        with self.lock:
+            while self.disk_bytes > self.max_disk_bytes and self.disk_files:
+                self._remove_file(next(iter(self.disk_files)))
+                self.stats["evictions"] += 1
+
+    def hit_rate(self):
+        with self.lock:
+            hits = self.stats["memory_hits"] + self.stats["disk_hits"]
+            total = hits + self.stats["misses"]
+        return hits / total if total else 0.0
+
+
+class CohereBackend:
+    """Text generation through one long-lived Cohere client.
+
+    The SDK keeps its HTTP session (and so its keep-alive connections) on the
+    client, so reusing one instance avoids a TLS handshake per request.
+    """
+
+    name = "cohere"
+
+    def __init__(self, api_key, timeout=60):
+        # Import cohere here to avoid import errors if not available
+        import cohere
+        self.client = cohere.Client(api_key, timeout=timeout)
+        # cohere>=5 has a separate streaming call and per-request options
+        self.v5 = hasattr(self.client, "generate_stream")
+
+    def _options(self, timeout):
+        if self.v5 and timeout:
+            return {"request_options": {"timeout_in_seconds": timeout}}
+        return {}
+
+    def generate(self, prompt, max_tokens, temperature=0.7, timeout=None):
+        kwargs = self._options(timeout)
+        if not self.v5:
+            kwargs["return_likelihoods"] = "NONE"
+        response = self.client.generate(prompt=prompt, max_tokens=max_tokens,
+                                        temperature=temperature, **kwargs)
+        return response.generations[0].text
+
+    def stream(self, prompt, max_tokens, temperature=0.7, timeout=None):
+        if self.v5:
+            for event in self.client.generate_stream(prompt=prompt, max_tokens=max_tokens,
+                                                     temperature=temperature, **self._options(timeout)):
+                if getattr(event, "event_type", None) == "text-generation":
+                    yield event.text
+        else:
+            for token in self.client.generate(prompt=prompt, max_tokens=max_tokens, temperature=temperature,
+                                              return_likelihoods="NONE", stream=True):
+                yield token.text
+
+
+class LLMGateway:
+    """Shared entry point for all text generation in the app.
+
+    The backend is built lazily on first use and then reused by every essay
+    and chat request. Any object with generate() and stream() methods can be
+    swapped in with set_backend(), e.g. a local stub for offline benchmarks.
+    An optional RateLimiter and concurrency cap apply to every request made
+    through the gateway, however many threads the callers fan out to.
+    """
+
+    def __init__(self, backend_factory=None, default_timeout=60, backend_name="cohere",
+                 limiter=None, max_concurrent=None):
+        self.backend_factory = backend_factory
+        self.backend_name = backend_name
+        self.default_timeout = default_timeout
+        self.limiter = limiter
+        self.slots = threading.BoundedSemaphore(max_concurrent) if max_concurrent else None
+        self._backend = None
+        self.lock = threading.Lock()
+
+    @property
+    def available(self):
+        return self._backend is not None or self.backend_factory is not None
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            with self.lock:
+                if self._backend is None:
+                    if self.backend_factory is None:
+                        raise ValueError("No language model is configured.")
+                    self._backend = self.backend_factory()
+        return self._backend
+
+    @property
+    def name(self):
+        if self._backend is not None:
+            return getattr(self._backend, "name", type(self._backend).__name__)
+        return self.backend_name if self.backend_factory else "none"
+
+    def set_backend(self, backend):
+        with self.lock:
+            self._backend = backend
+
+    def generate(self, prompt, max_tokens, temperature=0.7, timeout=None):
+        backend = self.backend
+        if self.limiter is not None:
+            self.limiter.acquire()
+        if self.slots is None:
+            return backend.generate(prompt, max_tokens, temperature=temperature,
+                                    timeout=timeout or self.default_timeout)
+        with self.slots:
+            return backend.generate(prompt, max_tokens, temperature=temperature,
+                                    timeout=timeout or self.default_timeout)
+
+    def stream(self, prompt, max_tokens, temperature=0.7, timeout=None):
+        backend = self.backend
+        if self.limiter is not None:
+            self.limiter.acquire()
+        if self.slots is None:
+            return backend.stream(prompt, max_tokens, temperature=temperature,
+                                  timeout=timeout or self.default_timeout)
+        return self._stream_in_slot(backend.stream(prompt, max_tokens, temperature=temperature,
+                                                   timeout=timeout or self.default_timeout))
+
+    def _stream_in_slot(self, chunks):
+        # Hold a concurrency slot until the stream is finished or abandoned
+        with self.slots:
+            yield from chunks
+
+
+class RateLimiter:
+    """Token bucket allowing `rate` calls per second with short bursts"""
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        if not self.rate:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class FakeLLMError(Exception):
+    """Error injected by the fake backend"""
+
+
+class FakeLLMBackend:
+    """Offline stand-in for the Cohere generate interface.
+
+    Replies are produced locally (sample essays, outlines, canned chat
+    answers) but timed like a real service: a first-token delay drawn from
+    a latency distribution, then tokens at `tokens_per_second`. A fraction
+    of requests fail, before or during streaming, when error_rate is set.
+    """
+
+    name = "fake"
+
+    def __init__(self, latency="lognormal", latency_mean=1.0, latency_sigma=0.5,
+                 tokens_per_second=50.0, error_rate=0.0, seed=None):
+        if latency not in ("constant", "uniform", "exponential", "lognormal"):
+            raise ValueError(f"Unknown latency distribution: {latency}")
+        self.latency = latency
+        self.latency_mean = latency_mean
+        self.latency_sigma = latency_sigma
+        self.tokens_per_second = tokens_per_second
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.calls = 0
+
+    def _first_token_delay(self):
+        with self.lock:
+            self.calls += 1
+            if self.latency == "constant":
+                return self.latency_mean
+            if self.latency == "uniform":
+                return self.random.uniform(0, 2 * self.latency_mean)
+            if self.latency == "exponential":
+                return self.random.expovariate(1 / self.latency_mean) if self.latency_mean else 0.0
+            # lognormal with the given median
+            return self.latency_mean * math.exp(self.random.gauss(0, self.latency_sigma))
+
+    def _should_fail(self):
+        with self.lock:
+            return self.random.random() < self.error_rate
+
+    def reply_for(self, prompt, max_tokens):
+        """Build a plausible reply for the kind of prompt we were given"""
+        essay = re.match(r"Write an essay about (.+?) that is approximately (\d+) words", prompt)
+        if essay:
+            text = sample_essay(essay.group(1), int(essay.group(2)),
+                                "section headers" in prompt, "bullet points" in prompt)
+        elif prompt.startswith("List the section headings"):
+            text = "\n".join(DEFAULT_ESSAY_SECTIONS)
+        elif prompt.startswith("Update the running summary"):
+            turns = prompt.rsplit("New turns:", 1)[1].split("\n\nUpdated summary:", 1)[0]
+            text = "The student discussed: " + "; ".join(
+                line.split(":", 1)[-1].strip()[:60] for line in turns.strip().splitlines() if line.strip())
+        elif "User:" in prompt:
+            question = prompt.rsplit("User:", 1)[1].split("\n", 1)[0].strip()
+            text = (f"Good question! Here is a short explanation of \"{question}\". "
+                    "Start from the key definitions, work through an example step by step, "
+                    "and then check your understanding with a practice problem.")
+        else:
+            text = ("This section develops the topic with a clear explanation, a supporting example "
+                    "and a short summary that links back to the main argument of the essay.")
+        words = text.split(" ")
+        return " ".join(words[:max_tokens])
+
+    def _wait(self, seconds, timeout):
+        if timeout and seconds > timeout:
+            time.sleep(timeout)
+            raise TimeoutError(f"Fake backend timed out after {timeout}s")
+        time.sleep(seconds)
+
+    def generate(self, prompt, max_tokens, temperature=0.7, timeout=None):
+        text = self.reply_for(prompt, max_tokens)
+        delay = self._first_token_delay() + len(text.split()) / self.tokens_per_second
+        self._wait(delay, timeout)
+        if self._should_fail():
+            raise FakeLLMError("Injected backend error")
+        return text
+
+    def stream(self, prompt, max_tokens, temperature=0.7, timeout=None):
+        text = self.reply_for(prompt, max_tokens)
+        self._wait(self._first_token_delay(), timeout)
+        fail_at = None
+        if self._should_fail():
+            fail_at = self.random.randint(0, len(text.split()))
+        for i, word in enumerate(text.split(" ")):
+            if i == fail_at:
+                raise FakeLLMError("Injected backend error while streaming")
+            yield word if i == 0 else " " + word
+            time.sleep(1 / self.tokens_per_second)
+
+
+def load_config(path="config.json"):
+    """Read config.json, returning an empty config if it is missing or broken"""
+    try:
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                return json.load(f)
+    except Exception as e:
+        print(f"Warning: Could not load configuration: {e}")
+    return {}
+
+
+def create_llm_gateway(config, limiter=None, max_concurrent=None):
+    """Build the shared LLM gateway described by a loaded config"""
+    api_key = config.get("cohere_api_key")
+    timeout = config.get("llm_timeout", 60)
+    backend_factory = None
+    backend_name = config.get("llm_backend", "cohere")
+    if backend_name == "fake":
+        # Local stand-in for offline load and latency testing
+        backend_factory = lambda: FakeLLMBackend(**config.get("fake_llm", {}))
+    elif api_key:
+        backend_factory = lambda: CohereBackend(api_key, timeout=timeout)
+    return LLMGateway(backend_factory, default_timeout=timeout, backend_name=backend_name,
+                      limiter=limiter, max_concurrent=max_concurrent)
+
+
+def build_essay_prompt(topic, word_count, add_headers, add_bullets):
+    # Configure the prompt based on format options
+    prompt = f"Write an essay about {topic} that is approximately {word_count} words long."
+    if add_headers:
+        prompt += " Structure it with a clear title at the top, and include section headers like 'Introduction', 'Main Points', and 'Conclusion'."
+    if add_bullets:
+        prompt += " Use bullet points (with • symbols) to list key information and arguments."
+    return prompt
+
+
+def postprocess_essay(essay_text, topic, add_headers, add_bullets):
+    # Post-process the essay text to enhance formatting
+    if add_headers and "TITLE:" not in essay_text and "Title:" not in essay_text:
+        title = topic.upper()
+        essay_text = f"TITLE: {title}\n\n{essay_text}"
         
-        # Add app icon if available
+    if add_bullets and "-" not in essay_text and "•" not in essay_text:
+        # Add some bullet points if the API didn't include any
+        lines = essay_text.split('\n')
+        for i in range(len(lines)):
+            if "key point" in lines[i].lower() or "important" in lines[i].lower():
+                lines[i] = "• " + lines[i]
+        essay_text = '\n'.join(lines)
+    return essay_text
+
+
+def essay_cache_key(llm, topic, word_count, add_headers, add_bullets, sectioned=False):
+    prompt = build_essay_prompt(topic, word_count, add_headers, add_bullets)
+    return ResponseCache.make_key("essay", backend=llm.name, prompt=prompt, topic=topic, word_count=word_count,
+                                  headers=add_headers, bullets=add_bullets, sectioned=sectioned)
+
+
+DEFAULT_ESSAY_SECTIONS = ["Introduction", "Main Points", "Conclusion"]
+
+
+def parse_outline(outline_text, max_sections=6):
+    """Turn an outline reply into a list of clean section headings"""
+    headings = []
+    for line in outline_text.split("\n"):
+        heading = line.strip().lstrip("#•-*0123456789.) ").strip().strip('"')
+        if heading and len(heading) < 80 and heading not in headings:
+            headings.append(heading)
+    if len(headings) < 2:
+        return list(DEFAULT_ESSAY_SECTIONS)
+    return headings[:max_sections]
+
+
+def generate_sectioned_essay(llm, topic, word_count, add_bullets, on_section=None, cancelled=None, pool=None):
+    """Outline first, then write every section concurrently under its own budget.
+
+    on_section(headings, sections) is called each time a section finishes,
+    with None for sections still being written. Sections run on `pool` when
+    given (so a batch shares one bounded pool), else on a pool of their own.
+    Returns the stitched essay with sections in outline order.
+    """
+    outline_prompt = (f"List the section headings for a {word_count}-word essay about {topic}. "
+                      "Reply with 3 to 5 short headings, one per line, starting with Introduction "
+                      "and ending with Conclusion. No numbering and no other text.")
+    headings = parse_outline(llm.generate(outline_prompt, max_tokens=60, temperature=0.3))
+
+    words_per_section = max(40, word_count // len(headings))
+
+    def write_section(heading):
+        if cancelled and cancelled():
+            return ""
+        prompt = (f"You are writing one section of an essay about {topic}. The essay's sections are: "
+                  f"{', '.join(headings)}. Write only the '{heading}' section in about {words_per_section} "
+                  "words. Do not repeat the heading and do not write other sections.")
+        if add_bullets:
+            prompt += " Use bullet points (with • symbols) to list key information and arguments."
+        return llm.generate(prompt, max_tokens=words_per_section * 2).strip()
+
+    sections = [None] * len(headings)
+    own_pool = pool is None
+    if own_pool:
+        pool = ThreadPoolExecutor(max_workers=len(headings))
+    try:
+        futures = {pool.submit(write_section, heading): index for index, heading in enumerate(headings)}
+        for future in as_completed(futures):
+            index = futures[future]
+            sections[index] = future.result()
+            if on_section:
+                on_section(headings, list(sections))
+    finally:
+        if own_pool:
+            pool.shutdown()
+
+    return stitch_sections(topic, headings, sections)
+
+
+def stitch_sections(topic, headings, sections, pending_text="Writing this section..."):
+    """Join section texts under their headings; unfinished ones get a placeholder"""
+    parts = [f"TITLE: {topic.upper()}"]
+    for heading, text in zip(headings, sections):
+        parts.append(f"# {heading}\n\n{text if text is not None else pending_text}")
+    return "\n\n".join(parts)
+
+
+def generate_essay_text(llm, topic, word_count, add_headers, add_bullets, cache=None, regenerate=False,
+                        sectioned=False, pool=None):
+    """Generate one finished essay without touching any UI.
+
+    Falls back to the sample essay when no model is configured. Only real
+    model output is cached. With sectioned set (and headers on) the essay is
+    written outline-first, one concurrent request per section.
+    """
+    if not llm.available:
+        essay_text = sample_essay(topic, word_count, add_headers, add_bullets)
+        return postprocess_essay(essay_text, topic, add_headers, add_bullets)
+    # Sectioned essays always have headers, so the option only applies with them
+    sectioned = sectioned and add_headers
+    cache_key = essay_cache_key(llm, topic, word_count, add_headers, add_bullets, sectioned)
+    if cache is not None and not regenerate:
+        cached = cache.get(cache_key)
+        if cached is not None:
+            return cached
+    if sectioned:
+        essay_text = generate_sectioned_essay(llm, topic, word_count, add_bullets, pool=pool)
+    else:
+        prompt = build_essay_prompt(topic, word_count, add_headers, add_bullets)
+        essay_text = llm.generate(prompt, max_tokens=word_count * 2)
+    essay_text = postprocess_essay(essay_text, topic, add_headers, add_bullets)
+    if cache is not None:
+        cache.put(cache_key, essay_text)
+    return essay_text
+
+
+TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+
+def estimate_tokens(text):
+    """Rough subword token count: one per short word or symbol, more for long words"""
+    return sum(1 + len(piece) // 8 for piece in TOKEN_PATTERN.findall(text))
+
+
+def clip_tokens(text, limit, keep_tail=False):
+    """Cut text at a word boundary to about `limit` estimated tokens, keeping its start (or end)"""
+    pieces = list(TOKEN_PATTERN.finditer(text))
+    if keep_tail:
+        pieces.reverse()
+    used = 0
+    for match in pieces:
+        used += 1 + len(match.group()) // 8
+        if used > limit:
+            # A kept tail must not open with the punctuation that followed the cut
+            return re.sub(r"^[\W_]+", "", text[match.end():]) if keep_tail else text[:match.start()].rstrip()
+    return text
+
+
+def summarize_turns_locally(summary, turns, limit):
+    """Extractive summary fallback: the first sentence of each turn, newest kept.
+
+    Whole turns are dropped from the front to fit `limit`; the older summary
+    gets whatever is left, starting at a turn (or at least a word) boundary.
+    """
+    notes = []
+    for speaker, text in turns:
+        first = re.split(r"(?<=[.!?])\s", text.strip(), maxsplit=1)[0]
+        notes.append(f"{speaker}: {clip_tokens(first, 40)}")
+    kept = []
+    used = 0
+    for note in reversed(notes):
+        tokens = estimate_tokens(note) + 1
+        if used + tokens > limit:
+            return " ".join(reversed(kept)) if kept else clip_tokens(note, limit)
+        kept.append(note)
+        used += tokens
+    kept.reverse()
+    if summary and used < limit:
+        earlier = clip_tokens(summary, limit - used, keep_tail=True)
+        if earlier != summary:
+            labels = "|".join(re.escape(speaker) for speaker in sorted({speaker for speaker, _ in turns}))
+            turn = re.search(rf"(?:^|\s)(?:{labels}):", earlier) if labels else None
+            if turn:
+                earlier = earlier[turn.start():].lstrip()
+        kept.insert(0, earlier)
+    return " ".join(filter(None, kept))
+
+
+class ConversationContext:
+    """Token-budgeted memory of the chat for multi-turn prompts.
+
+    The newest turns are kept verbatim while they fit the budget. Older turns
+    move to a pending queue and fold() merges them into a running summary
+    that is itself capped, so a prompt never grows with the session length.
+    Turns waiting to be folded are left out of the prompt until then.
+    """
+
+    def __init__(self, budget=CHAT_CONTEXT_TOKENS, summary_budget=CHAT_SUMMARY_TOKENS):
+        self.summary_budget = summary_budget
+        self.recent_budget = budget - summary_budget
+        self.turn_limit = self.recent_budget // 2  # One long paste must not flush the window
+        self.recent = deque()  # (speaker, text, tokens), oldest first
+        self.recent_tokens = 0
+        self.pending = deque()  # (speaker, text) waiting to be summarized
+        self.summary = ""
+        self.folding = False
+        self.lock = threading.Lock()
+
+    def add(self, speaker, text):
+        """Record a turn; returns whether older turns are waiting to be summarized"""
+        text = clip_tokens(text.strip(), self.turn_limit)
+        tokens = estimate_tokens(text) + 2  # Speaker label and separator
+        with self.lock:
+            self.recent.append((speaker, text, tokens))
+            self.recent_tokens += tokens
+            while self.recent_tokens > self.recent_budget:
+                old_speaker, old_text, old_tokens = self.recent.popleft()
+                self.recent_tokens -= old_tokens
+                self.pending.append((old_speaker, old_text))
+            return bool(self.pending)
+
+    def render(self):
+        """History block for the next prompt: summary, then recent turns"""
+        with self.lock:
+            lines = [f"{speaker}: {text}" for speaker, text, _ in self.recent]
+            if self.summary:
+                lines.insert(0, f"Summary of earlier conversation: {self.summary}")
+        return "\n".join(lines)
+
+    def fold(self, summarize=None):
+        """Merge pending turns into the summary; runs off the Tk thread.
+
+        summarize(summary, turns) returns the new summary text; without it,
+        or if it fails, the local extractive summary is used instead.
+        """
+        with self.lock:
+            if self.folding:
+                return
+            self.folding = True
+        try:
+            while True:
+                with self.lock:
+                    if not self.pending:
+                        return
+                    turns = list(self.pending)
+                    summary = self.summary
+                new_summary = None
+                if summarize is not None:
+                    try:
+                        new_summary = summarize(summary, turns)
+                    except Exception as e:
+                        print(f"Chat summary failed, using local summary: {e}")
+                if not new_summary:
+                    new_summary = summarize_turns_locally(summary, turns, self.summary_budget)
+                with self.lock:
+                    self.summary = clip_tokens(new_summary.strip(), self.summary_budget, keep_tail=True)
+                    for _ in turns:
+                        self.pending.popleft()
+        finally:
+            with self.lock:
+                self.folding = False
+
+    def clear(self):
+        with self.lock:
+            self.recent.clear()
+            self.pending.clear()
+            self.recent_tokens = 0
+            self.summary = ""
+
+
+def summarize_chat_turns(llm, summary, turns, max_tokens=CHAT_SUMMARY_TOKENS):
+    """Ask the model to fold new turns into the running conversation summary"""
+    transcript = "\n".join(f"{speaker}: {text}" for speaker, text in turns)
+    prompt = ("Update the running summary of a tutoring conversation. Keep the topics, key facts "
+              f"and open questions, in at most {max_tokens * 3 // 4} words.\n\n"
+              f"Summary so far:\n{summary or '(none)'}\n\nNew turns:\n{transcript}\n\nUpdated summary:")
+    return llm.generate(prompt, max_tokens=max_tokens, temperature=0.3)
+
+
+def passage_source(key):
+    """Display name for the source of a NotesIndex passage"""
+    return "your to-do list" if key.startswith("task:") else os.path.basename(key)
+
+
+def format_passages(passages, limit=150):
+    """Numbered passages for a prompt, each clipped to about `limit` tokens"""
+    return "\n".join(f"[{i}] ({passage_source(key)}) {clip_tokens(text, limit)}"
+                     for i, (_, _, key, text) in enumerate(passages, 1))
+
+
+def answer_from_notes(passages):
+    """Offline reply quoting the best matching passages"""
+    quotes = "\n\n".join(f"From {passage_source(key)}:\n{clip_tokens(text, 80)}" for _, _, key, text in passages)
+    return f"I can't reach the AI service right now, but here is what your notes say:\n\n{quotes}"
+
+
+def generate_chat_reply(llm, user_message, cache=None, fresh=False, history="", passages=()):
+    """Answer one chat message through the LLM gateway, using the cache if given.
+
+    history is the rendered ConversationContext of the turns before this one;
+    passages are NotesIndex search hits to ground the answer in. Only
+    questions asked without history are cached: they are keyed on the bare
+    question, while an answer that depends on the conversation is not reused.
+    """
+    if not llm.available:
+        raise ValueError("Cohere API key is missing. Please configure it in 'config.json'.")
+
+    # Using generate instead of chat (simpler API)
+    prompt = "You are a helpful educational AI assistant."
+    if passages:
+        prompt += (" Use these passages from the student's own notes where they are relevant:\n"
+                   f"{format_passages(passages)}")
+    prompt += f"\n{history}\n" if history else " "
+    prompt += f"User: {user_message}\nAI Assistant:"
+    if history:
+        cache = None
+    if cache is not None:
+        cache_key = ResponseCache.make_key("chat", backend=llm.name, question=user_message,
+                                           notes=[text for _, _, _, text in passages])
+        if not fresh:
+            cached = cache.get(cache_key)
+            if cached is not None:
+                return cached
+
+    # Shared client: no per-request import or connection setup
+    bot_response = llm.generate(prompt, max_tokens=300).strip()
+    if cache is not None:
+        cache.put(cache_key, bot_response, ttl=CHAT_CACHE_TTL)
+    return bot_response
+
+
+def sample_essay(topic, word_count, add_headers, add_bullets):
+    """Generate a sample essay when the API key is not available"""
+    
+    # Base text structure
+    intro = f"Introduction to {topic}\n\nAn essay exploring the various aspects of {topic}. This topic is interesting for several reasons and merits thorough examination."
+    
+    body_sections = [
+        f"Understanding {topic} requires analysis of its key components. Researchers have identified several factors that contribute to this subject.",
+        f"The history of {topic} provides valuable context. Over time, significant developments have shaped our understanding of this area.",
+        f"When considering the practical applications of {topic}, we can identify numerous examples across different domains.",
+        f"Recent advances related to {topic} have opened new possibilities for research and development in this field."
+    ]
+    
+    conclusion = f"In conclusion, {topic} represents an important area of study with numerous implications. Further research and practical applications will continue to enhance our understanding."
+    
+    # Build the essay
+    essay_parts = []
+    
+    # Add introduction
+    if add_headers:
+        essay_parts.append("# Introduction")
+    essay_parts.append(intro)
+    
+    # Add body sections
+    for i, section in enumerate(body_sections[:3]):  # Limit to 3 sections for shorter essays
+        if add_headers:
+            essay_parts.append(f"\n# Section {i+1}")
+        essay_parts.append(section)
+        
+        # Add bullet points if requested
+        if add_bullets:
+            essay_parts.append("\nKey points:")
+            for j in range(3):
+                point = f"• Important aspect {j+1} related to this section of {topic}"
+                essay_parts.append(point)
+    
+    # Add conclusion
+    if add_headers:
+        essay_parts.append("\n# Conclusion")
+    essay_parts.append(conclusion)
+    
+    # Join all parts
+    return "\n\n".join(essay_parts)
+
+
+class MicrophoneSource:
+    """Reads raw 16-bit mono audio from the default microphone in small chunks"""
+
+    def __init__(self, sample_rate=16000, chunk_size=480):
+        self.sample_rate = sample_rate
+        self.sample_width = 2
+        self.chunk_size = chunk_size
+        self.microphone = None
+
+    def __enter__(self):
+        self.microphone = sr.Microphone(sample_rate=self.sample_rate, chunk_size=self.chunk_size)
+        self.microphone.__enter__()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.microphone.__exit__(*exc_info)
+
+    def read(self):
+        return self.microphone.stream.read(self.chunk_size)
+
+
+class WavFileSource:
+    """Plays a 16-bit mono WAV file as if it were a microphone (for testing)"""
+
+    def __init__(self, path, chunk_size=480, realtime=True):
+        self.path = path
+        self.chunk_size = chunk_size
+        self.realtime = realtime
+
+    def __enter__(self):
+        self.wav = wave.open(self.path, "rb")
+        if self.wav.getsampwidth() != 2 or self.wav.getnchannels() != 1:
+            self.wav.close()
+            raise ValueError("Test WAV files must be 16-bit mono")
+        self.sample_rate = self.wav.getframerate()
+        self.sample_width = 2
+        return self
+
+    def __exit__(self, *exc_info):
+        self.wav.close()
+
+    def read(self):
+        data = self.wav.readframes(self.chunk_size)
+        if self.realtime and data:
+            time.sleep(self.chunk_size / self.sample_rate)
+        return data
+
+
+class GoogleRecognizer:
+    """Online recognition through speech_recognition's Google Web Speech API"""
+
+    def __init__(self):
+        self.recognizer = sr.Recognizer()
+
+    def recognize(self, audio, sample_rate, sample_width):
+        try:
+            return self.recognizer.recognize_google(sr.AudioData(audio, sample_rate, sample_width))
+        except sr.UnknownValueError:
+            return ""
+
+
+class OfflineRecognizer:
+    """Offline recognition with CMU Sphinx (needs the pocketsphinx package)"""
+
+    def __init__(self):
+        self.recognizer = sr.Recognizer()
+
+    def recognize(self, audio, sample_rate, sample_width):
+        try:
+            return self.recognizer.recognize_sphinx(sr.AudioData(audio, sample_rate, sample_width))
+        except sr.UnknownValueError:
+            return ""
+
+
+class ScriptedRecognizer:
+    """Returns the lines of a transcript file, one per utterance (for testing)"""
+
+    def __init__(self, transcript_path):
+        with open(transcript_path, 'r', encoding="utf-8") as f:
+            self.phrases = [line.strip() for line in f if line.strip()]
+        self.index = 0
+
+    def recognize(self, audio, sample_rate, sample_width):
+        if self.index >= len(self.phrases):
+            return ""
+        self.index += 1
+        return self.phrases[self.index - 1]
+
+
+class VoiceActivityDetector:
+    """Energy-based speech detector with an adaptive noise floor"""
+
+    def __init__(self, threshold_ratio=3.0, min_energy=300.0):
+        self.threshold_ratio = threshold_ratio
+        self.min_energy = min_energy
+        self.noise_floor = None
+
+    def is_speech(self, chunk):
+        samples = array("h", chunk[:len(chunk) - len(chunk) % 2])
+        if sys.byteorder == "big":
+            samples.byteswap()
+        if not samples:
+            return False
+        energy = math.sqrt(sum(sample * sample for sample in samples) / len(samples))
+        if self.noise_floor is None:
+            self.noise_floor = energy
+        speech = energy > max(self.min_energy, self.noise_floor * self.threshold_ratio)
+        if not speech:
+            # Track background noise slowly so speech does not raise the floor
+            self.noise_floor = 0.95 * self.noise_floor + 0.05 * energy
+        return speech
+
+
+class VoicePipeline:
+    """Chunked capture with voice-activity detection, off the Tk thread.
+
+    Audio is read in ~30 ms chunks. A short pause ends a phrase, which is
+    recognized right away and reported through on_partial; a long pause (or
+    max_seconds) ends the whole dictation. Nothing here touches Tk.
+    """
+
+    def __init__(self, source, recognizer, phrase_pause=0.4, end_pause=1.2,
+                 start_timeout=5.0, max_seconds=30.0):
+        self.source = source
+        self.recognizer = recognizer
+        self.phrase_pause = phrase_pause
+        self.end_pause = end_pause
+        self.start_timeout = start_timeout
+        self.max_seconds = max_seconds
+        self.detector = VoiceActivityDetector()
+
+    def run(self, on_partial, cancelled=lambda: False):
+        """Capture until the speaker stops; return the full transcript"""
+        phrases = []
+        with self.source as source:
+            rate = source.sample_rate
+            phrase = bytearray()
+            elapsed = silence = 0.0
+            heard_speech = False
+            phrase_has_speech = False  # Cleared once the phrase is flushed
+            while not cancelled():
+                chunk = source.read()
+                if not chunk:
+                    break
+                duration = len(chunk) / (source.sample_width * rate)
+                elapsed += duration
+                if self.detector.is_speech(chunk):
+                    heard_speech = phrase_has_speech = True
+                    silence = 0.0
+                    phrase.extend(chunk)
+                elif heard_speech:
+                    silence += duration
+                    if phrase_has_speech:
+                        phrase.extend(chunk)
+                        if silence >= self.phrase_pause:
+                            self._recognize(phrase, rate, source.sample_width, phrases, on_partial)
+                            phrase = bytearray()
+                            phrase_has_speech = False
+                    if silence >= self.end_pause:
+                        break
+                elif elapsed >= self.start_timeout:
+                    break  # Nobody started speaking
+                if elapsed >= self.max_seconds:
+                    break
+            if phrase_has_speech and not cancelled():
+                self._recognize(phrase, rate, source.sample_width, phrases, on_partial)
+        return " ".join(phrases)
+
+    def _recognize(self, phrase, rate, width, phrases, on_partial):
+        text = self.recognizer.recognize(bytes(phrase), rate, width)
+        if text:
+            phrases.append(text)
+            on_partial(" ".join(phrases))
+
+
+class StudyTimer:
+    """Pomodoro state kept as a time.monotonic() deadline rather than a tick count.
+
+    The remaining time is always computed from the deadline, so late or
+    skipped UI ticks (a modal dialog, a busy main thread, a hidden screen)
+    never stretch a session. It holds no widgets and outlives any screen.
+    """
+
+    MAX_WORK_MINUTES = 60
+    MAX_BREAK_MINUTES = 30
+
+    def __init__(self, work_seconds=25 * 60, break_seconds=5 * 60, clock=time.monotonic):
+        self.clock = clock
+        self.work_seconds = work_seconds
+        self.break_seconds = break_seconds
+        self.session_type = "work"
+        self.running = False
+        self.deadline = None
+        self.paused_remaining = work_seconds
+        self.started_at = None
+
+    def configure(self, work_seconds, break_seconds):
+        """Change durations; applies to the current session only if it has not started"""
+        untouched = not self.running and self.paused_remaining == self.duration()
+        self.work_seconds = work_seconds
+        self.break_seconds = break_seconds
+        if untouched:
+            self.paused_remaining = self.duration()
+
+    def duration(self):
+        return self.work_seconds if self.session_type == "work" else self.break_seconds
+
+    def start(self):
+        if not self.running:
+            self.running = True
+            self.deadline = self.clock() + self.paused_remaining
+            if self.started_at is None:
+                self.started_at = time.time()
+
+    def pause(self):
+        if self.running:
+            self.paused_remaining = self.remaining()
+            self.running = False
+
+    def reset(self):
+        self.running = False
+        self.session_type = "work"
+        self.paused_remaining = self.work_seconds
+        self.started_at = None
+
+    def remaining(self):
+        if self.running:
+            return max(0.0, self.deadline - self.clock())
+        return self.paused_remaining
+
+    def display_seconds(self):
+        """Whole seconds to show; rounds up so a fresh session shows its full length"""
+        return math.ceil(self.remaining() - 1e-6)
+
+    def poll(self):
+        """Advance to the next session once the deadline passes.
+
+        Returns the finished session type ("work" or "break"), or None.
+        """
+        if not self.running or self.remaining() > 0:
+            return None
+        finished = self.session_type
+        self.running = False
+        self.session_type = "break" if finished == "work" else "work"
+        self.paused_remaining = self.duration()
+        self.started_at = None
+        return finished
+
+    def next_tick_ms(self):
+        """Milliseconds until the displayed second changes"""
+        fraction = self.remaining() % 1.0
+        return int((fraction or 1.0) * 1000) + 5
+
+
+class SessionStore:
+    """Append-only study session history in SQLite with running totals.
+
+    Every event is appended to session_events, and in the same transaction
+    the daily, weekly and per-subject totals are bumped. Totals are also
+    mirrored in memory, so reads never scan the history.
+    """
+
+    ALL_SUBJECTS = "*"
+
+    def __init__(self, path="edupal.db"):
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS session_events (
+                id INTEGER PRIMARY KEY,
+                ts REAL NOT NULL,
+                kind TEXT NOT NULL,
+                subject TEXT NOT NULL,
+                seconds REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS session_totals (
+                period TEXT NOT NULL,
+                bucket TEXT NOT NULL,
+                subject TEXT NOT NULL,
+                seconds REAL NOT NULL,
+                sessions INTEGER NOT NULL,
+                PRIMARY KEY (period, bucket, subject)
+            );
+        """)
+        self.totals = {}
+        for period, bucket, subject, seconds, sessions in self.db.execute("SELECT * FROM session_totals"):
+            self.totals[(period, bucket, subject)] = [seconds, sessions]
+
+    @staticmethod
+    def buckets(when):
+        day = when.strftime("%Y-%m-%d")
+        year, week, _ = when.isocalendar()
+        return [("day", day), ("week", f"{year}-W{week:02d}"), ("all", "all")]
+
+    def record(self, kind, subject, seconds, when=None):
+        """Append one finished session and update every affected total"""
+        when = when or datetime.now()
+        subject = subject.strip() or "General"
+        with self.lock, self.db:
+            self.db.execute("INSERT INTO session_events (ts, kind, subject, seconds) VALUES (?, ?, ?, ?)",
+                            (when.timestamp(), kind, subject, seconds))
+            if kind != "work":
+                return  # Breaks are logged but do not count as study time
+            for period, bucket in self.buckets(when):
+                for key_subject in (subject, self.ALL_SUBJECTS):
+                    self.db.execute("""
+                        INSERT INTO session_totals VALUES (?, ?, ?, ?, 1)
+                        ON CONFLICT (period, bucket, subject)
+                        DO UPDATE SET seconds = seconds + excluded.seconds, sessions = sessions + 1
+                    """, (period, bucket, key_subject, seconds))
+                    total = self.totals.setdefault((period, bucket, key_subject), [0.0, 0])
+                    total[0] += seconds
+                    total[1] += 1
+
+    def total(self, period, when=None, subject=ALL_SUBJECTS):
+        """Study seconds for the day/week/all-time bucket containing `when`"""
+        bucket = dict(self.buckets(when or datetime.now()))[period]
+        with self.lock:
+            return self.totals.get((period, bucket, subject), (0.0, 0))[0]
+
+    def subject_totals(self):
+        """All-time study seconds per subject, largest first"""
+        with self.lock:
+            totals = [(subject, value[0]) for (period, _, subject), value in self.totals.items()
+                      if period == "all" and subject != self.ALL_SUBJECTS]
+        return sorted(totals, key=lambda item: item[1], reverse=True)
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+
+class ChatStore:
+    """AI Assistant transcript in SQLite, paged by id and searchable.
+
+    Messages are appended to chat_messages, and an external-content FTS5
+    index is kept in sync by a trigger, so a search over years of history
+    is one index lookup. Readers fetch fixed-size pages before a given id,
+    so loading the latest page costs the same however long the history is.
+    Falls back to LIKE matching when SQLite was built without FTS5.
+    """
+
+    def __init__(self, path="edupal.db"):
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS chat_messages (
+                id INTEGER PRIMARY KEY,
+                ts REAL NOT NULL,
+                sender TEXT NOT NULL,
+                message TEXT NOT NULL
+            );
+        """)
+        try:
+            self.db.executescript("""
+                CREATE VIRTUAL TABLE IF NOT EXISTS chat_search USING fts5(
+                    sender, message, content='chat_messages', content_rowid='id'
+                );
+                CREATE TRIGGER IF NOT EXISTS chat_messages_ai AFTER INSERT ON chat_messages BEGIN
+                    INSERT INTO chat_search (rowid, sender, message) VALUES (new.id, new.sender, new.message);
+                END;
+            """)
+            self.fts = True
+        except sqlite3.OperationalError:
+            self.fts = False
+
+    def add(self, sender, message, when=None):
+        """Append one message and return its id"""
+        when = when or datetime.now()
+        with self.lock, self.db:
+            cursor = self.db.execute("INSERT INTO chat_messages (ts, sender, message) VALUES (?, ?, ?)",
+                                     (when.timestamp(), sender, message))
+            return cursor.lastrowid
+
+    def page(self, before_id=None, after_id=None, limit=50):
+        """Up to `limit` messages just before before_id or just after after_id, oldest first.
+
+        With neither id the newest page is returned.
+        """
+        with self.lock:
+            if after_id is not None:
+                return self.db.execute("SELECT id, ts, sender, message FROM chat_messages "
+                                       "WHERE id > ? ORDER BY id LIMIT ?", (after_id, limit)).fetchall()
+            if before_id is None:
+                rows = self.db.execute("SELECT id, ts, sender, message FROM chat_messages "
+                                       "ORDER BY id DESC LIMIT ?", (limit,)).fetchall()
+            else:
+                rows = self.db.execute("SELECT id, ts, sender, message FROM chat_messages "
+                                       "WHERE id < ? ORDER BY id DESC LIMIT ?", (before_id, limit)).fetchall()
+        return rows[::-1]
+
+    def search(self, query, limit=50):
+        """Messages matching every word of query, best matches first"""
+        words = re.findall(r"\w+", query)
+        if not words:
+            return []
+        with self.lock:
+            if self.fts:
+                match = " ".join(f'"{word}"*' for word in words)
+                return self.db.execute("SELECT m.id, m.ts, m.sender, m.message FROM chat_search "
+                                       "JOIN chat_messages AS m ON m.id = chat_search.rowid "
+                                       "WHERE chat_search MATCH ? ORDER BY rank LIMIT ?",
+                                       (match, limit)).fetchall()
+            where = " AND ".join("message LIKE ?" for _ in words)
+            return self.db.execute(f"SELECT id, ts, sender, message FROM chat_messages WHERE {where} "
+                                   "ORDER BY id DESC LIMIT ?",
+                                   [f"%{word}%" for word in words] + [limit]).fetchall()
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+
+# Words that only phrase a question ("what is", "explain", "tell me about")
+QUESTION_FILLER_WORDS = frozenset("""
+    a an the is are was were be been what whats what's which do does did can could would will
+    please explain define definition describe tell me about give show i you we of to for on in
+    and or my some simple simply terms briefly brief mean meaning means by
+""".split())
+
+# Questions that lean on the conversation ("explain it again") are never shared
+FOLLOW_UP_WORDS = frozenset("it its this that these those they them he she his her above again more previous".split())
+
+
+def question_tokens(question):
+    """Normalized word tokens of a question: lowercased, fillers dropped, plurals folded"""
+    words = re.findall(r"[a-z0-9]+", question.lower().replace("'", ""))
+    tokens = []
+    for word in words:
+        if word in QUESTION_FILLER_WORDS:
+            continue
+        if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        tokens.append(word)
+    return tokens
+
+
+class QuestionCache:
+    """Near-duplicate answer cache for AI Assistant questions.
+
+    Each question is reduced to word and word-pair shingles and a MinHash
+    signature; the signature is split into bands indexed in an LSH table, so
+    a lookup only compares the few questions that share a band. Candidates
+    are confirmed with the exact Jaccard similarity of their shingles against
+    `threshold`. Entries expire after `ttl` and the least recently used are
+    evicted past `max_entries`. Entries persist in SQLite so answers carry
+    over between sessions; the index is rebuilt on first use, off the Tk thread.
+    """
+
+    PRIME = (1 << 61) - 1
+
+    def __init__(self, path="edupal.db", threshold=0.7, max_entries=2000, ttl=CHAT_CACHE_TTL,
+                 num_perm=64, bands=16):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.bands = bands
+        self.rows = num_perm // bands
+        rng = random.Random(1)  # Fixed so signatures stay comparable between runs
+        self.perms = [(rng.randrange(1, self.PRIME), rng.randrange(self.PRIME)) for _ in range(num_perm)]
+        self.entries = OrderedDict()  # id -> (shingles, signature, answer, created), LRU last
+        self.buckets = [{} for _ in range(bands)]  # band value -> set of ids
+        self.hash_rows = {}
+        self.path = path
+        self.db = None  # Opened and loaded on first use, off the Tk thread
+        self.stats = {"hits": 0, "misses": 0, "skipped": 0, "stores": 0, "evictions": 0}
+        self.lock = threading.Lock()
+
+    def _load(self):
+        # Called with the lock held
+        self.db = sqlite3.connect(self.path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        with self.db:
+            self.db.execute("""
+                CREATE TABLE IF NOT EXISTS question_cache (
+                    id INTEGER PRIMARY KEY,
+                    question TEXT NOT NULL,
+                    answer TEXT NOT NULL,
+                    created REAL NOT NULL
+                )
+            """)
+            self.db.execute("DELETE FROM question_cache WHERE created <= ?", (time.time() - self.ttl,))
+            rows = self.db.execute("SELECT id, question, answer, created FROM question_cache "
+                                   "ORDER BY id DESC LIMIT ?", (self.max_entries,)).fetchall()
+        for entry_id, question, answer, created in reversed(rows):
+            shingles = self.shingles(question)
+            if shingles:
+                self._index(entry_id, shingles, self.signature(shingles), answer, created)
+
+    @staticmethod
+    def shingles(question):
+        """Words and adjacent word pairs of the normalized question, or None if not shareable"""
+        if FOLLOW_UP_WORDS.intersection(re.findall(r"[a-z]+", question.lower())):
+            return None
+        tokens = question_tokens(question)
+        if not tokens:
+            return None
+        return frozenset(tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])])
+
+    def signature(self, shingles):
+        rows = []
+        for shingle in shingles:
+            # Permuted hashes per shingle are memoized; the same words recur in most questions
+            row = self.hash_rows.get(shingle)
+            if row is None:
+                if len(self.hash_rows) >= 50000:
+                    self.hash_rows.clear()
+                h = int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(), "big")
+                row = self.hash_rows[shingle] = [(a * h + b) % self.PRIME for a, b in self.perms]
+            rows.append(row)
+        return tuple(map(min, zip(*rows)))
+
+    def _band_keys(self, signature):
+        rows = self.rows
+        return [signature[i * rows:(i + 1) * rows] for i in range(self.bands)]
+
+    def _find(self, shingles, signature, now):
+        # Called with the lock held; best unexpired match at or above the threshold
+        candidates = set()
+        for bucket, key in zip(self.buckets, self._band_keys(signature)):
+            candidates.update(bucket.get(key, ()))
+        best, best_score = None, self.threshold
+        for entry_id in candidates:
+            other, _, _, created = self.entries[entry_id]
+            if created <= now - self.ttl:
+                continue
+            score = len(shingles & other) / len(shingles | other)
+            if score >= best_score:
+                best, best_score = entry_id, score
+        return best
+
+    def _index(self, entry_id, shingles, signature, answer, created):
+        # Called with the lock held
+        self.entries[entry_id] = (shingles, signature, answer, created)
+        for bucket, key in zip(self.buckets, self._band_keys(signature)):
+            bucket.setdefault(key, set()).add(entry_id)
+
+    def _unindex(self, entry_id):
+        # Called with the lock held
+        _, signature, _, _ = self.entries.pop(entry_id)
+        for bucket, key in zip(self.buckets, self._band_keys(signature)):
+            ids = bucket[key]
+            ids.discard(entry_id)
+            if not ids:
+                del bucket[key]
+
+    def lookup(self, question):
+        """Cached answer to a near-identical question, or None"""
+        shingles = self.shingles(question)
+        if shingles is None:
+            with self.lock:
+                self.stats["skipped"] += 1
+            return None
+        with self.lock:
+            if self.db is None:
+                self._load()
+            signature = self.signature(shingles)
+            entry_id = self._find(shingles, signature, time.time())
+            if entry_id is None:
+                self.stats["misses"] += 1
+                return None
+            self.entries.move_to_end(entry_id)
+            self.stats["hits"] += 1
+            return self.entries[entry_id][2]
+
+    def store(self, question, answer):
+        """Remember an answer, replacing the entry of any near-identical question"""
+        shingles = self.shingles(question)
+        if shingles is None:
+            return
+        now = time.time()
+        with self.lock:
+            if self.db is None:
+                self._load()
+            signature = self.signature(shingles)
+            stale = []
+            entry_id = self._find(shingles, signature, now)
+            if entry_id is not None:
+                self._unindex(entry_id)
+                stale.append(entry_id)
+            with self.db:
+                cursor = self.db.execute("INSERT INTO question_cache (question, answer, created) VALUES (?, ?, ?)",
+                                         (question, answer, now))
+                self._index(cursor.lastrowid, shingles, signature, answer, now)
+                self.stats["stores"] += 1
+                while len(self.entries) > self.max_entries:
+                    oldest = next(iter(self.entries))
+                    self._unindex(oldest)
+                    stale.append(oldest)
+                    self.stats["evictions"] += 1
+                self.db.executemany("DELETE FROM question_cache WHERE id = ?", [(i,) for i in stale])
+
+    def hit_rate(self):
+        with self.lock:
+            hits = self.stats["hits"]
+            total = hits + self.stats["misses"]
+        return hits / total if total else 0.0
+
+    def close(self):
+        with self.lock:
+            if self.db is not None:
+                self.db.close()
+                self.db = None
+
+
+# Words too common to be worth a postings list
+INDEX_STOP_WORDS = frozenset("""
+    a an the and or of to in on at for by with from as is are was were be been being it its
+    this that these those not but if then so do does did has have had will would can could
+""".split())
+
+NOTE_EXTENSIONS = (".txt", ".md", ".markdown")
+
+
+def index_terms(text):
+    """Search terms of a text: lowercased words without stop words, plurals folded"""
+    terms = []
+    for word in re.findall(r"[a-z0-9]+", text.lower()):
+        if word in INDEX_STOP_WORDS or len(word) > 40:
+            continue
+        if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        terms.append(word)
+    return terms
+
+
+def split_passages(text, max_words=120):
+    """Paragraph-sized chunks of a document; long paragraphs are cut by word count"""
+    for paragraph in re.split(r"\n\s*\n", text):
+        words = paragraph.split()
+        for start in range(0, len(words), max_words):
+            yield " ".join(words[start:start + max_words])
+
+
+def note_file_sources(folders, essay_dir="."):
+    """Index sources for exported essays and .txt/.md files under the notes folders.
+
+    Maps each absolute path to ([mtime_ns, size], loader); the version tells
+    NotesIndex.refresh() whether the file changed since it was indexed.
+    """
+    def loader(path):
+        def load():
+            with open(path, 'r', encoding="utf-8", errors="replace") as f:
+                return f.read()
+        return load
+
+    sources = {}
+
+    def add(entry):
+        stat = entry.stat()
+        sources[os.path.abspath(entry.path)] = ([stat.st_mtime_ns, stat.st_size], loader(entry.path))
+
+    def walk(folder):
+        try:
+            entries = list(os.scandir(folder))
+        except OSError:
+            return
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False) and not entry.name.startswith("."):
+                walk(entry.path)
+            elif entry.is_file() and entry.name.lower().endswith(NOTE_EXTENSIONS):
+                add(entry)
+
+    for folder in folders:
+        walk(folder)
+    try:
+        for entry in os.scandir(essay_dir):
+            if entry.is_file() and entry.name.startswith("essay_") and entry.name.endswith(".txt"):
+                add(entry)
+    except OSError:
+        pass
+    return sources
+
+
+class NotesIndex:
+    """On-disk BM25 index over the student's notes, exported essays and tasks.
+
+    Sources are split into paragraph-sized passages, which are what a search
+    returns. A refresh indexes only new or changed sources, as a new
+    immutable segment; passages of changed or removed sources are
+    tombstoned. Each segment is a JSON term dictionary plus a postings file
+    of (passage, term frequency) pairs and a passage text file, both
+    memory-mapped, so a query reads only the postings of its own terms.
+    Small segments are merged once there are more than `max_segments`.
+    """
+
+    K1 = 1.2
+    B = 0.75
+
+    def __init__(self, directory=".edupal_index", max_segments=8):
+        self.directory = directory
+        self.max_segments = max_segments
+        self.manifest_path = os.path.join(directory, "index.json")
+        self.lock = threading.Lock()  # Guards the loaded state
+        self.refresh_lock = threading.Lock()  # One refresh at a time
+        self.loaded = False
+        self.segments = []
+        self.sources = {}  # key -> [version, [passage ids]]
+        self.docs = {}  # live passage id -> (segment, position in segment)
+        self.total_length = 0
+        self.generation = 0  # Bumped whenever the live passages change
+        self.next_id = 0
+        self.next_segment = 0
+
+    def _load(self):
+        # Called with the lock held; a missing or damaged index starts empty
+        if self.loaded:
+            return
+        self.loaded = True
+        try:
+            with open(self.manifest_path, 'r', encoding="utf-8") as f:
+                manifest = json.load(f)
+            segments = [self._open_segment(name) for name in manifest["segments"]]
+        except (OSError, ValueError, KeyError) as e:
+            if os.path.exists(self.manifest_path):
+                print(f"Rebuilding notes index: {e}")
+            return
+        self.segments = segments
+        self.sources = manifest["sources"]
+        self.next_id = manifest["next_id"]
+        self.next_segment = manifest["next_segment"]
+        deleted = set(manifest["deleted"])
+        for segment in segments:
+            self._add_docs(segment, deleted)
+
+    def _open_segment(self, name):
+        base = os.path.join(self.directory, name)
+        with open(base + ".json", 'r', encoding="utf-8") as f:
+            meta = json.load(f)
+        docs = meta["docs"]
+        segment = {"name": name, "terms": meta["terms"], "ids": [doc[0] for doc in docs],
+                   "keys": [doc[1] for doc in docs], "lengths": [doc[2] for doc in docs],
+                   "spans": [(doc[3], doc[4]) for doc in docs], "norms": None, "maps": []}
+        for kind in ("post", "text"):
+            with open(f"{base}.{kind}", 'rb') as f:
+                if os.fstat(f.fileno()).st_size:
+                    mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                    segment["maps"].append(mapped)
+                    segment[kind] = memoryview(mapped)
+                else:
+                    segment[kind] = memoryview(b"")
+        segment["post"] = segment["post"].cast("I")
+        return segment
+
+    def _close_segment(self, segment):
+        segment["post"].release()
+        segment["text"].release()
+        for mapped in segment["maps"]:
+            mapped.close()
+
+    def _add_docs(self, segment, deleted=()):
+        # Called with the lock held
+        for position, doc_id in enumerate(segment["ids"]):
+            if doc_id not in deleted:
+                self.docs[doc_id] = (segment, position)
+                self.total_length += segment["lengths"][position]
+        self.generation += 1
+
+    def _drop_docs(self, doc_ids):
+        # Called with the lock held
+        for doc_id in doc_ids:
+            doc = self.docs.pop(doc_id, None)
+            if doc is not None:
+                segment, position = doc
+                self.total_length -= segment["lengths"][position]
+        self.generation += 1
+
+    def _norms(self, segment, avg_length):
+        # BM25 length normalization per passage, infinite for tombstones so
+        # they score zero; cached until the live passages change
+        if segment["norms"] is None or segment["norms"][0] != self.generation:
+            k1, b = self.K1, self.B
+            docs = self.docs
+            norms = [k1 * (1 - b + b * length / avg_length) if doc_id in docs else math.inf
+                     for doc_id, length in zip(segment["ids"], segment["lengths"])]
+            if NUMPY_AVAILABLE:
+                norms = np.array(norms)
+            segment["norms"] = (self.generation, norms)
+        return segment["norms"][1]
+
+    def _write_atomic(self, path, data):
+        fd, tmp_path = tempfile.mkstemp(suffix=".tmp", dir=self.directory)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def _write_segment(self, passages):
+        """Write passages [(id, key, text)] as a new segment and return its name"""
+        name = f"seg{self.next_segment}"
+        self.next_segment += 1
+        postings = {}
+        docs = []
+        texts = []
+        offset = 0
+        for position, (doc_id, key, text) in enumerate(passages):
+            counts = {}
+            for term in index_terms(text):
+                counts[term] = counts.get(term, 0) + 1
+            data = text.encode("utf-8")
+            docs.append([doc_id, key, sum(counts.values()), offset, len(data)])
+            texts.append(data)
+            offset += len(data)
+            for term, tf in counts.items():
+                postings.setdefault(term, []).extend((position, tf))
+        post = array("I")
+        terms = {}
+        for term, entries in postings.items():
+            terms[term] = [len(post) // 2, len(entries) // 2]
+            post.extend(entries)
+        base = os.path.join(self.directory, name)
+        self._write_atomic(base + ".post", post.tobytes())
+        self._write_atomic(base + ".text", b"".join(texts))
+        self._write_atomic(base + ".json", json.dumps({"terms": terms, "docs": docs}).encode("utf-8"))
+        return name
+
+    def _save_manifest(self):
+        # Called with the lock held
+        live = self.docs
+        deleted = [doc_id for segment in self.segments for doc_id in segment["ids"] if doc_id not in live]
+        manifest = {"segments": [segment["name"] for segment in self.segments], "sources": self.sources,
+                    "deleted": deleted, "next_id": self.next_id, "next_segment": self.next_segment}
+        self._write_atomic(self.manifest_path, json.dumps(manifest).encode("utf-8"))
+
+    @staticmethod
+    def _passage_text(segment, position):
+        offset, size = segment["spans"][position]
+        return bytes(segment["text"][offset:offset + size]).decode("utf-8")
+
+    def refresh(self, sources, cancelled=None):
+        """Bring the index up to date with sources {key: (version, loader)}.
+
+        Runs off the Tk thread; returns the number of live passages.
+        """
+        with self.refresh_lock:
+            with self.lock:
+                self._load()
+                known = dict(self.sources)
+            changed = [key for key, (version, _) in sources.items()
+                       if key not in known or known[key][0] != version]
+            removed = [key for key in known if key not in sources]
+            if not changed and not removed:
+                return len(self.docs)
+
+            # Read and split outside the lock so searches carry on meanwhile
+            passages = []
+            new_sources = {}
+            for key in changed:
+                if cancelled is not None and cancelled():
+                    return len(self.docs)
+                version, load = sources[key]
+                try:
+                    text = load()
+                except OSError:
+                    continue
+                ids = []
+                for passage in split_passages(text):
+                    ids.append(self.next_id)
+                    passages.append((self.next_id, key, passage))
+                    self.next_id += 1
+                new_sources[key] = [version, ids]
+
+            os.makedirs(self.directory, exist_ok=True)
+            segment = self._open_segment(self._write_segment(passages)) if passages else None
+            with self.lock:
+                for key in changed + removed:
+                    if key in self.sources:
+                        self._drop_docs(self.sources.pop(key)[1])
+                self.sources.update(new_sources)
+                if segment is not None:
+                    self.segments.append(segment)
+                    self._add_docs(segment)
+            if len(self.segments) > self.max_segments:
+                self._merge()
+            with self.lock:
+                self._save_manifest()
+                return len(self.docs)
+
+    def _merge(self):
+        # Called with refresh_lock held. Small segments are folded together;
+        # the first (largest) one is rewritten only once it is mostly tombstones
+        with self.lock:
+            first = self.segments[0]
+            first_live = sum(1 for doc_id in first["ids"] if doc_id in self.docs)
+            victims = self.segments if first_live < len(first["ids"]) * 0.75 else self.segments[1:]
+            passages = [(doc_id, segment["keys"][position], self._passage_text(segment, position))
+                        for segment in victims
+                        for position, doc_id in enumerate(segment["ids"]) if doc_id in self.docs]
+        merged = self._open_segment(self._write_segment(passages))
+        with self.lock:
+            self._drop_docs([doc_id for doc_id, _, _ in passages])
+            self.segments = [segment for segment in self.segments if not any(segment is v for v in victims)]
+            self.segments.insert(0 if victims[0] is first else 1, merged)
+            self._add_docs(merged)
+            self._save_manifest()
+            for segment in victims:
+                self._close_segment(segment)
+                for kind in ("json", "post", "text"):
+                    try:
+                        os.remove(os.path.join(self.directory, f"{segment['name']}.{kind}"))
+                    except OSError:
+                        pass
+
+    def search(self, query, limit=3):
+        """Best passages for query as (score, share of query terms matched, key, text), best first"""
+        terms = set(index_terms(query))
+        with self.lock:
+            self._load()
+            if not terms or not self.docs:
+                return []
+            avg_length = self.total_length / len(self.docs) or 1
+            k1 = self.K1
+            df = {term: sum(segment["terms"][term][1] for segment in self.segments if term in segment["terms"])
+                  for term in terms}
+            best = []
+            for segment in self.segments:
+                norms = self._norms(segment, avg_length)
+                scores = np.zeros(len(norms)) if NUMPY_AVAILABLE else [0.0] * len(norms)
+                touched = set()
+                for term in terms:
+                    span = segment["terms"].get(term)
+                    if span is None:
+                        continue
+                    idf = math.log(1 + (len(self.docs) - df[term] + 0.5) / (df[term] + 0.5))
+                    start, count = span
+                    post = segment["post"][2 * start:2 * (start + count)]
+                    if NUMPY_AVAILABLE:
+                        post = np.frombuffer(post, dtype=np.uint32)
+                        positions, tfs = post[0::2], post[1::2].astype(float)
+                        # Positions are unique within one postings list
+                        scores[positions] += idf * tfs * (k1 + 1) / (tfs + norms[positions])
+                    else:
+                        positions = post[0::2]
+                        for position, tf in zip(positions, post[1::2]):
+                            scores[position] += idf * tf * (k1 + 1) / (tf + norms[position])
+                        touched.update(positions)
+                if NUMPY_AVAILABLE:
+                    top = np.argpartition(-scores, limit)[:limit] if len(scores) > limit else range(len(scores))
+                    best.extend((float(scores[position]), segment, int(position)) for position in top)
+                else:
+                    best.extend((scores[position], segment, position)
+                                for position in heapq.nlargest(limit, touched, key=scores.__getitem__))
+            results = []
+            for score, segment, position in heapq.nlargest(limit, best, key=lambda hit: hit[0]):
+                if score <= 0:
+                    break
+                text = self._passage_text(segment, position)
+                coverage = len(terms.intersection(index_terms(text))) / len(terms)
+                results.append((score, coverage, segment["keys"][position], text))
+            return results
+
+    def close(self):
+        with self.lock:
+            for segment in self.segments:
+                self._close_segment(segment)
+            self.segments = []
+            self.docs = {}
+            self.total_length = 0
+            self.loaded = False
+
+
+class TaskStore:
+    """To-do list persisted as a snapshot plus an append-only journal.
+
+    Each add, toggle or delete appends one JSON line to the journal, so a
+    click costs O(1) I/O. Once the journal grows past `compact_every` ops a
+    background thread folds it into a fresh snapshot, written atomically.
+    On load the snapshot is replayed with any journals; every op is an
+    idempotent set or delete, so replaying a journal twice after a crash is
+    harmless, and a torn last line or an uncommitted batch is ignored.
+    Batched ops carry a transaction id, so an import can stream in while
+    other edits are journaled in between.
+    """
+
+    def __init__(self, path="todo_list.json", compact_every=500):
+        self.path = path
+        self.journal_path = path + ".journal"
+        self.rotated_path = self.journal_path + ".1"
+        self.compact_every = compact_every
+        self.lock = threading.Lock()
+        self.tasks = {}
+        self.next_id = 1
+        self.next_txn = 1
+        self.pending_ops = 0
+        self.compactor = None
+        self.importing = 0
+        self.version = 0  # Bumped by every change, so views can tell they are out of date
+        self.load()
+        self.journal = open(self.journal_path, 'a', encoding="utf-8")
+
+    def load(self):
+        try:
+            if os.path.exists(self.path):
+                with open(self.path, 'r', encoding="utf-8") as f:
+                    snapshot = json.load(f)
+                for task in snapshot:
+                    # Files written before the journal existed have no ids
+                    task_id = task.get("id") or self.next_id
+                    self._apply({"op": "add", "id": task_id, "text": task["text"],
+                                 "completed": task.get("completed", False),
+                                 "created": task.get("created", 0.0)})
+        except Exception as e:
+            print(f"Error loading tasks: {e}")
+        open_batches = {}
+        for journal_path in (self.rotated_path, self.journal_path):
+            self.pending_ops += self._replay(journal_path, open_batches)
+
+    def _replay(self, journal_path, open_batches):
+        if not os.path.exists(journal_path):
+            return 0
+        applied = 0
+        good_end = 0
+        with open(journal_path, 'rb') as f:
+            for line in f:
+                try:
+                    if not line.endswith(b"\n"):
+                        raise ValueError("incomplete line")
+                    op = json.loads(line)
+                except ValueError:
+                    break  # Torn write at the tail from a crash
+                good_end = f.tell()
+                txn = op.get("txn")
+                if op["op"] == "begin":
+                    open_batches[txn] = []
+                    self.next_txn = max(self.next_txn, txn + 1)
+                elif op["op"] == "commit":
+                    for batched in open_batches.pop(txn, []):
+                        self._apply(batched)
+                        applied += 1
+                elif op["op"] == "abort":
+                    open_batches.pop(txn, None)
+                elif txn in open_batches:
+                    open_batches[txn].append(op)
+                elif txn is not None:
+                    continue  # Its begin marker is gone, so it never committed here
+                else:
+                    self._apply(op)
+                    applied += 1
+            damaged = good_end < f.seek(0, os.SEEK_END)
+        if damaged:
+            # Drop the torn tail so new ops are not appended after garbage
+            with open(journal_path, 'r+b') as f:
+                f.truncate(good_end)
+        return applied
+
+    def _apply(self, op):
+        kind = op["op"]
+        if kind == "add":
+            self.tasks[op["id"]] = {"id": op["id"], "text": op["text"],
+                                    "completed": op["completed"], "created": op["created"]}
+            self.next_id = max(self.next_id, op["id"] + 1)
+        elif kind == "set":
+            task = self.tasks.get(op["id"])
+            if task is not None:
+                task.update(op["fields"])
+        elif kind == "delete":
+            self.tasks.pop(op["id"], None)
+
+    def _append(self, ops):
+        # Called with the lock held
+        self.journal.write("".join(json.dumps(op) + "\n" for op in ops))
+        self.journal.flush()
+        self.pending_ops += len(ops)
+
+    def _write(self, ops):
+        # Called with the lock held
+        for op in ops:
+            self._apply(op)
+        self._append(ops)
+        self.version += 1
+        self._maybe_compact()
+
+    def _maybe_compact(self):
+        # Called with the lock held; never fold a journal with an import in flight
+        if self.pending_ops >= self.compact_every and self.compactor is None and not self.importing:
+            self.compactor = threading.Thread(target=self.compact, daemon=True)
+            self.compactor.start()
+
+    def _begin(self):
+        txn = self.next_txn
+        self.next_txn += 1
+        return txn
+
+    def _write_batch(self, ops):
+        # Wrap multi-op changes in begin/commit so a crash never applies half
+        if len(ops) > 1:
+            txn = self._begin()
+            ops = ([{"op": "begin", "txn": txn}] + [dict(op, txn=txn) for op in ops]
+                   + [{"op": "commit", "txn": txn}])
+        if ops:
+            self._write(ops)
+
+    def add_many(self, records, chunk_size=5000, cancelled=None):
+        """Add tasks from an iterable of {"text", "completed"} dicts as one transaction.
+
+        Records are journaled in chunks under a transaction id, releasing the
+        lock between chunks so clicks are not blocked. The tasks only appear
+        once the commit marker is written; a crash or cancellation before
+        then discards them all. Returns the new task ids.
+        """
+        with self.lock:
+            txn = self._begin()
+            self.importing += 1
+            self._append([{"op": "begin", "txn": txn}])
+        staged = []
+        chunk = []
+        try:
+            for record in records:
+                chunk.append(record)
+                if len(chunk) >= chunk_size:
+                    self._stage(txn, chunk, staged, cancelled)
+                    chunk = []
+            self._stage(txn, chunk, staged, cancelled)
+        except BaseException:
+            with self.lock:
+                self.importing -= 1
+                if not self.journal.closed:
+                    self._append([{"op": "abort", "txn": txn}])
+            raise
+        with self.lock:
+            self.importing -= 1
+            self._append([{"op": "commit", "txn": txn}])
+            for op in staged:
+                self._apply(op)
+            self.version += 1
+            self._maybe_compact()
+        return [op["id"] for op in staged]
+
+    def _stage(self, txn, chunk, staged, cancelled):
+        if cancelled is not None and cancelled():
+            raise InterruptedError("import cancelled")
+        now = time.time()
+        with self.lock:
+            ops = []
+            for record in chunk:
+                ops.append({"op": "add", "id": self.next_id, "text": record["text"],
+                            "completed": bool(record.get("completed")), "created": now, "txn": txn})
+                self.next_id += 1
+            self._append(ops)
+        staged.extend(ops)
+
+    def add(self, text, completed=False):
+        with self.lock:
+            task_id = self.next_id
+            self._write([{"op": "add", "id": task_id, "text": text,
+                          "completed": completed, "created": time.time()}])
+            return task_id
+
+    def set_completed(self, task_id, completed):
+        with self.lock:
+            task = self.tasks.get(task_id)
+            if task is not None and task["completed"] != completed:
+                self._write([{"op": "set", "id": task_id, "fields": {"completed": completed}}])
+
+    def delete(self, task_id):
+        with self.lock:
+            if task_id in self.tasks:
+                self._write([{"op": "delete", "id": task_id}])
+
+    def delete_many(self, task_ids):
+        """Delete several tasks as one all-or-nothing journal entry"""
+        with self.lock:
+            self._write_batch([{"op": "delete", "id": task_id}
+                               for task_id in task_ids if task_id in self.tasks])
+
+    def ids(self):
+        """Task ids in creation order"""
+        with self.lock:
+            return list(self.tasks)
+
+    def get(self, task_id):
+        return self.tasks.get(task_id)
+
+    def all(self):
+        """Tasks in creation order"""
+        with self.lock:
+            return [dict(task) for task in self.tasks.values()]
+
+    def snapshot(self):
+        """(version, tasks in creation order), read consistently"""
+        with self.lock:
+            return self.version, [dict(task) for task in self.tasks.values()]
+
+    def compact(self):
+        """Fold the journal into a new snapshot without blocking writers for long"""
+        with self.lock:
+            if self.importing:
+                # The begin marker of an open transaction must stay in the
+                # journal; add_many compacts again once it commits
+                self.compactor = None
+                return
+            # Rotate the journal so writers can carry on while we serialize
+            self.journal.close()
+            if os.path.exists(self.rotated_path):
+                # A previous compaction died midway; keep its ops in the new journal
+                with open(self.rotated_path, 'r', encoding="utf-8") as old, \
+                        open(self.journal_path, 'r', encoding="utf-8") as current:
+                    combined = old.read() + current.read()
+                with open(self.rotated_path, 'w', encoding="utf-8") as f:
+                    f.write(combined)
+                os.remove(self.journal_path)
+            else:
+                os.replace(self.journal_path, self.rotated_path)
+            self.journal = open(self.journal_path, 'a', encoding="utf-8")
+            snapshot = [dict(task) for task in self.tasks.values()]
+            self.pending_ops = 0
+        directory = os.path.dirname(os.path.abspath(self.path))
+        try:
+            fd, tmp_path = tempfile.mkstemp(prefix=".todo-", suffix=".tmp", dir=directory)
+            with os.fdopen(fd, 'w', encoding="utf-8") as f:
+                json.dump(snapshot, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+            os.remove(self.rotated_path)
+        except Exception as e:
+            print(f"Error compacting tasks: {e}")
+        finally:
+            with self.lock:
+                self.compactor = None
+
+    def close(self):
+        compactor = self.compactor
+        if compactor is not None:
+            compactor.join()
+        if self.pending_ops and not self.importing:
+            self.compact()
+        with self.lock:
+            self.journal.close()
+
+
+class TaskRecord:
+    """One to-do item; __slots__ keeps 100k of them compact"""
+
+    __slots__ = ("id", "text", "folded", "completed", "created", "due", "tags")
+
+    def __init__(self, task):
+        self.id = task["id"]
+        self.text = task["text"]
+        self.folded = self.text.lower()
+        self.completed = task["completed"]
+        self.created = task["created"]
+        # "#tag" words tag a task and "due:YYYY-MM-DD" sets its due date
+        self.tags = frozenset(word[1:] for word in self.folded.split() if word.startswith("#") and len(word) > 1)
+        due = re.search(r"\bdue:(\d{4}-\d{2}-\d{2})\b", self.folded) if "due:" in self.folded else None
+        self.due = due.group(1) if due else None
+
+
+class SortedIds:
+    """Read-only id sequence over a sorted index, so unfiltered views cost no copy"""
+
+    def __init__(self, entries):
+        self.entries = entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __getitem__(self, index):
+        return self.entries[index][-1]
+
+
+class UnindexedTasks:
+    """Stand-in for TaskModel while it is built on a worker thread.
+
+    Lists the store's tasks in creation order, ignoring filters and sorting,
+    so a big to-do list shows up at once. Edits go straight to the store;
+    the model being built sees them through the store version.
+    """
+
+    ready = False
+
+    def __init__(self, store):
+        self.store = store
+
+    def get(self, task_id):
+        task = self.store.get(task_id)
+        return TaskRecord(task) if task is not None else None
+
+    def in_sync(self):
+        return False
+
+    def add(self, text):
+        return self.get(self.store.add(text))
+
+    def add_loaded(self, task_ids):
+        pass
+
+    def set_completed(self, task_id, completed):
+        self.store.set_completed(task_id, completed)
+
+    def delete(self, task_id):
+        self.store.delete(task_id)
+
+    def clear_completed(self):
+        done = [task["id"] for task in self.store.all() if task["completed"]]
+        self.store.delete_many(done)
+        return len(done)
+
+    def view(self, status="all", sort="created", query=""):
+        return self.store.ids()
+
+
+class TaskModel:
+    """Indexed in-memory view of the to-do list, backed by a TaskStore.
+
+    Tasks are indexed by completion state, tag and every sort order, and each
+    change updates the indexes with a bisect instead of a rescan. Searches
+    that extend the previous query only re-check the previous matches.
+    Building the indexes sorts every task, so the app does it on a worker;
+    `version` tells whether the store changed behind the model's back since.
+    """
+
+    ready = True
+    MAX_INCREMENTAL = 1000  # Bigger imports rebuild the model off the Tk thread
+
+    SORTS = {
+        "created": lambda task: (task.id,),
+        "due": lambda task: (task.due or "9999-12-31", task.id),
+        "alpha": lambda task: (task.folded, task.id),
+    }
+
+    def __init__(self, store):
+        self.store = store
+        self.by_id = {}
+        self.open_ids = set()
+        self.done_ids = set()
+        self.by_tag = {}
+        self.version, tasks = store.snapshot()
+        for task in tasks:
+            self._index(TaskRecord(task))
+        self.sorted = {name: sorted(key(task) for task in self.by_id.values())
+                       for name, key in self.SORTS.items()}
+        self.search_cache = None
+
+    def _index(self, task):
+        self.by_id[task.id] = task
+        (self.done_ids if task.completed else self.open_ids).add(task.id)
+        for tag in task.tags:
+            self.by_tag.setdefault(tag, set()).add(task.id)
+
+    def _unindex(self, task):
+        del self.by_id[task.id]
+        self.done_ids.discard(task.id)
+        self.open_ids.discard(task.id)
+        for tag in task.tags:
+            self.by_tag[tag].discard(task.id)
+            if not self.by_tag[tag]:
+                del self.by_tag[tag]
+        if self.search_cache:
+            self.search_cache[1].discard(task.id)
+
+    def get(self, task_id):
+        return self.by_id.get(task_id)
+
+    def in_sync(self):
+        """Whether the indexes reflect every change made to the store"""
+        return self.version == self.store.version
+
+    def _synced(self):
+        # Called after each change the model made itself: that change is one
+        # store version, anything beyond it happened elsewhere
+        if self.store.version == self.version + 1:
+            self.version += 1
+
+    def counts(self):
+        return len(self.open_ids), len(self.done_ids)
+
+    def tags(self):
+        return sorted(self.by_tag)
+
+    def add(self, text):
+        task_id = self.store.add(text)
+        self._synced()
+        task = TaskRecord(self.store.get(task_id))
+        self._index(task)
+        for name, key in self.SORTS.items():
+            bisect.insort(self.sorted[name], key(task))
+        self.search_cache = None
+        return task
+
+    def add_loaded(self, task_ids):
+        """Index a batch of tasks bulk-added to the store in one commit.
+
+        Each task is bisected into the indexes, so this is meant for batches
+        up to MAX_INCREMENTAL; rebuild the model for anything bigger.
+        """
+        for task_id in task_ids:
+            task = self.store.get(task_id)
+            if task is not None and task_id not in self.by_id:
+                task = TaskRecord(task)
+                self._index(task)
+                for name, key in self.SORTS.items():
+                    bisect.insort(self.sorted[name], key(task))
+        self._synced()
+        self.search_cache = None
+
+    def set_completed(self, task_id, completed):
+        task = self.by_id[task_id]
+        if task.completed == completed:
+            return
+        self.store.set_completed(task_id, completed)
+        self._synced()
+        task.completed = completed
+        (self.done_ids if completed else self.open_ids).add(task_id)
+        (self.open_ids if completed else self.done_ids).discard(task_id)
+
+    def delete(self, task_id):
+        task = self.by_id[task_id]
+        self.store.delete(task_id)
+        self._synced()
+        self._unindex(task)
+        for name, key in self.SORTS.items():
+            entries = self.sorted[name]
+            del entries[bisect.bisect_left(entries, key(task))]
+
+    def clear_completed(self):
+        """Delete every completed task in one journal batch; returns how many"""
+        done = list(self.done_ids)
+        if not done:
+            return 0
+        self.store.delete_many(done)
+        self._synced()
+        for task_id in done:
+            self._unindex(self.by_id[task_id])
+        for name in self.SORTS:
+            self.sorted[name] = [entry for entry in self.sorted[name] if entry[-1] in self.by_id]
+        return len(done)
+
+    def search(self, query):
+        """Ids of tasks containing every word of `query` and every #tag in it"""
+        query = " ".join(query.lower().split())
+        cached = self.search_cache
+        if cached and query.startswith(cached[0]) and not cached[0].split()[-1].startswith("#"):
+            # Typing more can only narrow the previous matches
+            candidates = cached[1]
+        else:
+            candidates = None
+        words = []
+        for term in query.split():
+            if term.startswith("#") and len(term) > 1:
+                tagged = self.by_tag.get(term[1:], set())
+                candidates = tagged if candidates is None else candidates & tagged
+            else:
+                words.append(term)
+        tasks = self.by_id.values() if candidates is None else [self.by_id[task_id] for task_id in candidates]
+        for word in words:
+            tasks = [task for task in tasks if word in task.folded]
+        matches = {task.id for task in tasks}
+        self.search_cache = (query, matches)
+        return matches
+
+    def view(self, status="all", sort="created", query=""):
+        """Task ids for the list, filtered by status and search, in sort order"""
+        entries = self.sorted[sort]
+        allowed = {"open": self.open_ids, "done": self.done_ids}.get(status)
+        if query.strip():
+            matches = self.search(query)
+            allowed = matches if allowed is None else matches & allowed
+        if allowed is None:
+            return SortedIds(entries)
+        if len(allowed) * 8 < len(entries):
+            # Few matches: sort them directly instead of scanning the index
+            key = self.SORTS[sort]
+            return [task.id for task in sorted((self.by_id[task_id] for task_id in allowed), key=key)]
+        return [entry[-1] for entry in entries if entry[-1] in allowed]
+
+
+TRUE_WORDS = {"1", "true", "yes", "y", "x", "done", "completed"}
+
+
+def read_task_file(path, progress=None, every=5000):
+    """Yield task records from a CSV or JSON Lines file one at a time.
+
+    CSV needs a text (or task/title) column and may have completed, due and
+    tags columns; due and tags are folded into the text as due:DATE and
+    #tag. JSON Lines rows are objects with the same keys or plain strings.
+    progress(fraction) is called every `every` rows.
+    """
+    size = os.path.getsize(path) or 1
+    with open(path, 'r', encoding="utf-8-sig", newline="") as f:
+        if path.lower().endswith(".csv"):
+            rows = csv.DictReader(f)
+        else:
+            rows = (json.loads(line) for line in f if line.strip())
+        for count, row in enumerate(rows, 1):
+            if isinstance(row, str):
+                row = {"text": row}
+            row = {str(key).strip().lower(): value for key, value in row.items() if key is not None}
+            text = str(row.get("text") or row.get("task") or row.get("title") or "").strip()
+            if not text:
+                continue
+            if row.get("due"):
+                text += f" due:{row['due']}"
+            for tag in str(row.get("tags") or "").replace(",", " ").split():
+                text += f" #{tag.lstrip('#')}"
+            completed = row.get("completed", row.get("done", False))
+            if isinstance(completed, str):
+                completed = completed.strip().lower() in TRUE_WORDS
+            yield {"text": text, "completed": bool(completed)}
+            if progress is not None and count % every == 0:
+                progress(min(1.0, f.buffer.tell() / size))
+
+
+def write_task_file(path, store, progress=None, every=5000):
+    """Stream every task in `store` to a CSV or JSON Lines file; returns the count"""
+    task_ids = store.ids()
+    with open(path, 'w', encoding="utf-8", newline="") as f:
+        as_csv = path.lower().endswith(".csv")
+        writer = csv.writer(f)
+        if as_csv:
+            writer.writerow(["text", "completed", "created"])
+
+        def write(task):
+            if as_csv:
+                writer.writerow([task["text"], task["completed"], datetime.fromtimestamp(task["created"]).isoformat()])
+            else:
+                f.write(json.dumps({"text": task["text"], "completed": task["completed"],
+                                    "created": task["created"]}) + "\n")
+
+        written = 0
+        for index, task_id in enumerate(task_ids, 1):
+            task = store.get(task_id)
+            if task is not None:  # Deleted while we were exporting
+                write(task)
+                written += 1
+            if progress is not None and index % every == 0:
+                progress(index / len(task_ids))
+    return written
+
+
+class Job:
+    """A unit of background work tracked by the JobScheduler"""
+
+    def __init__(self, fn, owner, key, priority, on_done, on_error):
+        self.fn = fn
+        self.owner = owner
+        self.key = key
+        self.priority = priority
+        self.on_done = on_done
+        self.on_error = on_error
+        self.cancelled = False
+        self.submitted = time.monotonic()
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class JobScheduler:
+    """Bounded worker pool for everything that must not run on the Tk thread.
+
+    Jobs belong to an owner (usually a screen) and can be cancelled as a
+    group when that screen goes away. Submitting a job with the same key as
+    a pending or running one supersedes it. Callbacks run on the Tk thread
+    and are skipped for cancelled jobs, so results never reach dead widgets.
+    """
+
+    PRIORITY_CHAT = 0
+    PRIORITY_ESSAY = 5
+    PRIORITY_BULK = 10
+
+    def __init__(self, root, workers=4):
+        self.root = root
+        self.max_workers = workers
+        self.queue = queue.PriorityQueue()
+        self.lock = threading.Lock()
+        self.workers = []
+        self.active = set()
+        self.by_key = {}
+        self.seq = 0
+        self.closed = False
+        self.metrics = {"submitted": 0, "completed": 0, "failed": 0, "cancelled": 0,
+                        "superseded": 0, "max_depth": 0, "wait_total": 0.0, "run_total": 0.0}
+
+    def submit(self, fn, owner=None, key=None, priority=PRIORITY_ESSAY, on_done=None, on_error=None):
+        """Queue fn(job) and return the Job; on_done/on_error run on the Tk thread"""
+        job = Job(fn, owner, key, priority, on_done, on_error)
+        with self.lock:
+            if key is not None and key in self.by_key:
+                self.by_key[key].cancel()
+                self.metrics["superseded"] += 1
+            if key is not None:
+                self.by_key[key] = job
+            self.active.add(job)
+            self.seq += 1
+            self.queue.put((priority, self.seq, job))
+            self.metrics["submitted"] += 1
+            self.metrics["max_depth"] = max(self.metrics["max_depth"], self.queue.qsize())
+            if len(self.workers) < self.max_workers and len(self.workers) < len(self.active):
+                worker = threading.Thread(target=self._worker_loop, daemon=True)
+                self.workers.append(worker)
+                worker.start()
+        return job
+
+    def cancel_owner(self, owner):
+        """Cancel every pending or running job belonging to owner"""
+        with self.lock:
+            for job in self.active:
+                if job.owner == owner:
+                    job.cancel()
+
+    def has_owner(self, owner):
+        """Whether any pending or running job belongs to owner"""
+        with self.lock:
+            return any(job.owner == owner and not job.cancelled for job in self.active)
+
+    def cancel_key(self, key):
+        """Cancel the pending or running job submitted under key, if any"""
+        with self.lock:
+            job = self.by_key.get(key)
+            if job is not None:
+                job.cancel()
+
+    def shutdown(self, timeout=None):
+        """Cancel every job and wait up to timeout seconds for the workers to exit"""
+        with self.lock:
+            self.closed = True
+            for job in self.active:
+                job.cancel()
+            workers = list(self.workers)
+        for _ in workers:
+            self.queue.put((float("inf"), 0, None))
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for worker in workers:
+            worker.join(None if deadline is None else max(0.0, deadline - time.monotonic()))
+        return not any(worker.is_alive() for worker in workers)
+
+    def stats(self):
+        """Snapshot of queue depth, throughput and average latencies"""
+        with self.lock:
+            stats = dict(self.metrics)
+            finished = stats["completed"] + stats["failed"]
+            stats["depth"] = self.queue.qsize()
+            stats["running"] = len(self.active) - stats["depth"]
+            stats["workers"] = len(self.workers)
+        stats["avg_wait"] = stats["wait_total"] / finished if finished else 0.0
+        stats["avg_run"] = stats["run_total"] / finished if finished else 0.0
+        return stats
+
+    def _worker_loop(self):
+        while True:
+            _, _, job = self.queue.get()
+            if job is None or self.closed:
+                return
+            if job.cancelled:
+                self._finish(job, "cancelled")
+                continue
+            started = time.monotonic()
+            try:
+                result = job.fn(job)
+            except Exception as e:
+                self._finish(job, "failed", started)
+                self.post(job, job.on_error, e)
+            else:
+                self._finish(job, "cancelled" if job.cancelled else "completed", started)
+                self.post(job, job.on_done, result)
+
+    def _finish(self, job, outcome, started=None):
+        with self.lock:
+            self.active.discard(job)
+            if self.by_key.get(job.key) is job:
+                del self.by_key[job.key]
+            self.metrics[outcome] += 1
+            if started is not None and outcome != "cancelled":
+                self.metrics["wait_total"] += started - job.submitted
+                self.metrics["run_total"] += time.monotonic() - started
+
+    def post(self, job, callback, value):
+        """Run callback(value) on the Tk thread unless job is cancelled by then"""
+        if callback is None or job.cancelled or self.closed:
+            return
+
+        def deliver():
+            if not job.cancelled and not self.closed:
+                callback(value)
         try:
-            self.root.iconbitmap("edupal_icon.ico")
-        except:
-            pass
-            
-        # For theme customization
-        self.accent_color = "#2A7FFF"  # Default blue accent
-        self.is_dark_mode = False
-        
-        # Theme colors
-        self.light_theme = {
+            self.root.after(0, deliver)
+        except (RuntimeError, tk.TclError):
+            pass  # The main window is already gone
+
+
+class MathLimitError(ValueError):
+    """Raised when an expression would exceed the engine's resource limits"""
+
+
+class MathEngine:
+    """Safe arithmetic for the chat assistant.
+
+    Expressions are parsed once into a tree of Python closures (cached per
+    expression) instead of going through eval(). Every operation checks the
+    size of its operands before computing, so things like 9^9^9 are refused
+    up front rather than freezing the app, and a deadline bounds total time.
+    """
+
+    MAX_EXPRESSION_LENGTH = 200
+    MAX_LITERAL_DIGITS = 100
+    MAX_EXPONENT = 10000
+    MAX_RESULT_BITS = 4096
+    TIME_LIMIT = 0.5
+
+    MATH_CHARS = frozenset("0123456789+-*/^().")
+    OPERATORS = frozenset("+-*/^")
+
+    def __init__(self, cache_size=256):
+        self.cache_size = cache_size
+        self.compiled = OrderedDict()
+        self.lock = threading.Lock()
+
+    def is_math_question(self, message):
+        """Check if the message is a basic math question in a single pass"""
+        has_operator = False
+        math_chars = 0
+        length = 0
+        for c in message.lower():
+            if c == " ":
+                continue
+            length += 1
+            if c in self.MATH_CHARS or c.isdigit():
+                math_chars += 1
+                if c in self.OPERATORS:
+                    has_operator = True
+        # Must contain an operator and be mostly numbers and operators
+        return has_operator and math_chars > length * 0.5
+
+    @staticmethod
+    def clean(expression):
+        # Replace ^ with ** and drop everything except numbers, operators and parentheses
+        expression = expression.replace('^', '**')
+        return ''.join(c for c in expression if c.isdigit() or c in '+-*/(). ').strip()
+
+    def evaluate(self, expression):
+        """Evaluate a math expression within the engine's limits"""
+        expression = self.clean(expression)
+        if len(expression) > self.MAX_EXPRESSION_LENGTH:
+            raise MathLimitError("That expression is too long for me to calculate.")
+        evaluator = self.compile(expression)
+        deadline = time.monotonic() + self.TIME_LIMIT
+        try:
+            return evaluator(deadline)
+        except (OverflowError, RecursionError):
+            raise MathLimitError("That number is too large for me to calculate.")
+
+    def compile(self, expression):
+        with self.lock:
+            evaluator = self.compiled.get(expression)
+            if evaluator is not None:
+                self.compiled.move_to_end(expression)
+                return evaluator
+        try:
+            tree = ast.parse(expression, mode="eval")
+        except (SyntaxError, ValueError, RecursionError):
+            raise ValueError("Could not evaluate math expression")
+        evaluator = self._compile_node(tree.body)
+        with self.lock:
+            self.compiled[expression] = evaluator
+            while len(self.compiled) > self.cache_size:
+                self.compiled.popitem(last=False)
+        return evaluator
+
+    def _compile_node(self, node):
+        if isinstance(node, ast.Constant) and type(node.value) in (int, float):
+            value = node.value
+            if isinstance(value, int) and value.bit_length() > self.MAX_LITERAL_DIGITS * 4:
+                raise MathLimitError("That number is too large for me to calculate.")
+            return lambda deadline: value
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.UAdd, ast.USub)):
+            operand = self._compile_node(node.operand)
+            if isinstance(node.op, ast.USub):
+                return lambda deadline: -operand(deadline)
+            return operand
+        if isinstance(node, ast.BinOp):
+            operation = self.BINARY_OPERATIONS.get(type(node.op))
+            if operation is not None:
+                left = self._compile_node(node.left)
+                right = self._compile_node(node.right)
+                check = self._check
+
+                def binary(deadline):
+                    a = left(deadline)
+                    b = right(deadline)
+                    check(node.op, a, b, deadline)
+                    result = operation(a, b)
+                    if isinstance(result, complex):
+                        # e.g. (-8)^0.5; leave imaginary numbers to the assistant
+                        raise ValueError("No real-valued answer")
+                    return result
+                return binary
+        raise ValueError("Could not evaluate math expression")
+
+    def _check(self, op, a, b, deadline):
+        """Refuse operations whose result would be unreasonably expensive"""
+        if time.monotonic() > deadline:
+            raise MathLimitError("That calculation is taking too long.")
+        if isinstance(op, ast.Pow):
+            if abs(b) > self.MAX_EXPONENT:
+                raise MathLimitError("That exponent is too large for me to calculate.")
+            if isinstance(a, int) and isinstance(b, int) and b > 0 and a.bit_length() * b > self.MAX_RESULT_BITS:
+                raise MathLimitError("That number is too large for me to calculate.")
+        elif isinstance(op, ast.Mult) and isinstance(a, int) and isinstance(b, int):
+            if a.bit_length() + b.bit_length() > self.MAX_RESULT_BITS:
+                raise MathLimitError("That number is too large for me to calculate.")
+
+    BINARY_OPERATIONS = {
+        ast.Add: lambda a, b: a + b,
+        ast.Sub: lambda a, b: a - b,
+        ast.Mult: lambda a, b: a * b,
+        ast.Div: lambda a, b: a / b,
+        ast.FloorDiv: lambda a, b: a // b,
+        ast.Pow: lambda a, b: a ** b,
+    }
+
+    FUNCTION_NAMES = ("sin", "cos", "tan", "sqrt", "log", "exp", "abs")
+
+    def compile_function(self, expression):
+        """Compile an expression in x into f(xs), evaluated over a whole range at once.
+
+        With NumPy the expression runs vectorized on an array; otherwise it is
+        evaluated point by point. Points outside the domain become NaN.
+        """
+        expression = expression.replace('^', '**').strip()
+        if len(expression) > self.MAX_EXPRESSION_LENGTH:
+            raise MathLimitError("That expression is too long for me to calculate.")
+        try:
+            tree = ast.parse(expression, mode="eval")
+        except (SyntaxError, ValueError, RecursionError):
+            raise ValueError(f"Could not understand f(x) = {expression}")
+
+        if NUMPY_AVAILABLE:
+            functions = {"sin": np.sin, "cos": np.cos, "tan": np.tan, "sqrt": np.sqrt,
+                         "log": np.log, "exp": np.exp, "abs": np.abs}
+            f = self._compile_function_node(tree.body, functions, np.float64)
+
+            def vectorized(xs):
+                with np.errstate(all="ignore"):
+                    ys = f(xs)
+                # Constant functions produce a scalar
+                return np.broadcast_to(np.asarray(ys, dtype=float), xs.shape)
+            return vectorized
+
+        functions = {name: getattr(math, name) for name in self.FUNCTION_NAMES if name != "abs"}
+        functions["abs"] = abs
+        f = self._compile_function_node(tree.body, functions, float)
+
+        def pointwise(xs):
+            ys = []
+            for x in xs:
+                try:
+                    ys.append(float(f(x)))
+                except (ValueError, ZeroDivisionError, OverflowError, TypeError):
+                    ys.append(math.nan)
+            return ys
+        return pointwise
+
+    def _compile_function_node(self, node, functions, number):
+        if isinstance(node, ast.Constant) and type(node.value) in (int, float):
+            value = number(node.value)
+            return lambda x: value
+        if isinstance(node, ast.Name):
+            if node.id == "x":
+                return lambda x: x
+            if node.id in ("pi", "e"):
+                value = number(getattr(math, node.id))
+                return lambda x: value
+            raise ValueError(f"Unknown name '{node.id}', use x as the variable")
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.UAdd, ast.USub)):
+            operand = self._compile_function_node(node.operand, functions, number)
+            if isinstance(node.op, ast.USub):
+                return lambda x: -operand(x)
+            return operand
+        if isinstance(node, ast.BinOp) and type(node.op) in self.BINARY_OPERATIONS:
+            operation = self.BINARY_OPERATIONS[type(node.op)]
+            left = self._compile_function_node(node.left, functions, number)
+            right = self._compile_function_node(node.right, functions, number)
+            return lambda x: operation(left(x), right(x))
+        if (isinstance(node, ast.Call) and isinstance(node.func, ast.Name)
+                and node.func.id in functions and len(node.args) == 1 and not node.keywords):
+            function = functions[node.func.id]
+            argument = self._compile_function_node(node.args[0], functions, number)
+            return lambda x: function(argument(x))
+        raise ValueError("Only numbers, x, pi, e, + - * / ^ and "
+                         f"{', '.join(self.FUNCTION_NAMES)} are supported")
+
+    def tabulate(self, expression, x_min, x_max, points):
+        """Evaluate f over `points` evenly spaced values of x"""
+        if points < 2 or points > MAX_PLOT_POINTS:
+            raise MathLimitError(f"Use between 2 and {MAX_PLOT_POINTS:,} points.")
+        f = self.compile_function(expression)
+        if NUMPY_AVAILABLE:
+            xs = np.linspace(x_min, x_max, points)
+        else:
+            step = (x_max - x_min) / (points - 1)
+            xs = [x_min + i * step for i in range(points)]
+        return xs, f(xs)
+
+
+def decimate_for_plot(ys, width):
+    """Reduce ys to one (min, max) pair per pixel column.
+
+    Columns with no finite value are NaN so the plot breaks there. However
+    many points were evaluated, at most 2 * width vertices get drawn.
+    """
+    count = len(ys)
+    width = max(1, min(width, count))
+    if NUMPY_AVAILABLE:
+        values = np.where(np.isfinite(ys), ys, np.nan)
+        starts = (np.arange(width) * count) // width
+        with np.errstate(all="ignore"):
+            low = np.fmin.reduceat(values, starts)
+            high = np.fmax.reduceat(values, starts)
+        return low.tolist(), high.tolist()
+
+    low, high = [], []
+    for column in range(width):
+        chunk = [y for y in ys[column * count // width:(column + 1) * count // width] if math.isfinite(y)]
+        low.append(min(chunk) if chunk else math.nan)
+        high.append(max(chunk) if chunk else math.nan)
+    return low, high
+
+
+# Unit aliases by dimension, as factors to the dimension's base unit
+UNIT_TABLES = {
+    "length": {("m", "meter", "metre"): 1, ("km", "kilometer", "kilometre"): 1000,
+               ("cm", "centimeter", "centimetre"): 0.01, ("mm", "millimeter", "millimetre"): 0.001,
+               ("mi", "mile"): 1609.344, ("ft", "foot", "feet"): 0.3048, ("in", "inch", "inches"): 0.0254,
+               ("yd", "yard"): 0.9144},
+    "mass": {("kg", "kilogram"): 1, ("g", "gram"): 0.001, ("mg", "milligram"): 1e-6,
+             ("lb", "lbs", "pound"): 0.45359237, ("oz", "ounce"): 0.028349523125, ("tonne",): 1000},
+    "volume": {("l", "liter", "litre"): 1, ("ml", "milliliter", "millilitre"): 0.001,
+               ("gal", "gallon"): 3.785411784, ("cup",): 0.2365882365},
+    "time": {("sec", "second"): 1, ("min", "minute"): 60, ("hr", "hour"): 3600, ("day",): 86400,
+             ("week",): 604800, ("year",): 31557600},
+    "speed": {("m/s",): 1, ("km/h", "kph", "kmh"): 1 / 3.6, ("mph",): 0.44704},
+}
+UNITS = {alias: (dimension, factor) for dimension, table in UNIT_TABLES.items()
+         for aliases, factor in table.items() for alias in aliases}
+TEMPERATURE_UNITS = {"c": "C", "celsius": "C", "°c": "C", "f": "F", "fahrenheit": "F", "°f": "F",
+                     "k": "K", "kelvin": "K"}
+
+CONVERT_PATTERNS = [
+    re.compile(r"^(?:convert\s+|what\s+is\s+|what's\s+|how\s+much\s+is\s+)?(-?\d+(?:\.\d+)?)\s*(?:degrees?\s+)?"
+               r"([a-z°/]+)\s+(?:to|in|into|as)\s+(?:degrees?\s+)?([a-z°/]+)\s*\??$"),
+    re.compile(r"^how\s+many\s+([a-z°/]+)\s+(?:are\s+)?(?:in|is)\s+(-?\d+(?:\.\d+)?)\s*([a-z°/]+)\s*\??$"),
+]
+
+# Only explicit clock questions; "what is time?" is a question for the assistant
+TIME_PATTERN = re.compile(r"^(?:what\s+time\s+is\s+it|(?:what(?:'s|\s+is)\s+)?the\s+(?:current\s+)?time"
+                          r"|(?:what(?:'s|\s+is)\s+)?(?:the\s+)?current\s+time|tell\s+me\s+the\s+time)"
+                          r"(?:\s+(?:now|right\s+now))?\s*\??$")
+DATE_PATTERNS = [
+    re.compile(r"^what(?:'s|\s+is)\s+the\s+(?:day|date)(?:\s+(today|tomorrow|yesterday))?\s*\??$"),
+    re.compile(r"^what\s+(?:day|date)\s+(?:is\s+it|is|was\s+it|was)(?:\s+(today|tomorrow|yesterday))?\s*\??$"),
+    re.compile(r"^(?:what(?:'s|\s+is)\s+)?(?:the\s+|(today|tomorrow|yesterday)'?s\s+)date\s*\??$"),
+]
+
+GLOSSARY_QUESTION = re.compile(r"^(?:(?:what\s+(?:is|are)|what's|whats|define|definition\s+of|meaning\s+of)"
+                               r"\s+(?:an?\s+|the\s+)?)?(.+?)\s*\??$")
+
+# Short definitions of common school terms, answered without a model call
+GLOSSARY = {
+    "photosynthesis": "the process by which plants, algae and some bacteria use light energy to turn "
+                      "carbon dioxide and water into glucose and oxygen.",
+    "respiration": "the process by which cells break down glucose, usually with oxygen, to release energy "
+                   "as ATP, giving off carbon dioxide and water.",
+    "mitochondria": "organelles that carry out cellular respiration and produce most of a cell's ATP; "
+                    "often called the powerhouse of the cell.",
+    "osmosis": "the movement of water through a partially permeable membrane from a dilute solution "
+               "to a more concentrated one.",
+    "diffusion": "the net movement of particles from an area of higher concentration to an area of "
+                 "lower concentration.",
+    "dna": "deoxyribonucleic acid, the double-helix molecule that carries the genetic instructions "
+           "of living things.",
+    "gene": "a section of DNA that codes for a particular protein or trait.",
+    "evolution": "the change in the inherited characteristics of a population over many generations, "
+                 "driven mainly by natural selection.",
+    "ecosystem": "a community of living things together with the non-living environment they interact with.",
+    "atom": "the smallest unit of a chemical element, made of a nucleus of protons and neutrons "
+            "surrounded by electrons.",
+    "molecule": "two or more atoms held together by chemical bonds.",
+    "element": "a pure substance made of only one kind of atom, such as oxygen or iron.",
+    "compound": "a substance made of two or more different elements chemically bonded together.",
+    "catalyst": "a substance that speeds up a chemical reaction without being used up by it.",
+    "acid": "a substance that releases hydrogen ions in water and has a pH below 7.",
+    "velocity": "speed in a given direction; a vector quantity measured in metres per second.",
+    "acceleration": "the rate of change of velocity, measured in metres per second squared.",
+    "force": "a push or pull on an object, measured in newtons (N).",
+    "energy": "the capacity to do work, measured in joules (J).",
+    "gravity": "the force of attraction between masses; near Earth's surface it accelerates objects "
+               "at about 9.8 m/s².",
+    "prime number": "a whole number greater than 1 whose only factors are 1 and itself.",
+    "integer": "a whole number that can be positive, negative or zero.",
+    "fraction": "a number that represents part of a whole, written as one number over another.",
+    "hypotenuse": "the longest side of a right-angled triangle, opposite the right angle.",
+    "pythagorean theorem": "in a right-angled triangle, the square of the hypotenuse equals the sum of the "
+                           "squares of the other two sides (a² + b² = c²).",
+    "derivative": "the rate at which a function changes with respect to its variable; the slope of its graph.",
+    "integral": "the accumulated area under a function's graph; the reverse of differentiation.",
+    "noun": "a word that names a person, place, thing or idea.",
+    "verb": "a word that describes an action, state or occurrence.",
+    "adjective": "a word that describes or modifies a noun.",
+    "metaphor": "a figure of speech that describes something as if it were something else.",
+    "simile": "a comparison of two things using 'like' or 'as'.",
+    "thesis statement": "one or two sentences that state the main argument of an essay.",
+    "democracy": "a system of government in which power is held by the people, usually through elected "
+                 "representatives.",
+    "inflation": "the rate at which the general level of prices rises over time.",
+}
+
+
+def fold_word(word):
+    """Lowercase a word and fold a plural -s, as the trie keys are stored"""
+    word = word.lower()
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+
+def unit_conversion_reply(message, matches):
+    text = message.lower().strip()
+    for i, pattern in enumerate(CONVERT_PATTERNS):
+        found = pattern.match(text)
+        if found:
+            break
+    else:
+        return None
+    if i == 0:
+        amount, source, target = found.groups()
+    else:
+        target, amount, source = found.groups()
+    amount = float(amount)
+    source_temp, target_temp = TEMPERATURE_UNITS.get(source), TEMPERATURE_UNITS.get(target)
+    if source_temp and target_temp:
+        celsius = {"C": amount, "F": (amount - 32) * 5 / 9, "K": amount - 273.15}[source_temp]
+        value = {"C": celsius, "F": celsius * 9 / 5 + 32, "K": celsius + 273.15}[target_temp]
+        return f"{amount:g} °{source_temp} = {value:.6g} °{target_temp}".replace("°K", "K")
+    source_unit = UNITS.get(source) or UNITS.get(fold_word(source))
+    target_unit = UNITS.get(target) or UNITS.get(fold_word(target))
+    if not source_unit or not target_unit or source_unit[0] != target_unit[0]:
+        return None
+    value = amount * source_unit[1] / target_unit[1]
+    return f"{amount:g} {source} = {value:.6g} {target}"
+
+
+def date_time_reply(message, matches):
+    text = message.lower().strip()
+    now = datetime.now()
+    if TIME_PATTERN.match(text):
+        return f"It's {now.strftime('%H:%M')}."
+    for pattern in DATE_PATTERNS:
+        found = pattern.match(text)
+        if found:
+            day = found.group(1) or "today"
+            offset = {"today": 0, "tomorrow": 1, "yesterday": -1}[day]
+            when = datetime.fromordinal(now.toordinal() + offset)
+            verb = "was" if offset < 0 else "is"
+            return f"{day.capitalize()} {verb} {when.strftime('%A')}, {when.day} {when.strftime('%B %Y')}."
+    return None
+
+
+def glossary_reply(message, matches):
+    found = GLOSSARY_QUESTION.match(message.lower().strip())
+    if not found:
+        return None
+    # The whole question must be the term, not a longer question that mentions it
+    asked = " ".join(fold_word(word) for word in re.findall(r"[a-z0-9]+", found.group(1)))
+    for term in matches:
+        if asked == " ".join(fold_word(word) for word in term.split()):
+            return f"{term[0].upper()}{term[1:]}: {GLOSSARY[term]}"
+    return None
+
+
+# Timer commands must be the whole message: "start a 25 minute timer",
+# "set a timer for 1 hour", "pause the timer"
+TIMER_START_PATTERN = re.compile(
+    r"^(?:please\s+|(?:can|could)\s+you\s+)?(?:start|set|begin|run)\s+(?:a\s+|an\s+|the\s+|my\s+)?"
+    r"(?:(\d+)\s*-?\s*(minutes?|mins?|m|hours?|hrs?|h)\s+)?(?:study\s+|focus\s+)?(?:timer|pomodoro)"
+    r"(?:\s+for\s+(\d+)\s*(minutes?|mins?|m|hours?|hrs?|h))?(?:\s+please)?\s*[.!?]?$")
+TIMER_CONTROL_PATTERN = re.compile(
+    r"^(?:please\s+|(?:can|could)\s+you\s+)?(stop|pause|reset)\s+(?:the\s+|my\s+)?(?:study\s+)?"
+    r"(?:timer|pomodoro)(?:\s+please)?\s*[.!?]?$")
+TASK_COMMAND_PATTERNS = [
+    re.compile(r"^(?:please\s+)?(?:add|create)\s+(?:a\s+)?(?:new\s+)?(?:task|todo|to-do|to\s+do)"
+               r"(?:\s+to\s+(?:my\s+)?(?:list|to-?do\s+list|todo\s+list))?\s*[:-]?\s+(.+?)\s*$", re.IGNORECASE),
+    re.compile(r"^(?:please\s+)?add\s+(.+?)\s+to\s+(?:my\s+)?(?:to-?do|todo|task)\s+list\s*$", re.IGNORECASE),
+]
+
+
+class IntentRouter:
+    """Answers common chat requests locally, ahead of the language model.
+
+    The trigger phrases of every intent are compiled into one word trie, so
+    routing is a single pass over the message's words. Only intents whose
+    phrases occur get to parse the message, in the order they were added;
+    a handler returns the reply text, or None to let the message through.
+    """
+
+    END = None  # Trie key holding the (intent, phrase) pairs that end at a node
+
+    def __init__(self):
+        self.trie = {}
+        self.handlers = {}
+        self.counts = {}
+        self.saved = 0  # API calls avoided
+        self.add("convert", ["convert"] + [alias for alias in list(UNITS) + list(TEMPERATURE_UNITS)
+                                           if alias != "in"], unit_conversion_reply)
+        self.add("datetime", ["time", "date", "day"], date_time_reply)
+        self.add("glossary", list(GLOSSARY), glossary_reply)
+
+    def add(self, intent, phrases, handler):
+        """Route messages containing any of phrases to handler(message, matched phrases)"""
+        self.handlers[intent] = handler
+        self.counts.setdefault(intent, 0)
+        for phrase in phrases:
+            node = self.trie
+            for word in re.findall(r"[a-z0-9]+", phrase.lower()):
+                node = node.setdefault(fold_word(word), {})
+            node.setdefault(self.END, []).append((intent, phrase))
+
+    def route(self, message):
+        """Reply to message locally, or None if it needs the model"""
+        words = [fold_word(word) for word in re.findall(r"[a-z0-9]+", message.lower())]
+        matches = {}
+        for start in range(len(words)):
+            node = self.trie
+            for word in words[start:]:
+                node = node.get(word)
+                if node is None:
+                    break
+                for intent, phrase in node.get(self.END, ()):
+                    matches.setdefault(intent, []).append(phrase)
+        for intent, handler in self.handlers.items():
+            if intent in matches:
+                reply = handler(message, matches[intent])
+                if reply is not None:
+                    self.counts[intent] += 1
+                    self.saved += 1
+                    return reply
+        return None
+
+
+class VirtualList:
+    """Scrolled list that only keeps widgets for the rows on screen.
+
+    Rows have a fixed height. A small pool of row widgets (visible rows plus
+    `overscan`) is created once and refilled with different items as the
+    list scrolls, so opening 100k items costs the same as opening 10.
+    `make_row(parent)` builds one recyclable row, and `fill_row(row, item)`
+    points it at an item.
+    """
+
+    def __init__(self, parent, row_height, make_row, fill_row, overscan=2, bg=None):
+        self.row_height = row_height
+        self.make_row = make_row
+        self.fill_row = fill_row
+        self.overscan = overscan
+        self.items = []
+        self.offset = 0
+        self.rows = []
+        self.frame = tk.Frame(parent, bg=bg)
+        self.scrollbar = tk.Scrollbar(self.frame, orient="vertical", command=self.on_scrollbar)
+        self.scrollbar.pack(side="right", fill="y")
+        self.body = tk.Frame(self.frame, bg=bg)
+        self.body.pack(side="left", fill="both", expand=True)
+        self.body.bind("<Configure>", lambda event: self.refresh())
+        self.bind_wheel(self.body)
+
+    def bind_wheel(self, widget):
+        step = 3 * self.row_height
+        widget.bind("<MouseWheel>", lambda event: self.scroll_pixels(-step if event.delta > 0 else step))
+        widget.bind("<Button-4>", lambda event: self.scroll_pixels(-step))
+        widget.bind("<Button-5>", lambda event: self.scroll_pixels(step))
+
+    def set_items(self, items):
+        """Show a new sequence; only needs len() and indexing"""
+        self.items = items
+        self.refresh()
+
+    def max_offset(self):
+        return max(0, len(self.items) * self.row_height - self.body.winfo_height())
+
+    def scroll_pixels(self, delta):
+        self.offset = min(max(0, self.offset + delta), self.max_offset())
+        self.refresh()
+
+    def on_scrollbar(self, action, amount, unit=None):
+        total = max(1, len(self.items) * self.row_height)
+        if action == "moveto":
+            self.offset = min(max(0, int(float(amount) * total)), self.max_offset())
+            self.refresh()
+        elif unit == "pages":
+            self.scroll_pixels(int(amount) * max(self.row_height, self.body.winfo_height() - self.row_height))
+        else:
+            self.scroll_pixels(int(amount) * self.row_height)
+
+    def refresh(self):
+        height = self.body.winfo_height()
+        wanted = height // self.row_height + 1 + self.overscan
+        while len(self.rows) < wanted:
+            row = self.make_row(self.body)
+            self.bind_wheel(row)
+            for child in row.winfo_children():
+                self.bind_wheel(child)
+            self.rows.append(row)
+
+        self.offset = min(self.offset, self.max_offset())
+        first = self.offset // self.row_height
+        shift = self.offset % self.row_height
+        for slot, row in enumerate(self.rows):
+            index = first + slot
+            if index < len(self.items) and slot * self.row_height - shift < height:
+                self.fill_row(row, self.items[index])
+                row.place(x=0, y=slot * self.row_height - shift, relwidth=1.0, height=self.row_height)
+            else:
+                row.place_forget()
+
+        total = len(self.items) * self.row_height
+        if total <= height:
+            self.scrollbar.set(0.0, 1.0)
+        else:
+            self.scrollbar.set(self.offset / total, (self.offset + height) / total)
+
+
+def count_widgets(widget):
+    """Number of widgets in the tree under widget, including itself"""
+    return 1 + sum(count_widgets(child) for child in widget.winfo_children())
+
+
+class ScreenManager:
+    """Builds each screen once and switches screens by mapping their frames.
+
+    build(parent) runs on a screen's first visit and returns its top frame.
+    Later visits just grid that frame again and grid_remove the previous
+    one, so navigation costs the same however big a screen is, and chat
+    transcripts, half-typed essays and form inputs survive switching.
+    on_show/on_hide hooks run on every switch. Hidden screens are destroyed
+    least recently used first while the live widget count is above
+    max_widgets, skipping any screen that can_evict(name) reports as busy;
+    they are rebuilt on their next visit.
+    """
+
+    def __init__(self, container, max_widgets=3000, can_evict=None, on_evict=None):
+        self.container = container
+        self.max_widgets = max_widgets
+        self.can_evict = can_evict
+        self.on_evict = on_evict
+        self.screens = {}
+        self.frames = OrderedDict()  # name -> (frame, widget count), least recently shown first
+        self.current = None
+
+    def register(self, name, build, on_show=None, on_hide=None):
+        self.screens[name] = (build, on_show, on_hide)
+
+    def show(self, name):
+        build, on_show, _ = self.screens[name]
+        if self.current != name:
+            if self.current in self.frames:
+                self.frames[self.current][0].grid_remove()
+                on_hide = self.screens[self.current][2]
+                if on_hide is not None:
+                    on_hide()
+            if name not in self.frames:
+                frame = build(self.container)
+                self.frames[name] = (frame, count_widgets(frame))
+            self.frames.move_to_end(name)
+            self.frames[name][0].grid(row=0, column=1, sticky="nsew")
+            self.current = name
+        if on_show is not None:
+            on_show()
+        self.evict_idle()
+        return self.frames[name][0]
+
+    def evict_idle(self):
+        live = sum(count for _, count in self.frames.values())
+        for name in list(self.frames):
+            if live <= self.max_widgets:
+                break
+            if name == self.current or (self.can_evict is not None and not self.can_evict(name)):
+                continue
+            live -= self.evict(name)
+
+    def evict(self, name):
+        """Destroy a built screen; returns how many widgets it held"""
+        frame, count = self.frames.pop(name)
+        frame.destroy()
+        if self.current == name:
+            self.current = None
+        if self.on_evict is not None:
+            self.on_evict(name)
+        return count
+
+    def clear(self):
+        for name in list(self.frames):
+            self.evict(name)
+
+
+class ThemeManager:
+    """Central palette registry for light/dark mode and the accent colour.
+
+    Widgets are created through create() with palette role names in place
+    of colours (bg="bg_primary", fg="accent"), and the manager remembers
+    which option uses which role. Switching palettes then reconfigures just
+    those options plus the named ttk styles, with no recursive widget walk
+    and no screen rebuild. Lookups like theme["text_primary"] still return
+    the current colour.
+    """
+
+    DEFAULT_ACCENT = "#2A7FFF"  # Default blue accent
+
+    PALETTES = {
+        "light": {
             "bg_primary": "#F0F2F5",      # Light background
             "bg_secondary": "#FFFFFF",    # White elements
             "text_primary": "#333333",    # Dark text
@@ -36,10 +3339,11 @@ class EduPal:
             "input_bg": "#FFFFFF",        # Input background
             "input_text": "#333333",      # Input text
             "sidebar_bg": "#E8ECF0",      # Sidebar background
-            "hover_bg": "#E8E8E8"         # Hover background
-        }
-        
-        self.dark_theme = {
+            "hover_bg": "#E8E8E8",        # Hover background
+            "chat_sender": "#0066CC",     # Dark blue
+            "chat_message": "#333333",    # Dark text
+        },
+        "dark": {
             "bg_primary": "#1E1E1E",      # Dark background
             "bg_secondary": "#2D2D30",    # Slightly lighter dark
             "text_primary": "#E8E8E8",    # Light text
@@ -48,14 +3352,116 @@ class EduPal:
             "input_bg": "#3E3E42",        # Input background
             "input_text": "#FFFFFF",      # Input text
             "sidebar_bg": "#252526",      # Sidebar background
-            "hover_bg": "#3E3E42"         # Hover background
-        }
-        
-        # Current theme - defaults to light
-        self.theme = self.light_theme.copy()
+            "hover_bg": "#3E3E42",        # Hover background
+            "chat_sender": "#7ADBFC",     # Light blue
+            "chat_message": "#E8E8E8",    # Light text
+        },
+    }
+
+    def __init__(self, root, dark=False, accent=DEFAULT_ACCENT):
+        self.root = root
+        self.dark = dark
+        self.accent = accent
+        self.colors = {}
+        self.bindings = {}  # widget path -> (widget, {option: role})
+        self.tag_bindings = {}  # (widget path, tag) -> (widget, tag, {option: role})
+        self.listeners = {}
+        self.style = ttk.Style(root)
+        self.update_colors()
+
+    def __getitem__(self, role):
+        return self.colors[role]
+
+    def update_colors(self):
+        self.colors = dict(self.PALETTES["dark" if self.dark else "light"], accent=self.accent)
+        self.configure_styles()
+
+    def configure_styles(self):
+        """Named ttk styles, so ttk widgets follow the palette without touching them"""
+        colors = self.colors
+        self.style.configure("EduPal.Horizontal.TProgressbar",
+                             background=colors["accent"], troughcolor=colors["bg_secondary"])
+        self.style.configure("EduPal.TCombobox", fieldbackground=colors["input_bg"],
+                             foreground=colors["input_text"], background=colors["bg_secondary"])
+        self.style.map("EduPal.TCombobox", fieldbackground=[("readonly", colors["input_bg"])],
+                       foreground=[("readonly", colors["input_text"])])
+        self.style.configure("EduPal.TSeparator", background=colors["text_secondary"])
+
+    def create(self, widget_class, parent, **options):
+        """Create a widget; option values naming a palette role are themed"""
+        roles = {option: value for option, value in options.items()
+                 if isinstance(value, str) and value in self.colors}
+        options.update((option, self.colors[role]) for option, role in roles.items())
+        widget = widget_class(parent, **options)
+        if roles:
+            self._remember(widget, roles)
+        return widget
+
+    def bind(self, widget, **roles):
+        """Colour an existing widget from palette roles and keep it in sync"""
+        widget.configure(**{option: self.colors[role] for option, role in roles.items()})
+        self._remember(widget, roles)
+        return widget
+
+    def _remember(self, widget, roles):
+        path = str(widget)
+        if path in self.bindings:
+            self.bindings[path][1].update(roles)
+            return
+        self.bindings[path] = (widget, dict(roles))
+        if not isinstance(widget, (tk.Tk, tk.Toplevel)):
+            # A toplevel also sees the Destroy events of all its children
+            widget.bind("<Destroy>", lambda event: self.bindings.pop(path, None), add="+")
+
+    def bind_tag(self, widget, tag, **roles):
+        """Theme a Text tag or Canvas item tag from palette roles"""
+        configure = widget.itemconfigure if isinstance(widget, tk.Canvas) else widget.tag_configure
+        configure(tag, **{option: self.colors[role] for option, role in roles.items()})
+        self.tag_bindings[(str(widget), tag)] = (widget, tag, roles)
+
+    def on_change(self, name, callback):
+        """Call callback() after every palette switch; a new callback replaces the old one of that name"""
+        self.listeners[name] = callback
+
+    def set_palette(self, dark=None, accent=None):
+        if dark is not None:
+            self.dark = dark
+        if accent is not None:
+            self.accent = accent
+        self.update_colors()
+        for path, (widget, roles) in list(self.bindings.items()):
+            try:
+                widget.configure(**{option: self.colors[role] for option, role in roles.items()})
+            except tk.TclError:
+                del self.bindings[path]  # Destroyed without a Destroy event
+        for key, (widget, tag, roles) in list(self.tag_bindings.items()):
+            try:
+                configure = widget.itemconfigure if isinstance(widget, tk.Canvas) else widget.tag_configure
+                configure(tag, **{option: self.colors[role] for option, role in roles.items()})
+            except tk.TclError:
+                del self.tag_bindings[key]
+        for callback in list(self.listeners.values()):
+            callback()
+
+
+class EduPal:
+    def __init__(self):
+        self.root = tk.Tk()
+        self.root.title("EduPal - Your Educational Assistant")
+        self.root.geometry("900x700")  # Adjusted window size
+        self.root.minsize(800, 600)  # Set minimum window size
         
+        # Add app icon if available
+        try:
+            self.root.iconbitmap("edupal_icon.ico")
+        except:
+            pass
+            
+        # Palette registry for light/dark mode and the accent colour
+        self.theme = ThemeManager(self.root)
+
         # Apply theme to root
-        self.root.configure(bg=self.theme["bg_primary"])
+        self.theme.bind(self.root, bg="bg_primary")
         
         # Configure grid
         self.root.grid_columnconfigure(0, weight=1)  # Sidebar
@@ -64,104 +3470,173 @@ class EduPal:
         
         # Initialize settings
         self.settings_file = "settings.json"
-        self.settings = {}
+        self.settings = SettingsStore(self.settings_file)
         self.load_settings()
+
+        # Make sure pending settings reach the disk when the app exits
+        atexit.register(self.settings.close)
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
         
         # Load theme from settings
-        self.accent_color = self.settings.get("accent_color", self.accent_color)
-        self.is_dark_mode = self.settings.get("dark_mode", False)
-        
-        # Update current theme based on settings
-        if self.is_dark_mode:
-            self.theme = self.dark_theme.copy()
-        else:
-            self.theme = self.light_theme.copy()
-        
-        # Apply theme to root
-        self.root.configure(bg=self.theme["bg_primary"])
+        self.theme.set_palette(dark=self.settings.get("dark_mode", False),
+                               accent=self.settings.get("accent_color", ThemeManager.DEFAULT_ACCENT))
         
+        # Incremented per essay request so stale streams stop drawing
+        self.essay_stream_id = 0
+
+        # Bounded worker pool for API calls and other slow work
+        self.jobs = JobScheduler(self.root)
+        self.math_engine = MathEngine()
+        self.voice_job = None
+
+        # Study timer runs independently of the timer screen
+        self.study_timer = StudyTimer()
+        self.session_store = SessionStore("edupal.db")
+        self.chat_store = ChatStore("edupal.db")
+        self.chat_loaded = deque()  # Ids of the messages in the chat widget, oldest first
+        self.chat_has_older = self.chat_has_newer = self.chat_paging = False
+        self.task_store = TaskStore("todo_list.json")
+        self.task_model = None  # Indexed in the background on first visit to the to-do screen
+        self.timer_subject = self.settings.get("last_subject", "General")
+        self.timer_after_id = None
+        self.job_status_after_id = None
+        self.time_display = None
+
+        # Screens are built on first visit and kept alive between visits;
+        # their jobs are only cancelled once the screen itself is evicted
+        self.screens = ScreenManager(self.root, can_evict=lambda name: not self.jobs.has_owner(name),
+                                     on_evict=self.jobs.cancel_owner)
+        self.screens.register("dashboard", self.build_dashboard, on_show=self.refresh_dashboard)
+        self.screens.register("essay", self.build_essay_writer)
+        self.screens.register("study", self.build_study_buddy, on_show=self.enter_study_buddy,
+                              on_hide=self.stop_voice_input)  # Never leave the mic open off-screen
+        self.screens.register("timer", self.build_study_timer, on_show=self.update_timer_view)  # The timer may have run while away
+        self.screens.register("todo", self.build_todo_list, on_show=self.load_tasks)
+        self.screens.register("theme", self.build_theme_settings)
+        self.screens.register("calculator", self.build_calculator)
+
+        # Cache of API responses so repeated requests skip the round trip
+        self.response_cache = ResponseCache(".edupal_cache")
+
         # Try to load configuration if it exists
-        self.cohere_api_key = None
-        try:
-            config_file = "config.json"
-            if os.path.exists(config_file):
-                with open(config_file, 'r') as f:
-                    config = json.load(f)
-                    self.cohere_api_key = config.get("cohere_api_key")
-        except Exception as e:
-            print(f"Warning: Could not load configuration: {e}")
+        self.config = load_config()
+        self.cohere_api_key = self.config.get("cohere_api_key")
+
+        # One shared language model client, created on first use
+        self.llm = create_llm_gateway(self.config)
+
+        # Local search over the student's notes, essays and tasks
+        self.notes_index = NotesIndex(".edupal_index")
+
+        # Commands and common questions answered locally, ahead of any API call
+        self.router = IntentRouter()
+        self.router.add("timer", ["timer", "pomodoro"], self.timer_command_reply)
+        self.router.add("todo", ["task", "todo", "to do"], self.task_command_reply)
+
+        # Answers shared between near-identical questions
+        self.question_cache = QuestionCache("edupal.db",
+                                            threshold=self.config.get("chat_similarity_threshold", 0.7))
+
+        # Multi-turn chat memory, picking up where the saved transcript left off
+        self.conversation = ConversationContext(self.config.get("chat_context_tokens", CHAT_CONTEXT_TOKENS))
+        for _, _, sender, message in self.chat_store.page(limit=CHAT_PAGE_SIZE):
+            if sender in ("You", "AI Assistant"):
+                self.conversation.add("User" if sender == "You" else sender, message)
         
         # Show login screen first
         self.show_login()
         
     def load_settings(self):
         # Default settings
-        self.settings = {
-            "accent_color": self.accent_color,
-            "theme_color": self.accent_color,
+        self.settings.data.update({
+            "accent_color": self.theme.accent,
+            "theme_color": self.theme.accent,
             "dark_mode": False,
-        }
-        
-        # Try to load from file
-        try:
-            if os.path.exists(self.settings_file):
-                with open(self.settings_file, 'r') as f:
-                    self.settings = json.load(f)
-        except Exception as e:
-            print(f"Error loading settings: {e}")
-            
-        # Apply loaded settings
-        if "accent_color" in self.settings:
-            self.accent_color = self.settings["accent_color"]
-            
-        if "dark_mode" in self.settings:
-            self.is_dark_mode = self.settings["dark_mode"]
-            if self.is_dark_mode:
-                self.theme = self.dark_theme.copy()
-            else:
-                self.theme = self.light_theme.copy()
-        
-        # Save settings
-        self.save_settings()
-        
+        })
+
+        # Load from file; only written back if defaults were missing
+        self.settings.load()
+
     def save_settings(self):
-        with open(self.settings_file, 'w') as f:
-            json.dump(self.settings, f)
+        # Coalesced and written off the UI thread by the settings store
+        self.settings.save()
+
+    def on_close(self):
+        # Stop everything that could still write to a store or call back into Tk
+        for after_id in (self.job_status_after_id, self.timer_after_id):
+            if after_id is not None:
+                self.root.after_cancel(after_id)
+        self.job_status_after_id = self.timer_after_id = None
+        if not self.jobs.shutdown(timeout=JOB_SHUTDOWN_TIMEOUT):
+            print("Background jobs still running at exit; closing stores anyway")
+        self.session_store.close()
+        self.chat_store.close()
+        self.question_cache.close()
+        self.notes_index.close()
+        self.task_store.close()
+        self.settings.close()
+        self.root.destroy()
+
+    def show_screen(self, name):
+        """Show a retained screen, building it on first use"""
+        self.screens.show(name)
+
+    def show_dashboard(self):
+        self.show_screen("dashboard")
+
+    def show_essay_writer(self):
+        self.show_screen("essay")
+
+    def show_study_buddy(self):
+        self.show_screen("study")
+
+    def show_study_timer(self):
+        self.show_screen("timer")
+
+    def show_todo_list(self):
+        self.show_screen("todo")
+
+    def show_theme_settings(self):
+        self.show_screen("theme")
+
+    def show_calculator(self):
+        self.show_screen("calculator")
 
     def show_login(self):
         # Clear previous widgets
+        self.screens.clear()
         for widget in self.root.winfo_children():
             widget.destroy()
 
         # Create login frame with gradient effect
-        login_frame = tk.Frame(self.root, bg=self.theme["bg_primary"], padx=40, pady=40)
+        login_frame = self.theme.create(tk.Frame, self.root, bg="bg_primary", padx=40, pady=40)
         login_frame.place(relx=0.5, rely=0.5, anchor="center")
 
         # Title
-        title = tk.Label(login_frame, text="Welcome to EduPal ", 
-                        font=("Arial", 24, "bold"), bg=self.theme["bg_primary"], fg=self.accent_color)
+        title = self.theme.create(tk.Label, login_frame, text="Welcome to EduPal ", 
+                        font=("Arial", 24, "bold"), bg="bg_primary", fg="accent")
         title.pack(pady=20)
 
         # Username
-        username_label = tk.Label(login_frame, text="Username:", 
-                                font=("Arial", 12), bg=self.theme["bg_primary"], fg=self.theme["text_primary"])
+        username_label = self.theme.create(tk.Label, login_frame, text="Username:", 
+                                font=("Arial", 12), bg="bg_primary", fg="text_primary")
         username_label.pack()
-        self.username_entry = tk.Entry(login_frame, font=("Arial", 12), 
-                                     bg=self.theme["input_bg"], fg=self.theme["input_text"])
+        self.username_entry = self.theme.create(tk.Entry, login_frame, font=("Arial", 12), 
+                                     bg="input_bg", fg="input_text")
         self.username_entry.pack(pady=5)
 
         # Password
-        password_label = tk.Label(login_frame, text="Password:", 
-                                font=("Arial", 12), bg=self.theme["bg_primary"], fg=self.theme["text_primary"])
+        password_label = self.theme.create(tk.Label, login_frame, text="Password:", 
+                                font=("Arial", 12), bg="bg_primary", fg="text_primary")
         password_label.pack()
-        self.password_entry = tk.Entry(login_frame, show="•", font=("Arial", 12),
-                                     bg=self.theme["input_bg"], fg=self.theme["input_text"])
+        self.password_entry = self.theme.create(tk.Entry, login_frame, show="•", font=("Arial", 12),
+                                     bg="input_bg", fg="input_text")
         self.password_entry.pack(pady=5)
 
         # Login button
-        login_button = tk.Button(login_frame, text="Login", 
+        login_button = self.theme.create(tk.Button, login_frame, text="Login", 
                                command=self.verify_login,
-                               bg=self.accent_color, fg=self.theme["text_inverse"],
+                               bg="accent", fg="text_inverse",
                                font=("Arial", 12, "bold"),
                                padx=30, pady=5)
         login_button.pack(pady=20)
@@ -170,8 +3645,8 @@ class EduPal:
         self.root.bind('<Return>', lambda event: self.verify_login())
         
         # Status text at the bottom
-        status_text = tk.Label(login_frame, text="Default Login: username 'student', password 'learn123'",
-                            font=("Arial", 9), bg=self.theme["bg_primary"], fg=self.theme["text_secondary"])
+        status_text = self.theme.create(tk.Label, login_frame, text="Default Login: username 'student', password 'learn123'",
+                            font=("Arial", 9), bg="bg_primary", fg="text_secondary")
         status_text.pack(pady=(20, 0))
 
         # Auto focus on username
@@ -183,37 +3658,27 @@ class EduPal:
 
         if username == "student" and password == "learn123":
             self.root.unbind('<Return>')
+            self.build_sidebar()
             self.show_dashboard()
         else:
             messagebox.showerror("Error", "Invalid credentials! \nPlease try again.")
             self.password_entry.delete(0, tk.END)
             self.password_entry.focus()
 
-    def show_dashboard(self):
-        # Clear widgets from main area
-        for widget in self.root.grid_slaves(row=0, column=1):
-            if widget:
-                widget.destroy()
-        
-        # Configure root background
-        self.root.configure(bg=self.theme["bg_primary"])
-        
+    def build_sidebar(self):
         # Add navigation sidebar
-        sidebar = tk.Frame(self.root, bg=self.theme["sidebar_bg"], width=200)
+        sidebar = self.theme.create(tk.Frame, self.root, bg="sidebar_bg", width=200)
         sidebar.grid(row=0, column=0, sticky="nsew", padx=10, pady=10)
         
         # App logo/name
-        app_label = tk.Label(sidebar, text="EduPal", 
+        app_label = self.theme.create(tk.Label, sidebar, text="EduPal", 
                            font=("Arial", 18, "bold"), 
-                           bg=self.theme["sidebar_bg"], fg=self.accent_color)
+                           bg="sidebar_bg", fg="accent")
         app_label.pack(pady=(20, 30))
-        
-        # Main content area
-        main_content = tk.Frame(self.root, bg=self.theme["bg_primary"], padx=20, pady=20)
-        main_content.grid(row=0, column=1, sticky="nsew")
 
         # Add features buttons
         features = [
+            ("Dashboard", self.show_dashboard),
             ("AI Essay Writer ", self.show_essay_writer),
             ("AI Assistant ", self.show_study_buddy),
             ("Study Timer ", self.show_study_timer),
@@ -224,19 +3689,42 @@ class EduPal:
         ]
 
         for i, (text, command) in enumerate(features):
-            btn = tk.Button(sidebar, text=text, command=command,
-                          font=("Arial", 12), bg=self.theme["sidebar_bg"], fg=self.accent_color,
+            btn = self.theme.create(tk.Button, sidebar, text=text, command=command,
+                          font=("Arial", 12), bg="sidebar_bg", fg="accent",
                           padx=20, pady=10, width=20)
             btn.pack(pady=10)
 
+        # Background work at a glance: queue depth and average latencies
+        self.job_status_label = self.theme.create(tk.Label, sidebar, text="", font=("Arial", 9),
+                                                  justify="left", bg="sidebar_bg", fg="text_secondary")
+        self.job_status_label.pack(side="bottom", pady=10)
+        self.update_job_status()
+
+    def update_job_status(self):
+        """Refresh the sidebar's job line once a second while the sidebar exists"""
+        if self.job_status_after_id:
+            self.root.after_cancel(self.job_status_after_id)
+            self.job_status_after_id = None
+        if not self.job_status_label.winfo_exists():
+            return
+        stats = self.jobs.stats()
+        self.job_status_label.config(text=f"Jobs: {stats['running']} running, {stats['depth']} queued\n"
+                                          f"Avg wait {stats['avg_wait'] * 1000:.0f} ms, "
+                                          f"run {stats['avg_run'] * 1000:.0f} ms")
+        self.job_status_after_id = self.root.after(1000, self.update_job_status)
+
+    def build_dashboard(self, parent):
+        # Main content area
+        main_content = self.theme.create(tk.Frame, parent, bg="bg_primary", padx=20, pady=20)
+
         # Quick ideas section
-        ideas_frame = tk.LabelFrame(main_content, text="Quick Ideas ", 
-                                  font=("Arial", 12, "bold"), bg=self.theme["bg_primary"], 
-                                  fg=self.theme["text_primary"])
+        ideas_frame = self.theme.create(tk.LabelFrame, main_content, text="Quick Ideas ", 
+                                  font=("Arial", 12, "bold"), bg="bg_primary", 
+                                  fg="text_primary")
         ideas_frame.pack(fill="x", pady=20)
 
-        self.ideas_text = tk.Text(ideas_frame, height=4, font=("Arial", 12),
-                                wrap=tk.WORD, bg=self.theme["input_bg"])
+        self.ideas_text = self.theme.create(tk.Text, ideas_frame, height=4, font=("Arial", 12),
+                                wrap=tk.WORD, bg="input_bg")
         self.ideas_text.pack(fill="x", padx=10, pady=10)
         
         # Insert some starter ideas
@@ -250,44 +3738,59 @@ class EduPal:
         self.ideas_text.insert("1.0", random_idea)
         
         # Progress bar
-        progress_frame = tk.LabelFrame(main_content, text="Daily Progress ",
-                                     font=("Arial", 12, "bold"), bg=self.theme["bg_primary"],
-                                     fg=self.theme["text_primary"])
+        progress_frame = self.theme.create(tk.LabelFrame, main_content, text="Daily Progress ",
+                                     font=("Arial", 12, "bold"), bg="bg_primary",
+                                     fg="text_primary")
         progress_frame.pack(fill="x", pady=20)
         
-        self.progress_bar = ttk.Progressbar(progress_frame, length=400, 
-                                         mode='determinate', value=50)
-        self.progress_bar.pack(padx=10, pady=10)
+        self.progress_bar = ttk.Progressbar(progress_frame, length=400, style="EduPal.Horizontal.TProgressbar",
+                                         mode='determinate')
+        self.progress_bar.pack(padx=10, pady=(10, 0))
+
+        self.progress_label = self.theme.create(tk.Label, progress_frame,
+                                font=("Arial", 10), bg="bg_primary", fg="text_secondary")
+        self.progress_label.pack(pady=(0, 10))
         
         # Date and greeting
-        current_time = datetime.now()
-        greeting = "Good morning" if 5 <= current_time.hour < 12 else "Good afternoon" if 12 <= current_time.hour < 18 else "Good evening"
-        date_str = current_time.strftime("%A, %B %d, %Y")
-        
-        greeting_label = tk.Label(main_content, text=f"{greeting}! Today is {date_str}",
-                                font=("Arial", 14), bg=self.theme["bg_primary"], fg=self.accent_color)
-        greeting_label.pack(pady=10)
+        self.greeting_label = self.theme.create(tk.Label, main_content,
+                                font=("Arial", 14), bg="bg_primary", fg="accent")
+        self.greeting_label.pack(pady=10)
 
         # Help button
-        help_btn = tk.Button(main_content, text="Help ",
+        help_btn = self.theme.create(tk.Button, main_content, text="Help ",
                            command=self.show_help,
                            font=("Arial", 10),
-                           bg=self.accent_color, fg=self.theme["text_inverse"])
+                           bg="accent", fg="text_inverse")
         help_btn.pack(side="bottom", anchor="se", pady=10)
 
+        return main_content
+
+    def refresh_dashboard(self):
+        """Bring progress and greeting up to date each time the dashboard is shown"""
+        # Read from the precomputed daily total of the session store
+        goal_minutes = self.settings.get("daily_goal_minutes", 120)
+        studied_minutes = self.session_store.total("day") / 60
+        self.progress_bar.config(value=min(100, studied_minutes / goal_minutes * 100))
+        self.progress_label.config(text=f"{studied_minutes:.0f} of {goal_minutes} minutes studied today")
+
+        current_time = datetime.now()
+        greeting = "Good morning" if 5 <= current_time.hour < 12 else "Good afternoon" if 12 <= current_time.hour < 18 else "Good evening"
+        date_str = current_time.strftime("%A, %B %d, %Y")
+        self.greeting_label.config(text=f"{greeting}! Today is {date_str}")
+
     def show_random_advice_window(self):
         """Open a new window to display random advice."""
         advice_window = tk.Toplevel(self.root)
         advice_window.title("Random Advice")
         advice_window.geometry("400x300")
-        advice_window.configure(bg=self.theme["bg_primary"])
+        self.theme.bind(advice_window, bg="bg_primary")
 
-        advice_label = tk.Label(advice_window, text="Random Advice", 
-                                font=("Arial", 16, "bold"), bg=self.theme["bg_primary"], fg=self.accent_color)
+        advice_label = self.theme.create(tk.Label, advice_window, text="Random Advice", 
+                                font=("Arial", 16, "bold"), bg="bg_primary", fg="accent")
         advice_label.pack(pady=10)
 
-        advice_text = tk.Text(advice_window, wrap=tk.WORD, font=("Arial", 12),
-                              bg=self.theme["input_bg"], fg=self.theme["input_text"], height=10)
+        advice_text = self.theme.create(tk.Text, advice_window, wrap=tk.WORD, font=("Arial", 12),
+                              bg="input_bg", fg="input_text", height=10)
         advice_text.pack(fill="both", expand=True, padx=10, pady=10)
 
         # Generate random advice
@@ -307,19 +3810,13 @@ class EduPal:
         advice_text.insert("1.0", random_tip)
         advice_text.config(state="disabled")
 
-        close_button = tk.Button(advice_window, text="Close", command=advice_window.destroy,
-                                 bg=self.accent_color, fg=self.theme["text_inverse"], font=("Arial", 12))
+        close_button = self.theme.create(tk.Button, advice_window, text="Close", command=advice_window.destroy,
+                                 bg="accent", fg="text_inverse", font=("Arial", 12))
         close_button.pack(pady=10)
 
-    def show_essay_writer(self):
-        # Clear main content area
-        for widget in self.root.winfo_children():
-            if widget.grid_info().get('column') == 1:
-                widget.destroy()
-
+    def build_essay_writer(self, parent):
         # Create a frame for the essay writer
-        essay_frame = tk.Frame(self.root, bg=self.theme["bg_primary"], padx=20, pady=20)
-        essay_frame.grid(row=0, column=1, sticky="nsew")
+        essay_frame = self.theme.create(tk.Frame, parent, bg="bg_primary", padx=20, pady=20)
         
         # Configure the grid to expand with window resizing
         self.root.grid_rowconfigure(0, weight=1)
@@ -330,108 +3827,136 @@ class EduPal:
         essay_frame.grid_columnconfigure(0, weight=1)
 
         # Title
-        title = tk.Label(essay_frame, text="AI Essay Writer ", 
-                         font=("Arial", 16, "bold"), bg=self.theme["bg_primary"], fg=self.accent_color)
+        title = self.theme.create(tk.Label, essay_frame, text="AI Essay Writer ", 
+                         font=("Arial", 16, "bold"), bg="bg_primary", fg="accent")
         title.pack(pady=10)
 
         # Topic input
-        topic_label = tk.Label(essay_frame, text="Essay Topic:", 
-                              font=("Arial", 12), bg=self.theme["bg_primary"], fg=self.theme["text_primary"])
+        topic_label = self.theme.create(tk.Label, essay_frame, text="Essay Topic:", 
+                              font=("Arial", 12), bg="bg_primary", fg="text_primary")
         topic_label.pack(anchor="w", pady=(10, 0))
-        self.topic_entry = tk.Entry(essay_frame, font=("Arial", 12), 
-                                     bg=self.theme["input_bg"], fg=self.theme["input_text"])
+        self.topic_entry = self.theme.create(tk.Entry, essay_frame, font=("Arial", 12), 
+                                     bg="input_bg", fg="input_text")
         self.topic_entry.pack(pady=(0, 10), fill="x")
 
         # Word count slider
-        word_count_frame = tk.Frame(essay_frame, bg=self.theme["bg_primary"])
+        word_count_frame = self.theme.create(tk.Frame, essay_frame, bg="bg_primary")
         word_count_frame.pack(fill="x", pady=10)
         
-        word_count_label = tk.Label(word_count_frame, text="Word Count: ", 
-                                  font=("Arial", 12), bg=self.theme["bg_primary"], fg=self.theme["text_primary"])
+        word_count_label = self.theme.create(tk.Label, word_count_frame, text="Word Count: ", 
+                                  font=("Arial", 12), bg="bg_primary", fg="text_primary")
         word_count_label.pack(side="left")
         
         self.word_count_var = tk.IntVar(value=self.settings.get("last_word_count", 250))
         
         def update_word_count_label(val):
             word_count_value_label.config(text=f"{int(val)} words")
+            # Only marks the store dirty; the write happens once dragging stops
             self.settings["last_word_count"] = int(val)
-            self.save_settings()
             
-        word_count_slider = tk.Scale(word_count_frame, from_=100, to=500, 
+        word_count_slider = self.theme.create(tk.Scale, word_count_frame, from_=100, to=500, 
                                     orient="horizontal", length=300, 
                                     variable=self.word_count_var,
                                     command=update_word_count_label,
-                                    bg=self.theme["bg_primary"], highlightthickness=0)
+                                    bg="bg_primary", highlightthickness=0)
         word_count_slider.pack(side="left", padx=10)
         
-        word_count_value_label = tk.Label(word_count_frame, 
+        word_count_value_label = self.theme.create(tk.Label, word_count_frame, 
                                         text=f"{self.word_count_var.get()} words", 
-                                        font=("Arial", 12), bg=self.theme["bg_primary"], fg=self.theme["text_primary"])
+                                        font=("Arial", 12), bg="bg_primary", fg="text_primary")
         word_count_value_label.pack(side="left")
 
         # Add headers/bullet points options
-        format_frame = tk.Frame(essay_frame, bg=self.theme["bg_primary"])
+        format_frame = self.theme.create(tk.Frame, essay_frame, bg="bg_primary")
         format_frame.pack(fill="x", pady=10)
         
-        format_label = tk.Label(format_frame, text="Format Options:", 
-                               font=("Arial", 12), bg=self.theme["bg_primary"], fg=self.theme["text_primary"])
+        format_label = self.theme.create(tk.Label, format_frame, text="Format Options:", 
+                               font=("Arial", 12), bg="bg_primary", fg="text_primary")
         format_label.pack(anchor="w")
         
         self.headers_var = tk.BooleanVar(value=True)
-        headers_check = tk.Checkbutton(format_frame, text="Add Headers", 
+        headers_check = self.theme.create(tk.Checkbutton, format_frame, text="Add Headers", 
                                          variable=self.headers_var, 
-                                         font=("Arial", 11), bg=self.theme["bg_primary"], fg=self.theme["text_primary"],
-                                         selectcolor=self.theme["bg_secondary"], state=tk.NORMAL)
+                                         font=("Arial", 11), bg="bg_primary", fg="text_primary",
+                                         selectcolor="bg_secondary", state=tk.NORMAL)
         headers_check.pack(anchor="w")
         
         self.bullets_var = tk.BooleanVar(value=True)
-        bullets_check = tk.Checkbutton(format_frame, text="Add Bullet Points", 
+        bullets_check = self.theme.create(tk.Checkbutton, format_frame, text="Add Bullet Points", 
                                          variable=self.bullets_var, 
-                                         font=("Arial", 11), bg=self.theme["bg_primary"], fg=self.theme["text_primary"],
-                                         selectcolor=self.theme["bg_secondary"], state=tk.NORMAL)
+                                         font=("Arial", 11), bg="bg_primary", fg="text_primary",
+                                         selectcolor="bg_secondary", state=tk.NORMAL)
         bullets_check.pack(anchor="w")
 
+        self.stream_var = tk.BooleanVar(value=self.settings.get("stream_essays", True))
+        stream_check = self.theme.create(tk.Checkbutton, format_frame, text="Stream Output",
+                                         variable=self.stream_var,
+                                         font=("Arial", 11), bg="bg_primary", fg="text_primary",
+                                         selectcolor="bg_secondary", state=tk.NORMAL)
+        stream_check.pack(anchor="w")
+
+        self.sections_var = tk.BooleanVar(value=self.settings.get("parallel_sections", False))
+        sections_check = self.theme.create(tk.Checkbutton, format_frame, text="Write Sections in Parallel (with headers)",
+                                         variable=self.sections_var,
+                                         font=("Arial", 11), bg="bg_primary", fg="text_primary",
+                                         selectcolor="bg_secondary", state=tk.NORMAL)
+        sections_check.pack(anchor="w")
+
         # Generate button
-        generate_button = tk.Button(essay_frame, text="Generate Essay", 
+        generate_button = self.theme.create(tk.Button, essay_frame, text="Generate Essay", 
                                   command=self.generate_essay,
-                                  bg=self.accent_color, fg=self.theme["text_inverse"],
+                                  bg="accent", fg="text_inverse",
                                   font=("Arial", 12, "bold"),
                                   padx=20, pady=5)
         generate_button.pack(pady=20)
 
+        # Regenerate skips the response cache
+        regenerate_button = self.theme.create(tk.Button, essay_frame, text="Regenerate",
+                                  command=lambda: self.generate_essay(regenerate=True),
+                                  bg="bg_secondary", fg="accent",
+                                  font=("Arial", 11),
+                                  padx=10, pady=2)
+        regenerate_button.pack(pady=(0, 10))
+
         # Result text area
-        result_label = tk.Label(essay_frame, text="Generated Essay:", 
-                              font=("Arial", 12, "bold"), bg=self.theme["bg_primary"], fg=self.theme["text_primary"])
+        result_label = self.theme.create(tk.Label, essay_frame, text="Generated Essay:", 
+                              font=("Arial", 12, "bold"), bg="bg_primary", fg="text_primary")
         result_label.pack(anchor="w", pady=(10, 0))
         
         # Create a container frame that will expand with the window
-        result_container = tk.Frame(essay_frame, bg=self.theme["bg_primary"])
+        result_container = self.theme.create(tk.Frame, essay_frame, bg="bg_primary")
         result_container.pack(fill="both", expand=True, pady=10)
         
         # Set minimum height for the result frame
-        result_frame = tk.Frame(result_container, bg=self.theme["input_bg"], bd=1, relief="solid", height=300)
+        result_frame = self.theme.create(tk.Frame, result_container, bg="input_bg", bd=1, relief="solid", height=300)
         result_frame.pack(fill="both", expand=True)
         result_frame.pack_propagate(False)  # Prevent the frame from shrinking below its set height
         
         # Text widget with scrollbar
-        self.essay_result = tk.Text(result_frame, font=("Arial", 12), 
+        self.essay_result = self.theme.create(tk.Text, result_frame, font=("Arial", 12), 
                                   wrap=tk.WORD, padx=10, pady=10,
-                                  bg=self.theme["input_bg"], fg=self.theme["input_text"])
+                                  bg="input_bg", fg="input_text")
         self.essay_result.pack(side="left", fill="both", expand=True)
+
+        # Configure text tags for formatting
+        self.essay_result.tag_configure("header", font=("Arial", 14, "bold"))
+        self.essay_result.tag_configure("bullet", lmargin1=20, lmargin2=40)
         
         essay_scrollbar = tk.Scrollbar(result_frame, command=self.essay_result.yview)
         essay_scrollbar.pack(side="right", fill="y")
         self.essay_result.config(yscrollcommand=essay_scrollbar.set)
 
         # Export button
-        export_button = tk.Button(essay_frame, text="Export as TXT ", 
+        export_button = self.theme.create(tk.Button, essay_frame, text="Export as TXT ", 
                                 command=self.export_essay,
-                                bg=self.accent_color, fg=self.theme["text_inverse"],
+                                bg="accent", fg="text_inverse",
                                 font=("Arial", 12),
                                 padx=20, pady=5)
         export_button.pack(pady=10)
 
-    def generate_essay(self):
+        return essay_frame
+
+    def generate_essay(self, regenerate=False):
         topic = self.topic_entry.get().strip()
         if not topic:
             messagebox.showerror("Error", "Please enter a topic! ")
@@ -440,109 +3965,161 @@ class EduPal:
         word_count = self.word_count_var.get()
         add_headers = self.headers_var.get()
         add_bullets = self.bullets_var.get()
+        stream = self.stream_var.get()
+        sectioned = self.sections_var.get() and add_headers and self.llm.available
         
         # Update status
         self.essay_result.delete("1.0", tk.END)
         self.essay_result.insert("1.0", "Generating your essay... Please wait...")
         self.root.update()
         
-        # Save the word count preference
+        # Save the word count and streaming preferences
         self.settings["last_word_count"] = word_count
+        self.settings["stream_essays"] = stream
+        self.settings["parallel_sections"] = self.sections_var.get()
         self.save_settings()
-        
-        # Generate essay in a separate thread to avoid freezing UI
-        def generate_essay_thread():
+
+        prompt = build_essay_prompt(topic, word_count, add_headers, add_bullets)
+
+        # Only real API responses are cached; the offline sample is free
+        cache_key = None
+        if self.llm.available:
+            cache_key = essay_cache_key(self.llm, topic, word_count, add_headers, add_bullets, sectioned)
+            if not regenerate:
+                cached = self.response_cache.get(cache_key)
+                if cached is not None:
+                    self.essay_stream_id += 1  # Stop any stream still drawing
+                    self.jobs.cancel_key("essay")
+                    self.update_essay_result(cached)
+                    return
+
+        def postprocess(essay_text):
+            return postprocess_essay(essay_text, topic, add_headers, add_bullets)
+
+        # Generate essay on the job scheduler to avoid freezing UI
+        def generate_essay_thread(job):
+            if not self.llm.available:
+                # Simulate essay generation if no API key
+                time.sleep(2)  # Simulate API call delay
+            # The cache was already checked above, so only store the result
+            essay_text = generate_essay_text(self.llm, topic, word_count, add_headers, add_bullets,
+                                             cache=self.response_cache, regenerate=True)
+            # Classify lines here so the Tk thread only inserts and tags
+            return essay_text, parse_essay_spans(essay_text)
+
+        # Streaming variant: chunks are queued and drawn by pump_essay_stream
+        self.essay_stream_id += 1
+        stream_id = self.essay_stream_id
+        stream_queue = queue.Queue()
+
+        def stream_essay_thread(job):
             try:
-                if not self.cohere_api_key:
-                    # Simulate essay generation if no API key
-                    time.sleep(2)  # Simulate API call delay
-                    essay_text = self.generate_sample_essay(topic, word_count, add_headers, add_bullets)
+                if not self.llm.available:
+                    sample = self.generate_sample_essay(topic, word_count, add_headers, add_bullets)
+                    chunks = simulate_stream(sample)
                 else:
-                    # Import cohere here to avoid import errors if not available
-                    import cohere
-                    
-                    # Configure the prompt based on format options
-                    prompt = f"Write an essay about {topic} that is approximately {word_count} words long."
-                    if add_headers:
-                        prompt += " Structure it with a clear title at the top, and include section headers like 'Introduction', 'Main Points', and 'Conclusion'."
-                    if add_bullets:
-                        prompt += " Use bullet points (with • symbols) to list key information and arguments."
-                        
-                    # Call the Cohere API
-                    client = cohere.Client(self.cohere_api_key)
-                    response = client.generate(
-                        prompt=prompt,
-                        max_tokens=word_count * 2,
-                        temperature=0.7,
-                        return_likelihoods="NONE"
-                    )
-                    essay_text = response.generations[0].text
-                
-                # Post-process the essay text to enhance formatting
-                if add_headers and "TITLE:" not in essay_text and "Title:" not in essay_text:
-                    title = topic.upper()
-                    essay_text = f"TITLE: {title}\n\n{essay_text}"
-                    
-                if add_bullets and "-" not in essay_text and "•" not in essay_text:
-                    # Add some bullet points if the API didn't include any
-                    lines = essay_text.split('\n')
-                    for i in range(len(lines)):
-                        if "key point" in lines[i].lower() or "important" in lines[i].lower():
-                            lines[i] = "• " + lines[i]
-                    essay_text = '\n'.join(lines)
-                    
-                # Update UI in main thread
-                self.root.after(0, lambda: self.update_essay_result(essay_text))
-                
+                    chunks = self.llm.stream(prompt, max_tokens=word_count * 2)
+                parts = []
+                for chunk in chunks:
+                    if job.cancelled:
+                        return  # Superseded or the screen was left
+                    parts.append(chunk)
+                    stream_queue.put(("chunk", chunk))
+                essay_text = postprocess("".join(parts))
+                if cache_key:
+                    self.response_cache.put(cache_key, essay_text)
+                stream_queue.put(("done", (essay_text, parse_essay_spans(essay_text))))
             except Exception as e:
-                error_message = str(e)
-                self.root.after(0, lambda: self.handle_api_error(error_message))
-        
-        threading.Thread(target=generate_essay_thread, daemon=True).start()
-        
+                stream_queue.put(("error", str(e)))
+
+        # Outline-first variant: sections are written concurrently and each is
+        # drawn as soon as it is done, with placeholders for the others
+        def sectioned_essay_thread(job):
+            def on_section(headings, sections):
+                progress = stitch_sections(topic, headings, sections)
+                self.jobs.post(job, self.render_essay, progress)
+
+            essay_text = generate_sectioned_essay(self.llm, topic, word_count, add_bullets,
+                                                  on_section=on_section, cancelled=lambda: job.cancelled)
+            essay_text = postprocess(essay_text)
+            if cache_key and not job.cancelled:
+                self.response_cache.put(cache_key, essay_text)
+            return essay_text, parse_essay_spans(essay_text)
+
+        if sectioned:
+            self.jobs.submit(sectioned_essay_thread, owner="essay", key="essay",
+                             priority=JobScheduler.PRIORITY_ESSAY,
+                             on_done=lambda result: self.update_essay_result(*result),
+                             on_error=lambda e: self.handle_api_error(str(e)))
+        elif stream:
+            self.essay_formatter = EssayStreamFormatter()
+            self.essay_stream_started = False
+            self.root.after(ESSAY_STREAM_FRAME_MS, lambda: self.pump_essay_stream(stream_id, stream_queue))
+            self.jobs.submit(stream_essay_thread, owner="essay", key="essay",
+                             priority=JobScheduler.PRIORITY_ESSAY)
+        else:
+            self.jobs.submit(generate_essay_thread, owner="essay", key="essay",
+                             priority=JobScheduler.PRIORITY_ESSAY,
+                             on_done=lambda result: self.update_essay_result(*result),
+                             on_error=lambda e: self.handle_api_error(str(e)))
+
+    def pump_essay_stream(self, stream_id, stream_queue):
+        """Drain queued chunks into the essay box once per frame"""
+        if stream_id != self.essay_stream_id or not self.essay_result.winfo_exists():
+            return
+        formatter = self.essay_formatter
+        lines = []
+        final = error = None
+        while True:
+            try:
+                kind, payload = stream_queue.get_nowait()
+            except queue.Empty:
+                break
+            if kind == "chunk":
+                lines.extend(formatter.feed(payload))
+            elif kind == "done":
+                lines.extend(formatter.finish())
+                final = payload
+            else:
+                error = payload
+
+        if error is not None:
+            self.handle_api_error(error)
+            return
+
+        if lines or formatter.pending or final is not None:
+            if not self.essay_stream_started:
+                # First chunk: replace the placeholder
+                self.essay_stream_started = True
+                self.essay_result.delete("1.0", tk.END)
+                self.essay_result.mark_set("stream_partial", "1.0")
+                self.essay_result.mark_gravity("stream_partial", "left")
+            # Replace the previous partial line with completed lines plus the new partial
+            self.essay_result.delete("stream_partial", "end-1c")
+            if lines:
+                # One insert call for the whole frame: text, tags, text, tags...
+                chunks = []
+                for line, tag in lines:
+                    chunks.extend((line, tag or ()))
+                self.essay_result.insert("end-1c", *chunks)
+            self.essay_result.mark_set("stream_partial", "end-1c")
+            self.essay_result.insert("end-1c", formatter.pending)
+            self.essay_result.see(tk.END)
+
+        if final is not None:
+            final_text, spans = final
+            if final_text != formatter.text():
+                # Post-processing added a title or bullets; redraw in full
+                self.update_essay_result(final_text, spans)
+            else:
+                messagebox.showinfo("Success", "Essay generated successfully! ")
+            return
+
+        self.root.after(ESSAY_STREAM_FRAME_MS, lambda: self.pump_essay_stream(stream_id, stream_queue))
+
     def generate_sample_essay(self, topic, word_count, add_headers, add_bullets):
-        """Generate a sample essay when the API key is not available"""
-        
-        # Base text structure
-        intro = f"Introduction to {topic}\n\nAn essay exploring the various aspects of {topic}. This topic is interesting for several reasons and merits thorough examination."
-        
-        body_sections = [
-            f"Understanding {topic} requires analysis of its key components. Researchers have identified several factors that contribute to this subject.",
-            f"The history of {topic} provides valuable context. Over time, significant developments have shaped our understanding of this area.",
-            f"When considering the practical applications of {topic}, we can identify numerous examples across different domains.",
-            f"Recent advances related to {topic} have opened new possibilities for research and development in this field."
-        ]
-        
-        conclusion = f"In conclusion, {topic} represents an important area of study with numerous implications. Further research and practical applications will continue to enhance our understanding."
-        
-        # Build the essay
-        essay_parts = []
-        
-        # Add introduction
-        if add_headers:
-            essay_parts.append("# Introduction")
-        essay_parts.append(intro)
-        
-        # Add body sections
-        for i, section in enumerate(body_sections[:3]):  # Limit to 3 sections for shorter essays
-            if add_headers:
-                essay_parts.append(f"\n# Section {i+1}")
-            essay_parts.append(section)
-            
-            # Add bullet points if requested
-            if add_bullets:
-                essay_parts.append("\nKey points:")
-                for j in range(3):
-                    point = f"• Important aspect {j+1} related to this section of {topic}"
-                    essay_parts.append(point)
-        
-        # Add conclusion
-        if add_headers:
-            essay_parts.append("\n# Conclusion")
-        essay_parts.append(conclusion)
-        
-        # Join all parts
-        return "\n\n".join(essay_parts)
+        """Generate a sample essay when the API key is not available"""
+        return sample_essay(topic, word_count, add_headers, add_bullets)
 
     def handle_api_error(self, error_message):
         self.essay_result.delete("1.0", tk.END)
@@ -555,32 +4132,22 @@ class EduPal:
         self.essay_result.insert(tk.END, "# Conclusion\n\n")
         self.essay_result.insert(tk.END, "Write your conclusion here...\n")
 
-    def update_essay_result(self, essay_text):
-        self.essay_result.delete("1.0", tk.END)
-        
-        # Configure text tags for formatting
-        self.essay_result.tag_configure("header", font=("Arial", 14, "bold"))
-        self.essay_result.tag_configure("bullet", lmargin1=20, lmargin2=40)
-        
-        # Process text for better formatting
-        lines = essay_text.split('\n')
-        for line in lines:
-            # Check if this line is a header (starts with # or is all caps)
-            if line.strip().startswith('#') or (line.strip().isupper() and len(line.strip()) > 3):
-                self.essay_result.insert(tk.END, line + "\n", "header")
-            
-            # Check if this line is a bullet point
-            elif line.strip().startswith('•') or line.strip().startswith('-') or line.strip().startswith('*'):
-                # Format as bullet point
-                self.essay_result.insert(tk.END, line + "\n", "bullet")
-            
-            # Regular text
-            else:
-                self.essay_result.insert(tk.END, line + "\n")
+    def update_essay_result(self, essay_text, spans=None):
+        self.render_essay(essay_text, spans)
         
         # Play success sound
         messagebox.showinfo("Success", "Essay generated successfully! ")
 
+    def render_essay(self, essay_text, spans=None):
+        """Render the essay with one insert and one tag_add call per tag"""
+        if spans is None:
+            spans = parse_essay_spans(essay_text)
+
+        self.essay_result.delete("1.0", tk.END)
+        self.essay_result.insert("1.0", essay_text + "\n")
+        for tag, ranges in spans.items():
+            self.essay_result.tag_add(tag, *ranges)
+
     def export_essay(self):
         essay_text = self.essay_result.get("1.0", tk.END)
         if not essay_text.strip() or essay_text.strip() == "Generating your essay... Please wait...":
@@ -596,77 +4163,140 @@ class EduPal:
             with open(filename, "w") as f:
                 f.write(essay_text)
             messagebox.showinfo("Success", f"Essay exported as '{filename}' ")
+            self.refresh_notes_index()
         except Exception as e:
             messagebox.showerror("Error", f"Failed to export essay: {str(e)} ")
 
-    def show_study_buddy(self):
-        # Clear main content area
-        for widget in self.root.winfo_children():
-            if widget.grid_info().get('column') == 1:
-                widget.destroy()
-
+    def build_study_buddy(self, parent):
         # Create a frame for the chatbot
-        chat_frame = tk.Frame(self.root, bg=self.theme["bg_primary"], padx=20, pady=20)
-        chat_frame.grid(row=0, column=1, sticky="nsew")
+        chat_frame = self.theme.create(tk.Frame, parent, bg="bg_primary", padx=20, pady=20)
 
         # Title
-        title = tk.Label(chat_frame, text="AI Assistant ", 
-                       font=("Arial", 16, "bold"), bg=self.theme["bg_primary"], fg=self.accent_color)
+        title = self.theme.create(tk.Label, chat_frame, text="AI Assistant ", 
+                       font=("Arial", 16, "bold"), bg="bg_primary", fg="accent")
         title.pack(pady=10)
         
         # Chat history section
-        history_label = tk.Label(chat_frame, text="Chat History:", 
-                             font=("Arial", 12, "bold"), bg=self.theme["bg_primary"], fg=self.theme["text_primary"])
-        history_label.pack(anchor="w", pady=(10, 0))
+        history_header = self.theme.create(tk.Frame, chat_frame, bg="bg_primary")
+        history_header.pack(fill="x", pady=(10, 0))
+
+        history_label = self.theme.create(tk.Label, history_header, text="Chat History:", 
+                             font=("Arial", 12, "bold"), bg="bg_primary", fg="text_primary")
+        history_label.pack(side="left")
+
+        self.chat_stats_label = self.theme.create(tk.Label, history_header, text="",
+                                                   font=("Arial", 10), bg="bg_primary", fg="text_secondary")
+        self.chat_stats_label.pack(side="left", padx=10)
+
+        # Folders of .txt/.md notes the assistant can search
+        notes_button = self.theme.create(tk.Button, history_header, text="Add Notes",
+                                         command=self.add_notes_folder,
+                                         font=("Arial", 10), bg="bg_secondary", fg="text_primary")
+        notes_button.pack(side="right", padx=(5, 0))
+
+        # Search across every saved conversation
+        search_button = self.theme.create(tk.Button, history_header, text="Search",
+                                          command=self.search_chat_history,
+                                          font=("Arial", 10), bg="bg_secondary", fg="text_primary")
+        search_button.pack(side="right")
+        self.chat_search_entry = self.theme.create(tk.Entry, history_header, font=("Arial", 11), width=25,
+                                                   bg="input_bg", fg="input_text")
+        self.chat_search_entry.pack(side="right", padx=5)
+        self.chat_search_entry.bind("<Return>", lambda e: self.search_chat_history())
         
-        history_frame = tk.Frame(chat_frame, bg=self.theme["bg_primary"])
+        history_frame = self.theme.create(tk.Frame, chat_frame, bg="bg_primary")
         history_frame.pack(fill="both", expand=True, pady=10)
         
-        self.chat_history = tk.Text(history_frame, height=15, width=60, 
+        self.chat_history = self.theme.create(tk.Text, history_frame, height=15, width=60, 
                                   font=("Arial", 12), wrap=tk.WORD,
-                                  bg=self.theme["input_bg"], fg=self.theme["text_primary"],
+                                  bg="input_bg", fg="text_primary",
                                   state="disabled")
         self.chat_history.pack(side="left", fill="both", expand=True)
         
-        history_scrollbar = tk.Scrollbar(history_frame, command=self.chat_history.yview)
-        history_scrollbar.pack(side="right", fill="y")
-        self.chat_history.config(yscrollcommand=history_scrollbar.set)
+        # Tag colours follow the palette, for better visibility in dark mode
+        self.chat_history.tag_config("sender", font=("Arial", 12, "bold"))
+        self.theme.bind_tag(self.chat_history, "sender", foreground="chat_sender")
+        self.theme.bind_tag(self.chat_history, "message", foreground="chat_message")
+        
+        self.chat_scrollbar = tk.Scrollbar(history_frame, command=self.chat_history.yview)
+        self.chat_scrollbar.pack(side="right", fill="y")
+        self.chat_history.config(yscrollcommand=self.on_chat_scroll)
         
-        # Add a welcome message
-        self.update_chat_history("AI Assistant", "Hello! I'm your AI assistant. How can I help you with your studies today?")
+        # Show the latest page of the saved transcript, or a welcome message
+        self.load_latest_chat()
         
         # Input section
-        input_frame = tk.Frame(chat_frame, bg=self.theme["bg_primary"])
+        input_frame = self.theme.create(tk.Frame, chat_frame, bg="bg_primary")
         input_frame.pack(fill="x", pady=10)
         
-        input_label = tk.Label(input_frame, text="Your question:", 
-                            font=("Arial", 12), bg=self.theme["bg_primary"], fg=self.theme["text_primary"])
+        input_label = self.theme.create(tk.Label, input_frame, text="Your question:", 
+                            font=("Arial", 12), bg="bg_primary", fg="text_primary")
         input_label.pack(side="left", padx=(0, 10))
         
-        self.chat_input = tk.Entry(input_frame, font=("Arial", 12), width=50,
-                                 bg=self.theme["input_bg"], fg=self.theme["input_text"])
+        self.chat_input = self.theme.create(tk.Entry, input_frame, font=("Arial", 12), width=50,
+                                 bg="input_bg", fg="input_text")
         self.chat_input.pack(side="left", fill="x", expand=True, padx=(0, 10))
         self.chat_input.bind("<Return>", lambda e: self.send_message())
         
-        send_button = tk.Button(input_frame, text="Send", 
+        send_button = self.theme.create(tk.Button, input_frame, text="Send", 
                               command=self.send_message,
-                              bg=self.accent_color, fg=self.theme["text_inverse"],
+                              bg="accent", fg="text_inverse",
                               font=("Arial", 12),
                               padx=10, pady=5)
         send_button.pack(side="right")
+
+        # Skip every cached answer and ask the model again
+        fresh_button = self.theme.create(tk.Button, input_frame, text="Ask fresh",
+                                         command=lambda: self.send_message(fresh=True),
+                                         bg="bg_secondary", fg="text_primary",
+                                         font=("Arial", 12),
+                                         padx=10, pady=5)
+        fresh_button.pack(side="right", padx=(0, 5))
         
-        if SPEECH_RECOGNITION_AVAILABLE:
-            voice_button = tk.Button(input_frame, text="", 
+        if SPEECH_RECOGNITION_AVAILABLE or self.config.get("voice_test_wav"):
+            self.voice_button = self.theme.create(tk.Button, input_frame, text="Mic", 
                                    command=self.voice_input,
-                                   bg=self.accent_color, fg=self.theme["text_inverse"],
+                                   bg="accent", fg="text_inverse",
                                    font=("Arial", 12),
                                    padx=5, pady=5)
-            voice_button.pack(side="right", padx=5)
+            self.voice_button.pack(side="right", padx=5)
         
-        # Auto focus on input
+        return chat_frame
+
+    def enter_study_buddy(self):
         self.chat_input.focus()
+        self.refresh_notes_index()  # Pick up notes, essays and tasks changed since the last visit
 
-    def send_message(self):
+    def add_notes_folder(self):
+        folder = filedialog.askdirectory(title="Add Notes Folder")
+        if not folder:
+            return
+        folders = self.settings.get("notes_folders", [])
+        if folder not in folders:
+            self.settings["notes_folders"] = folders + [folder]
+        self.refresh_notes_index(announce=True)
+
+    def refresh_notes_index(self, announce=False):
+        """Index new or changed notes, exported essays and tasks in the background"""
+        folders = list(self.settings.get("notes_folders", []))
+
+        def refresh(job):
+            sources = note_file_sources(folders)
+            for task in self.task_store.all():
+                text = f"To-do: {task['text']}" + (" (done)" if task["completed"] else "")
+                sources[f"task:{task['id']}"] = ([task["text"], task["completed"]], lambda text=text: text)
+            return self.notes_index.refresh(sources, cancelled=lambda: job.cancelled)
+
+        def done(count):
+            if announce:
+                self.update_chat_history("System", f"Notes indexed: {count} passages are searchable.")
+
+        # An announced refresh reports to the chat, so evicting the study screen must cancel it
+        self.jobs.submit(refresh, owner="study" if announce else None, key="notes-index",
+                         priority=JobScheduler.PRIORITY_BULK, on_done=done,
+                         on_error=lambda e: print(f"Error indexing notes: {e}"))
+
+    def send_message(self, fresh=False):
         user_message = self.chat_input.get().strip()
         if not user_message:
             return
@@ -676,121 +4306,354 @@ class EduPal:
         
         # Add user message to chat
         self.update_chat_history("You", user_message)
+
+        reply = self.router.route(user_message)
+        if reply is not None:
+            self.reply_locally(user_message, reply)
+            self.update_chat_stats()
+            return
         
-        # Check for basic math operations
+        # Check for basic math operations; evaluated off the Tk thread
         if self.is_math_question(user_message):
-            try:
-                result = self.evaluate_math(user_message)
-                self.root.after(500, lambda: self.update_chat_history("AI Assistant", f"The answer is {result}"))
-                return
-            except:
-                pass  # Fall back to normal response if math evaluation fails
-        
-        # Simulate AI response with threading to avoid UI freeze
-        threading.Thread(target=self.get_ai_response, args=(user_message,), daemon=True).start()
+            def math_failed(error):
+                if isinstance(error, MathLimitError):
+                    self.reply_locally(user_message, str(error))
+                else:
+                    self.request_ai_response(user_message, fresh)  # Fall back to normal response
+
+            self.jobs.submit(lambda job: self.evaluate_math(user_message),
+                             owner="study", priority=JobScheduler.PRIORITY_CHAT,
+                             on_done=lambda result: self.reply_locally(user_message, f"The answer is {result}"),
+                             on_error=math_failed)
+            return
+
+        self.request_ai_response(user_message, fresh)
+
+    def reply_locally(self, user_message, reply):
+        """Show a reply made without the model and keep it in the conversation context"""
+        self.remember_turn("User", user_message)
+        self.remember_turn("AI Assistant", reply)
+        self.update_chat_history("AI Assistant", reply)
+
+    def request_ai_response(self, user_message, fresh=False):
+        # The history is snapshotted here so the prompt only sees earlier turns
+        history = self.conversation.render()
+        self.remember_turn("User", user_message)
+
+        def answered(response):
+            self.remember_turn("AI Assistant", response)
+            self.update_chat_history("AI Assistant", response)
+            self.update_chat_stats()
+
+        # Get the AI response on the job scheduler to avoid UI freeze; a repeat
+        # of a question that is still pending replaces the earlier request
+        self.jobs.submit(lambda job: self.get_ai_response(user_message, fresh=fresh, history=history),
+                         owner="study", key=("chat", user_message.lower()),
+                         priority=JobScheduler.PRIORITY_CHAT,
+                         on_done=answered,
+                         on_error=lambda e: self.update_chat_history(
+                             "System", f"API Error: {str(e)}\nPlease check your internet connection and API key"))
+
+    def update_chat_stats(self):
+        stats = self.question_cache.stats
+        asked = stats["hits"] + stats["misses"]
+        parts = []
+        if self.router.saved:
+            parts.append(f"Answered locally: {self.router.saved}")
+        if asked:
+            parts.append(f"Cached answers: {stats['hits']}/{asked} ({self.question_cache.hit_rate():.0%})")
+        if self.response_cache.stats["misses"]:
+            parts.append(f"Response cache: {self.response_cache.hit_rate():.0%} hits")
+        self.chat_stats_label.config(text="   ".join(parts))
+
+    def timer_command_reply(self, message, matches):
+        """Handle "start a 25 minute timer", "pause the timer" and the like"""
+        text = message.lower().strip()
+        control = TIMER_CONTROL_PATTERN.match(text)
+        if control:
+            if control.group(1) == "reset":
+                self.reset_timer()
+                return "Reset the study timer."
+            if not self.study_timer.running:
+                return "The study timer isn't running."
+            self.pause_timer()
+            return "Paused the study timer."
+        start = TIMER_START_PATTERN.match(text)
+        if not start:
+            return None
+        amount, unit = start.group(1, 2) if start.group(1) else start.group(3, 4)
+        if amount is None:
+            self.start_timer()  # Starts or resumes the current session
+        else:
+            minutes = int(amount) * (60 if unit.startswith("h") else 1)
+            if not 1 <= minutes <= StudyTimer.MAX_WORK_MINUTES:
+                return f"Study sessions can be 1 to {StudyTimer.MAX_WORK_MINUTES} minutes long."
+            self.start_timer_for(minutes)
+        minutes, seconds = divmod(self.study_timer.display_seconds(), 60)
+        return f"Study timer running: {minutes:02d}:{seconds:02d} left in this {self.study_timer.session_type} session."
+
+    def task_command_reply(self, message, matches):
+        """Handle "add task ..." and "add ... to my to-do list" """
+        for pattern in TASK_COMMAND_PATTERNS:
+            found = pattern.match(message.strip())
+            if found:
+                break
+        else:
+            return None
+        text = found.group(1).strip("\"' ")
+        if not text:
+            return None
+        if self.task_model is not None:
+            self.task_model.add(text)
+        else:
+            self.task_store.add(text)
+        if "todo" in self.screens.frames:
+            self.refresh_task_view()
+        return f"Added \"{text}\" to your to-do list."
+
+    def remember_turn(self, speaker, text):
+        """Add a turn to the chat context and summarize evicted turns in the background"""
+        if self.conversation.add(speaker, text):
+            self.jobs.submit(lambda job: self.conversation.fold(self.summarize_chat),
+                             key="chat-summary", priority=JobScheduler.PRIORITY_BULK)
+
+    def summarize_chat(self, summary, turns):
+        if not self.llm.available:
+            return None  # Local extractive summary
+        return summarize_chat_turns(self.llm, summary, turns)
     
     def is_math_question(self, message):
         """Check if the message is a basic math question"""
-        # Remove spaces and convert to lowercase
-        message = message.lower().replace(" ", "")
-        
-        # Check for common math operators (+, -, *, /, ^)
-        has_operator = any(op in message for op in ['+', '-', '*', '/', '^'])
-        
-        # Check if it's mostly numbers and operators
-        is_mostly_math = sum(c.isdigit() or c in '+-*/^().' for c in message) > len(message) * 0.5
-        
-        return has_operator and is_mostly_math
+        return self.math_engine.is_math_question(message)
     
     def evaluate_math(self, expression):
         """Safely evaluate a math expression"""
-        # Replace ^ with ** for exponentiation
-        expression = expression.replace('^', '**')
-        
-        # Remove all characters except numbers, operators, and parentheses
-        expression = ''.join(c for c in expression if c.isdigit() or c in '+-*/().** ')
-        
-        # Evaluate using a safe approach
-        try:
-            # Use ast.literal_eval for safety
-            result = eval(expression)
-            return result
-        except:
-            raise ValueError("Could not evaluate math expression")
+        return self.math_engine.evaluate(expression)
     
     def update_chat_history(self, sender, message):
-        self.chat_history.config(state="normal", wrap=tk.WORD)  # Add word wrap
-        if sender:
-            timestamp = datetime.now().strftime("%H:%M")
-            self.chat_history.insert(tk.END, f"\n{timestamp} {sender}: \n", "sender")
-            self.chat_history.insert(tk.END, f"{message}\n\n", "message")
+        """Save a message to the transcript store and append it to the widget"""
+        message_id = self.chat_store.add(sender or "", message)
+        if self.chat_has_newer:
+            # Scrolled back into older pages; jump to the newest messages
+            self.load_latest_chat()
         else:
-            self.chat_history.insert(tk.END, f"{message}\n", "system")
+            self.chat_history.config(state="normal")
+            self.render_chat_message(sender, message, message_id=message_id)
+            self.chat_loaded.append(message_id)
+            self.trim_chat(from_top=True)
+            self.chat_history.config(state="disabled")
         self.chat_history.see(tk.END)  # Auto-scroll to bottom
+
+    def render_chat_message(self, sender, message, ts=None, message_id=None, index=tk.END):
+        """Insert one message at the end or the top of the transcript widget"""
+        # Called with the widget in the normal state
+        when = datetime.fromtimestamp(ts) if ts else datetime.now()
+        timestamp = when.strftime("%H:%M" if when.date() == datetime.now().date() else "%b %d %H:%M")
+        start = "1.0" if index == "1.0" else self.chat_history.index("end-1c")
+        if sender:
+            self.chat_history.insert(index, f"\n{timestamp} {sender}: \n", "sender", f"{message}\n\n", "message")
+        else:
+            self.chat_history.insert(index, f"{message}\n", "system")
+        if message_id is not None:
+            # Marks move with the text, so older messages can be trimmed later
+            self.chat_history.mark_set(f"msg{message_id}", start)
+
+    def load_latest_chat(self):
+        self.chat_history.config(state="normal")
+        self.chat_history.delete("1.0", tk.END)
+        for mark in self.chat_history.mark_names():
+            if mark.startswith("msg"):
+                self.chat_history.mark_unset(mark)
+        rows = self.chat_store.page(limit=CHAT_PAGE_SIZE)
+        for message_id, ts, sender, message in rows:
+            self.render_chat_message(sender, message, ts, message_id)
+        if not rows:
+            self.render_chat_message("AI Assistant", "Hello! I'm your AI assistant. How can I help you with your studies today?")
         self.chat_history.config(state="disabled")
-        
-        # Configure tags for better visibility in dark mode
-        if self.is_dark_mode:
-            self.chat_history.tag_config("sender", foreground="#7ADBFC", font=("Arial", 12, "bold"))
-            self.chat_history.tag_config("message", foreground="#E8E8E8") 
+        self.chat_history.see(tk.END)
+        self.chat_loaded = deque(row[0] for row in rows)
+        self.chat_has_older = len(rows) == CHAT_PAGE_SIZE
+        self.chat_has_newer = False
+        self.chat_paging = False
+
+    def on_chat_scroll(self, first, last):
+        """Page older or newer messages in when the transcript is scrolled to an edge"""
+        self.chat_scrollbar.set(first, last)
+        if self.chat_paging or not self.chat_loaded:
+            return
+        if float(first) <= 0.0 and float(last) < 1.0 and self.chat_has_older:
+            self.chat_paging = True
+            self.root.after_idle(self.load_older_chat)
+        elif float(last) >= 1.0 and float(first) > 0.0 and self.chat_has_newer:
+            self.chat_paging = True
+            self.root.after_idle(self.load_newer_chat)
+
+    def load_older_chat(self):
+        oldest = self.chat_loaded[0]
+        rows = self.chat_store.page(before_id=oldest, limit=CHAT_PAGE_SIZE)
+        self.chat_history.config(state="normal")
+        for message_id, ts, sender, message in reversed(rows):
+            self.render_chat_message(sender, message, ts, message_id, index="1.0")
+            self.chat_loaded.appendleft(message_id)
+        self.chat_has_older = len(rows) == CHAT_PAGE_SIZE
+        self.trim_chat(from_top=False)
+        self.chat_history.config(state="disabled")
+        # Keep the message that was on top where the reader left it
+        self.chat_history.yview(f"msg{oldest}")
+        self.chat_paging = False
+
+    def load_newer_chat(self):
+        newest = self.chat_loaded[-1]
+        rows = self.chat_store.page(after_id=newest, limit=CHAT_PAGE_SIZE)
+        self.chat_history.config(state="normal")
+        for message_id, ts, sender, message in rows:
+            self.render_chat_message(sender, message, ts, message_id)
+            self.chat_loaded.append(message_id)
+        self.chat_has_newer = len(rows) == CHAT_PAGE_SIZE
+        self.trim_chat(from_top=True)
+        self.chat_history.config(state="disabled")
+        self.chat_paging = False
+
+    def trim_chat(self, from_top):
+        """Drop messages beyond CHAT_MAX_LOADED from one end of the widget"""
+        # Called with the widget in the normal state
+        excess = len(self.chat_loaded) - CHAT_MAX_LOADED
+        if excess <= 0:
+            return
+        if from_top:
+            removed = [self.chat_loaded.popleft() for _ in range(excess)]
+            self.chat_history.delete("1.0", f"msg{self.chat_loaded[0]}")
+            self.chat_has_older = True
         else:
-            self.chat_history.tag_config("sender", foreground="#0066CC", font=("Arial", 12, "bold"))
-            self.chat_history.tag_config("message", foreground="#333333")
+            removed = [self.chat_loaded.pop() for _ in range(excess)]
+            self.chat_history.delete(f"msg{removed[-1]}", tk.END)
+            self.chat_has_newer = True
+        for message_id in removed:
+            self.chat_history.mark_unset(f"msg{message_id}")
+
+    def search_chat_history(self):
+        """List saved messages matching the search box in a separate window"""
+        query = self.chat_search_entry.get().strip()
+        if not query:
+            return
+        start = time.perf_counter()
+        rows = self.chat_store.search(query)
+        elapsed = time.perf_counter() - start
+
+        results_window = tk.Toplevel(self.root)
+        results_window.title(f"Chat search: {query}")
+        results_window.geometry("600x400")
+        self.theme.bind(results_window, bg="bg_primary")
+
+        summary = self.theme.create(tk.Label, results_window,
+                                    text=f"{len(rows)} matches in {elapsed * 1000:.1f} ms",
+                                    font=("Arial", 10), bg="bg_primary", fg="text_secondary")
+        summary.pack(anchor="w", padx=10, pady=(10, 0))
+
+        results = self.theme.create(tk.Text, results_window, wrap=tk.WORD, font=("Arial", 11),
+                                    bg="input_bg", fg="input_text")
+        results.pack(fill="both", expand=True, padx=10, pady=10)
+        results.tag_config("sender", font=("Arial", 11, "bold"))
+        self.theme.bind_tag(results, "sender", foreground="chat_sender")
+        for _, ts, sender, message in rows:
+            when = datetime.fromtimestamp(ts).strftime("%b %d %Y %H:%M")
+            results.insert(tk.END, f"{when} {sender}:\n", "sender", f"{message}\n\n")
+        results.config(state="disabled")
+
+    def get_ai_response(self, user_message, fresh=False, history=""):
+        """Get response from AI model, reusing a cached answer unless fresh is set.
 
-    def get_ai_response(self, user_message):
-        """Get response from AI model."""
+        An answer to a near-identical earlier question is returned straight
+        away. Matching passages from the student's notes are added to the
+        prompt, or quoted directly when the model cannot be reached. Runs on
+        a worker thread and returns the answer text; errors propagate.
+        """
+        if not fresh:
+            cached = self.question_cache.lookup(user_message)
+            if cached is not None:
+                return cached
+        # Only passages covering at least half of the question are worth sending
+        passages = [hit for hit in self.notes_index.search(user_message) if hit[1] >= 0.5]
+        if passages and not self.llm.available:
+            return answer_from_notes(passages)
         try:
-            if not self.cohere_api_key:
-                raise ValueError("Cohere API key is missing. Please configure it in 'config.json'.")
+            response = generate_chat_reply(self.llm, user_message, cache=self.response_cache, fresh=fresh,
+                                           history=history, passages=passages)
+        except Exception:
+            if passages:
+                return answer_from_notes(passages)  # Offline or the service failed
+            raise
+        self.question_cache.store(user_message, response)
+        return response
 
-            import cohere
-            co = cohere.Client(self.cohere_api_key)
-            
-            # Using generate instead of chat (simpler API)
-            prompt = f"You are a helpful educational AI assistant. User: {user_message}\nAI Assistant:"
-            response = co.generate(
-                prompt=prompt,
-                max_tokens=300,
-                temperature=0.7,
-                return_likelihoods="NONE"
-            )
-            
-            # Get the generated text from the first generation
-            bot_response = response.generations[0].text.strip()
-            self.root.after(0, lambda: self.update_chat_history("AI Assistant", bot_response))
-        except Exception as e:
-            error_message = f"API Error: {str(e)}\nPlease check your internet connection and API key"
-            self.root.after(0, lambda: self.update_chat_history("System", error_message))
+    def create_voice_pipeline(self):
+        """Pick the audio source and recognizer configured in config.json"""
+        test_wav = self.config.get("voice_test_wav")
+        if test_wav:
+            # WAV-driven test mode: transcript lines live next to the file
+            transcript = os.path.splitext(test_wav)[0] + ".txt"
+            return VoicePipeline(WavFileSource(test_wav), ScriptedRecognizer(transcript))
+        if self.config.get("voice_recognizer") == "offline":
+            recognizer = OfflineRecognizer()
+        else:
+            recognizer = GoogleRecognizer()
+        return VoicePipeline(MicrophoneSource(), recognizer)
 
     def voice_input(self):
-        if not SPEECH_RECOGNITION_AVAILABLE:
+        if not (SPEECH_RECOGNITION_AVAILABLE or self.config.get("voice_test_wav")):
             messagebox.showerror("Error", "Speech recognition is not available!")
             return
-            
+
+        # A second click stops the dictation in progress
+        if self.stop_voice_input():
+            return
+
         try:
-            messagebox.showinfo("Voice Input", "Please speak into your microphone...")
-            
-            # Initialize recognizer
-            r = sr.Recognizer()
-            
-            # Use microphone as source
-            with sr.Microphone() as source:
-                audio = r.listen(source, timeout=5)
-                
-            # Recognize speech
-            text = r.recognize_google(audio)
-            
-            # Update input field
+            pipeline = self.create_voice_pipeline()
+        except Exception as e:
+            self.update_chat_history("System", f"Voice input error: {str(e)}")
+            return
+
+        self.chat_input.delete(0, tk.END)
+        self.voice_button.config(text="Stop")
+
+        def show_partial(text):
             self.chat_input.delete(0, tk.END)
             self.chat_input.insert(0, text)
-            
-        except sr.RequestError:
-            messagebox.showerror("Error", "Speech service is unavailable!")
-        except sr.UnknownValueError:
-            messagebox.showerror("Error", "Could not understand audio!")
-        except Exception as e:
-            messagebox.showerror("Error", f"Voice input error: {str(e)}")
+
+        def capture(job):
+            return pipeline.run(lambda text: self.jobs.post(job, show_partial, text),
+                                cancelled=lambda: job.cancelled)
+
+        def finished(text):
+            self.voice_job = None
+            self.voice_button.config(text="Mic")
+            if text:
+                show_partial(text)
+            else:
+                self.update_chat_history("System", "Could not understand audio!")
+
+        def failed(error):
+            self.voice_job = None
+            self.voice_button.config(text="Mic")
+            if SPEECH_RECOGNITION_AVAILABLE and isinstance(error, sr.RequestError):
+                self.update_chat_history("System", "Speech service is unavailable!")
+            else:
+                self.update_chat_history("System", f"Voice input error: {str(error)}")
+
+        self.voice_job = self.jobs.submit(capture, owner="study", key="voice",
+                                          priority=JobScheduler.PRIORITY_CHAT,
+                                          on_done=finished, on_error=failed)
     
+    def stop_voice_input(self):
+        """Stop a running dictation; returns whether one was running"""
+        if self.voice_job is None or self.voice_job.cancelled:
+            return False
+        self.voice_job.cancel()
+        self.voice_job = None
+        self.voice_button.config(text="Mic")
+        return True
+
     def show_random_tip(self):
         tips = [
             "Break large study tasks into smaller, manageable chunks",
@@ -821,109 +4684,127 @@ class EduPal:
         """
         messagebox.showinfo("Help Guide", help_text)
 
-    def show_study_timer(self):
-        # Clear main content area
-        for widget in self.root.grid_slaves(row=0, column=1):
-            if widget:
-                widget.destroy()
-
+    def build_study_timer(self, parent):
         # Create a frame for the timer
-        timer_frame = tk.Frame(self.root, bg=self.theme["bg_primary"], padx=20, pady=20)
-        timer_frame.grid(row=0, column=1, sticky="nsew")
-        timer_frame._name = "timer_frame"  # For identifying current screen
+        timer_frame = self.theme.create(tk.Frame, parent, bg="bg_primary", padx=20, pady=20)
 
         # Title
-        title = tk.Label(timer_frame, text="Study Timer ", 
-                       font=("Arial", 16, "bold"), bg=self.theme["bg_primary"], fg=self.accent_color)
+        title = self.theme.create(tk.Label, timer_frame, text="Study Timer ", 
+                       font=("Arial", 16, "bold"), bg="bg_primary", fg="accent")
         title.pack(pady=10)
         
         # Timer display
-        display_frame = tk.Frame(timer_frame, bg=self.theme["bg_primary"])
+        display_frame = self.theme.create(tk.Frame, timer_frame, bg="bg_primary")
         display_frame.pack(pady=20)
         
-        self.time_display = tk.Label(display_frame, text="25:00", 
-                                   font=("Arial", 48, "bold"), bg=self.theme["bg_primary"], 
-                                   fg=self.theme["text_primary"])
+        self.time_display = self.theme.create(tk.Label, display_frame, text="", 
+                                   font=("Arial", 48, "bold"), bg="bg_primary", 
+                                   fg="text_primary")
         self.time_display.pack()
         
-        self.status_label = tk.Label(display_frame, text="Ready to start", 
-                                   font=("Arial", 14), bg=self.theme["bg_primary"], 
-                                   fg=self.theme["text_primary"])
+        self.status_label = self.theme.create(tk.Label, display_frame, text="Ready to start", 
+                                   font=("Arial", 14), bg="bg_primary", 
+                                   fg="text_primary")
         self.status_label.pack(pady=10)
         
         # Timer controls
-        controls_frame = tk.Frame(timer_frame, bg=self.theme["bg_primary"])
+        controls_frame = self.theme.create(tk.Frame, timer_frame, bg="bg_primary")
         controls_frame.pack(pady=20)
         
-        self.start_button = tk.Button(controls_frame, text="Start", 
+        self.start_button = self.theme.create(tk.Button, controls_frame, text="Start", 
                                     command=self.start_timer,
-                                    bg="#4CAF50", fg=self.theme["text_inverse"],
+                                    bg="#4CAF50", fg="text_inverse",
                                     font=("Arial", 14),
                                     padx=20, pady=10)
         self.start_button.pack(side="left", padx=5)
         
-        self.pause_button = tk.Button(controls_frame, text="Pause", 
+        self.pause_button = self.theme.create(tk.Button, controls_frame, text="Pause", 
                                     command=self.pause_timer,
-                                    bg=self.accent_color, fg=self.theme["text_inverse"],
+                                    bg="accent", fg="text_inverse",
                                     font=("Arial", 14),
                                     padx=20, pady=10,
                                     state="disabled")
         self.pause_button.pack(side="left", padx=5)
         
-        self.reset_button = tk.Button(controls_frame, text="Reset", 
+        self.reset_button = self.theme.create(tk.Button, controls_frame, text="Reset", 
                                     command=self.reset_timer,
-                                    bg="#FF5722", fg=self.theme["text_inverse"],
+                                    bg="#FF5722", fg="text_inverse",
                                     font=("Arial", 14),
                                     padx=20, pady=10)
         self.reset_button.pack(side="left", padx=5)
         
         # Timer settings
-        settings_frame = tk.LabelFrame(timer_frame, text="Timer Settings", 
-                                      font=("Arial", 12, "bold"), bg=self.theme["bg_primary"],
-                                      fg=self.theme["text_primary"])
+        settings_frame = self.theme.create(tk.LabelFrame, timer_frame, text="Timer Settings", 
+                                      font=("Arial", 12, "bold"), bg="bg_primary",
+                                      fg="text_primary")
         settings_frame.pack(fill="x", pady=20)
         
         # Work duration setting
-        work_frame = tk.Frame(settings_frame, bg=self.theme["bg_primary"])
+        work_frame = self.theme.create(tk.Frame, settings_frame, bg="bg_primary")
         work_frame.pack(fill="x", pady=10)
         
-        work_label = tk.Label(work_frame, text="Work Duration (min): ", 
-                             font=("Arial", 12), bg=self.theme["bg_primary"], fg=self.theme["text_primary"])
+        work_label = self.theme.create(tk.Label, work_frame, text="Work Duration (min): ", 
+                             font=("Arial", 12), bg="bg_primary", fg="text_primary")
         work_label.pack(side="left", padx=10)
         
-        self.work_min_var = tk.IntVar(value=25)
-        work_spin = tk.Spinbox(work_frame, from_=1, to=60, width=5, 
+        self.work_min_var = tk.IntVar(value=self.study_timer.work_seconds // 60)
+        work_spin = self.theme.create(tk.Spinbox, work_frame, from_=1, to=StudyTimer.MAX_WORK_MINUTES, width=5,
                              textvariable=self.work_min_var,
-                             bg=self.theme["input_bg"], fg=self.theme["input_text"])
+                             bg="input_bg", fg="input_text")
         work_spin.pack(side="left")
         
         # Break duration setting
-        break_frame = tk.Frame(settings_frame, bg=self.theme["bg_primary"])
+        break_frame = self.theme.create(tk.Frame, settings_frame, bg="bg_primary")
         break_frame.pack(fill="x", pady=10)
         
-        break_label = tk.Label(break_frame, text="Break Duration (min): ", 
-                              font=("Arial", 12), bg=self.theme["bg_primary"], fg=self.theme["text_primary"])
+        break_label = self.theme.create(tk.Label, break_frame, text="Break Duration (min): ", 
+                              font=("Arial", 12), bg="bg_primary", fg="text_primary")
         break_label.pack(side="left", padx=10)
         
-        self.break_min_var = tk.IntVar(value=5)
-        break_spin = tk.Spinbox(break_frame, from_=1, to=30, width=5, 
+        self.break_min_var = tk.IntVar(value=self.study_timer.break_seconds // 60)
+        break_spin = self.theme.create(tk.Spinbox, break_frame, from_=1, to=StudyTimer.MAX_BREAK_MINUTES, width=5,
                               textvariable=self.break_min_var,
-                              bg=self.theme["input_bg"], fg=self.theme["input_text"])
+                              bg="input_bg", fg="input_text")
         break_spin.pack(side="left")
+
+        # Subject the next work session counts towards
+        subject_frame = self.theme.create(tk.Frame, settings_frame, bg="bg_primary")
+        subject_frame.pack(fill="x", pady=10)
+
+        subject_label = self.theme.create(tk.Label, subject_frame, text="Subject: ",
+                                font=("Arial", 12), bg="bg_primary", fg="text_primary")
+        subject_label.pack(side="left", padx=10)
+
+        self.subject_var = tk.StringVar(value=self.timer_subject)
+        subject_entry = self.theme.create(tk.Entry, subject_frame, textvariable=self.subject_var, width=20,
+                                 bg="input_bg", fg="input_text")
+        subject_entry.pack(side="left")
+
+        # Totals come straight from the session store's aggregates
+        self.stats_label = self.theme.create(tk.Label, timer_frame, text="", font=("Arial", 11),
+                                  bg="bg_primary", fg="text_secondary")
+        self.stats_label.pack()
         
         # Session log
-        log_frame = tk.LabelFrame(timer_frame, text="Work Session Log", 
-                                font=("Arial", 12, "bold"), bg=self.theme["bg_primary"],
-                                fg=self.theme["text_primary"])
+        log_frame = self.theme.create(tk.LabelFrame, timer_frame, text="Work Session Log", 
+                                font=("Arial", 12, "bold"), bg="bg_primary",
+                                fg="text_primary")
         log_frame.pack(fill="both", expand=True, pady=20)
         
-        self.session_log = tk.Text(log_frame, height=8, font=("Arial", 12), 
-                                 wrap=tk.WORD, bg=self.theme["input_bg"], fg=self.theme["text_primary"])
+        self.session_log = self.theme.create(tk.Text, log_frame, height=8, font=("Arial", 12), 
+                                 wrap=tk.WORD, bg="input_bg", fg="text_primary")
         self.session_log.pack(side="left", fill="both", expand=True, padx=5, pady=5)
         
         log_scrollbar = tk.Scrollbar(log_frame, command=self.session_log.yview)
         log_scrollbar.pack(side="right", fill="y")
         self.session_log.config(yscrollcommand=log_scrollbar.set)
+
+        # Log tags follow the palette like the chat transcript
+        self.session_log.tag_config("timestamp", font=("Arial", 12, "bold"))
+        self.session_log.tag_config("heading", font=("Arial", 12, "bold"))
+        self.theme.bind_tag(self.session_log, "timestamp", foreground="chat_sender")
+        self.theme.bind_tag(self.session_log, "heading", foreground="chat_sender")
+        self.theme.bind_tag(self.session_log, "message", foreground="text_primary")
         
         # Add initial entry to session log
         timestamp = datetime.now().strftime("%H:%M")
@@ -931,329 +4812,423 @@ class EduPal:
         self.session_log.insert(tk.END, "Study Timer Ready\n", "heading")
         self.session_log.config(state="disabled")
 
+        return timer_frame
+
     def log_session_event(self, event):
         """Add an event to the session log with timestamp"""
+        if not (hasattr(self, "session_log") and self.session_log.winfo_exists()):
+            return
         self.session_log.config(state="normal")
         timestamp = datetime.now().strftime("%H:%M")
         self.session_log.insert(tk.END, f"[{timestamp}] ", "timestamp")
         self.session_log.insert(tk.END, f"{event}\n", "message")
         self.session_log.see(tk.END)
         self.session_log.config(state="disabled")
-        
-        # Configure tags for better visibility in dark mode
-        self.session_log.tag_config("timestamp", foreground="#7ADBFC", font=("Arial", 12, "bold"))
-        self.session_log.tag_config("heading", foreground="#7ADBFC", font=("Arial", 12, "bold"))
-        self.session_log.tag_config("message", foreground="#E8E8E8")
+
+    def read_timer_settings(self):
+        """Push the spinbox durations into the timer service"""
+        if not hasattr(self, "work_min_var"):
+            return  # Timer screen not built yet; keep the current durations
+        try:
+            self.study_timer.configure(self.work_min_var.get() * 60, self.break_min_var.get() * 60)
+        except tk.TclError:
+            pass  # Spinbox is mid-edit; keep the previous durations
 
     def start_timer(self):
-        if not hasattr(self, "timer_running"):
-            self.timer_running = False
-        if not self.timer_running:
-            self.timer_running = True
-            self.start_button.config(state="disabled")
-            self.pause_button.config(state="normal")
-            self.update_timer()
+        self.read_timer_settings()
+        if not self.study_timer.running:
+            if hasattr(self, "subject_var"):
+                self.timer_subject = self.subject_var.get().strip() or "General"
+            self.settings["last_subject"] = self.timer_subject
+            self.study_timer.start()
+            self.log_session_event(f"{self.study_timer.session_type.capitalize()} session started")
+            self.update_timer_view()
+            self.schedule_timer_tick()
+
+    def start_timer_for(self, minutes):
+        """Start a fresh work session of the given length, e.g. from an assistant command"""
+        if self.timer_after_id:
+            self.root.after_cancel(self.timer_after_id)
+            self.timer_after_id = None
+        self.study_timer.reset()
+        self.study_timer.configure(minutes * 60, self.study_timer.break_seconds)
+        if hasattr(self, "work_min_var"):
+            self.work_min_var.set(minutes)  # Keep the timer screen in step
+        self.start_timer()
 
     def pause_timer(self):
-        if self.timer_running:
-            self.timer_running = False
-            self.start_button.config(state="normal", text="Resume")
-            self.pause_button.config(state="disabled")
-            if hasattr(self, "timer_after_id") and self.timer_after_id:
+        if self.study_timer.running:
+            self.study_timer.pause()
+            self.log_session_event("Paused")
+            if self.timer_after_id:
                 self.root.after_cancel(self.timer_after_id)
+                self.timer_after_id = None
+            self.update_timer_view()
 
     def reset_timer(self):
-        if hasattr(self, "timer_after_id") and self.timer_after_id:
+        if self.timer_after_id:
             self.root.after_cancel(self.timer_after_id)
-        self.timer_running = False
-        self.current_session_type = "work"
-        self.remaining_seconds = self.work_min_var.get() * 60
-        self.start_button.config(state="normal", text="Start")
-        self.pause_button.config(state="disabled")
-        self.update_time_display()
+            self.timer_after_id = None
+        self.study_timer.reset()
+        self.read_timer_settings()
+        self.update_timer_view()
+
+    def schedule_timer_tick(self):
+        # Wake up just after the displayed second changes, not every 1000 ms
+        self.timer_after_id = self.root.after(self.study_timer.next_tick_ms(), self.update_timer)
 
     def update_timer(self):
-        if self.timer_running and self.remaining_seconds > 0:
-            self.remaining_seconds -= 1
-            self.update_time_display()
-            self.timer_after_id = self.root.after(1000, self.update_timer)
-        elif self.timer_running:  # Only trigger completion if actually running
-            self.timer_running = False
+        """Timer tick: lives on the root window, so it survives navigation"""
+        self.timer_after_id = None
+        duration = self.study_timer.duration()
+        finished = self.study_timer.poll()
+        if finished:
             self.root.bell()
-            if self.current_session_type == "work":
-                self.current_session_type = "break"
-                self.remaining_seconds = self.break_min_var.get() * 60
-                self.status_label.config(text="Break Time! Rest your mind.")
-                messagebox.showinfo("Session Complete", "Work session complete! Time for a break.")
+            self.session_store.record(finished, self.timer_subject, duration)
+            if finished == "work":
+                self.log_session_event("Work session complete")
+                message = ("Session Complete", "Work session complete! Time for a break.")
+            else:
+                self.log_session_event("Break complete")
+                message = ("Break Complete", "Break time over! Ready to focus again?")
+            self.update_timer_view()
+            messagebox.showinfo(*message)
+            return
+        self.update_time_display()
+        if self.study_timer.running:
+            self.schedule_timer_tick()
+
+    def timer_view_visible(self):
+        return (self.time_display is not None and self.time_display.winfo_exists()
+                and self.time_display.winfo_ismapped())
+
+    def update_timer_view(self):
+        """Sync labels and buttons of the timer screen with the timer service"""
+        if not (self.time_display is not None and self.time_display.winfo_exists()):
+            return
+        timer = self.study_timer
+        if timer.running:
+            status = "Work Session" if timer.session_type == "work" else "Break Time! Rest your mind."
+            self.start_button.config(state="disabled")
+            self.pause_button.config(state="normal")
+        else:
+            fresh = timer.paused_remaining == timer.duration()
+            if fresh and timer.session_type == "break":
+                status = "Break Time! Rest your mind."
+            elif fresh:
+                status = "Ready to start"
             else:
-                self.current_session_type = "work"
-                self.remaining_seconds = self.work_min_var.get() * 60
-                self.status_label.config(text="Work Session")
-                messagebox.showinfo("Break Complete", "Break time over! Ready to focus again?")
-            self.update_time_display()
-            self.start_button.config(state="normal", text="Start")
+                status = "Paused"
+            self.start_button.config(state="normal", text="Start" if fresh else "Resume")
             self.pause_button.config(state="disabled")
+        self.status_label.config(text=status)
+        self.update_time_display(force=True)
+        self.update_study_stats()
+
+    def update_study_stats(self):
+        store = self.session_store
+        text = (f"Today: {store.total('day') / 60:.0f} min   "
+                f"This week: {store.total('week') / 60:.0f} min")
+        subjects = store.subject_totals()[:3]
+        if subjects:
+            text += "   Top: " + ", ".join(f"{name} {seconds / 3600:.1f} h" for name, seconds in subjects)
+        self.stats_label.config(text=text)
 
-    def update_time_display(self):
-        minutes, seconds = divmod(self.remaining_seconds, 60)
+    def update_time_display(self, force=False):
+        # Skip redraws while the timer screen is not shown
+        if not (force or self.timer_view_visible()):
+            return
+        minutes, seconds = divmod(self.study_timer.display_seconds(), 60)
         self.time_display.config(text=f"{minutes:02d}:{seconds:02d}")
     
-    def show_todo_list(self):
-        # Clear main content area
-        for widget in self.root.grid_slaves(row=0, column=1):
-            if widget:
-                widget.destroy()
-
+    def build_todo_list(self, parent):
         # Main frame
-        main_frame = tk.Frame(self.root, bg=self.theme["bg_primary"], padx=30, pady=30)
-        main_frame.grid(row=0, column=1, sticky="nsew")
+        main_frame = self.theme.create(tk.Frame, parent, bg="bg_primary", padx=30, pady=30)
 
         # Title
-        title = tk.Label(main_frame, text="To-Do List", 
-                        font=("Arial", 16, "bold"), bg=self.theme["bg_primary"], fg=self.accent_color)
+        title = self.theme.create(tk.Label, main_frame, text="To-Do List", 
+                        font=("Arial", 16, "bold"), bg="bg_primary", fg="accent")
         title.pack(pady=10)
 
         # Task input area
-        input_frame = tk.Frame(main_frame, bg=self.theme["bg_primary"])
+        input_frame = self.theme.create(tk.Frame, main_frame, bg="bg_primary")
         input_frame.pack(fill="x", pady=20)
 
-        task_label = tk.Label(input_frame, text="New Task:", 
-                            font=("Arial", 12), bg=self.theme["bg_primary"], fg=self.theme["text_primary"])
+        task_label = self.theme.create(tk.Label, input_frame, text="New Task:", 
+                            font=("Arial", 12), bg="bg_primary", fg="text_primary")
         task_label.pack(side="left", padx=5)
 
-        self.task_entry = tk.Entry(input_frame, font=("Arial", 12), width=30,
-                                 bg=self.theme["input_bg"], fg=self.theme["input_text"])
+        self.task_entry = self.theme.create(tk.Entry, input_frame, font=("Arial", 12), width=30,
+                                 bg="input_bg", fg="input_text")
         self.task_entry.pack(side="left", padx=10, fill="x", expand=True)
         self.task_entry.bind("<Return>", lambda event: self.add_task())
 
-        add_button = tk.Button(input_frame, text="Add Task", 
+        add_button = self.theme.create(tk.Button, input_frame, text="Add Task", 
                              command=self.add_task,
-                             bg=self.accent_color, fg=self.theme["text_inverse"],
+                             bg="accent", fg="text_inverse",
                              font=("Arial", 12),
                              padx=10, pady=5)
         add_button.pack(side="left", padx=5)
 
-        # Task list area with scrollbar
-        task_frame = tk.Frame(main_frame, bg=self.theme["bg_secondary"], bd=1, relief="solid")
+        # Search, filter and sort controls
+        filter_frame = self.theme.create(tk.Frame, main_frame, bg="bg_primary")
+        filter_frame.pack(fill="x")
+
+        self.theme.create(tk.Label, filter_frame, text="Search:", font=("Arial", 11),
+                 bg="bg_primary", fg="text_primary").pack(side="left", padx=5)
+        self.task_search_var = tk.StringVar()
+        search_entry = self.theme.create(tk.Entry, filter_frame, textvariable=self.task_search_var, font=("Arial", 11), width=20,
+                                bg="input_bg", fg="input_text")
+        search_entry.pack(side="left", padx=5)
+
+        self.task_status_var = tk.StringVar(value="All")
+        status_box = ttk.Combobox(filter_frame, textvariable=self.task_status_var, state="readonly", width=6,
+                                  values=["All", "Open", "Done"], style="EduPal.TCombobox")
+        status_box.pack(side="left", padx=5)
+
+        self.task_sort_var = tk.StringVar(value="Created")
+        sort_box = ttk.Combobox(filter_frame, textvariable=self.task_sort_var, state="readonly", width=8,
+                                values=list(TASK_SORT_LABELS), style="EduPal.TCombobox")
+        sort_box.pack(side="left", padx=5)
+
+        self.task_count_label = self.theme.create(tk.Label, filter_frame, font=("Arial", 11),
+                                         bg="bg_primary", fg="text_secondary")
+        self.task_count_label.pack(side="right", padx=5)
+
+        self.task_search_var.trace_add("write", lambda *args: self.refresh_task_view())
+        status_box.bind("<<ComboboxSelected>>", lambda event: self.refresh_task_view())
+        sort_box.bind("<<ComboboxSelected>>", lambda event: self.refresh_task_view())
+
+        # Task list area; only the visible rows exist as widgets
+        task_frame = self.theme.create(tk.Frame, main_frame, bg="bg_secondary", bd=1, relief="solid")
         task_frame.pack(fill="both", expand=True, pady=10)
 
-        # Canvas and scrollbar setup for scrolling
-        task_canvas = tk.Canvas(task_frame, bg=self.theme["bg_secondary"], highlightthickness=0)
-        task_scrollbar = tk.Scrollbar(task_frame, orient="vertical", command=task_canvas.yview)
-        task_scrollbar.pack(side="right", fill="y")
-        task_canvas.pack(side="left", fill="both", expand=True)
-        task_canvas.configure(yscrollcommand=task_scrollbar.set)
+        self.task_list = VirtualList(task_frame, TASK_ROW_HEIGHT, self.make_task_row, self.fill_task_row)
+        self.theme.bind(self.task_list.frame, bg="bg_secondary")
+        self.theme.bind(self.task_list.body, bg="bg_secondary")
+        self.task_list.frame.pack(fill="both", expand=True)
 
-        # Frame to hold the tasks inside the canvas
-        self.tasks_container = tk.Frame(task_canvas, bg=self.theme["bg_secondary"])
-        task_canvas.create_window((0, 0), window=self.tasks_container, anchor="nw", tags="self.tasks_container")
-        self.tasks_container.bind("<Configure>", lambda e: task_canvas.configure(scrollregion=task_canvas.bbox("all")))
+        # Bulk actions
+        actions_frame = self.theme.create(tk.Frame, main_frame, bg="bg_primary")
+        actions_frame.pack(pady=20)
 
         # Button to clear completed tasks
-        clear_button = tk.Button(main_frame, text="Clear Completed Tasks", 
+        clear_button = self.theme.create(tk.Button, actions_frame, text="Clear Completed Tasks", 
                                command=self.clear_completed_tasks,
-                               bg=self.theme["bg_secondary"], fg=self.accent_color,
+                               bg="bg_secondary", fg="accent",
                                font=("Arial", 12),
                                padx=10, pady=5)
-        clear_button.pack(pady=20)
+        clear_button.pack(side="left", padx=5)
+
+        for text, command in (("Import...", self.import_tasks), ("Export...", self.export_tasks)):
+            self.theme.create(tk.Button, actions_frame, text=text, command=command,
+                      bg="bg_secondary", fg="accent",
+                      font=("Arial", 12), padx=10, pady=5).pack(side="left", padx=5)
 
-        # Load saved tasks
-        self.load_tasks()
+        return main_frame
 
     def add_task(self):
         task_text = self.task_entry.get().strip()
         if task_text:
-            # Create task frame 
-            task_frame = tk.Frame(self.tasks_container, bg=self.theme["bg_secondary"], bd=1, relief="solid", padx=5, pady=5)
-            task_frame.pack(fill="x", pady=2)
-            
-            # Variable to store check state
-            check_var = tk.BooleanVar()
-            
-            # Task checkbox - FIXED to not call clear_task directly, which was causing the single-task selection issue
-            checkbox = tk.Checkbutton(task_frame, variable=check_var, 
-                                     bg=self.theme["bg_secondary"], 
-                                     selectcolor=self.theme["input_bg"],
-                                     command=lambda: self.update_task_state(task_frame, check_var.get(), task_label))
-            checkbox.pack(side="left")
-            
-            # Task text
-            task_label = tk.Label(task_frame, text=task_text, wraplength=400, justify="left",
-                                font=("Arial", 12), bg=self.theme["bg_secondary"], fg=self.theme["text_primary"])
-            task_label.pack(side="left", padx=5, fill="x", expand=True)
-            
-            # Delete button
-            delete_btn = tk.Button(task_frame, text="×", font=("Arial", 12, "bold"),
-                                         command=lambda tf=task_frame: self.delete_task(tf),
-                                         bg=self.theme["bg_secondary"], fg="red", 
-                                         borderwidth=0, padx=5)
-            delete_btn.pack(side="right")
-            
-            # Add to tasks list with various properties
-            task_frame.task_text = task_text
-            task_frame.check_var = check_var
-            task_frame.task_label = task_label
-            
+            self.task_model.add(task_text)
+            self.refresh_task_view()
+            if self.task_sort_var.get() == "Created":
+                self.task_list.scroll_pixels(self.task_list.max_offset())
+
             # Clear entry field
             self.task_entry.delete(0, tk.END)
-            
-            # Save task list
-            self.save_tasks()
-    
-    def update_task_state(self, task_frame, is_checked, task_label):
-        """Update the task state when checkbox is clicked"""
-        if is_checked:
+
+    def make_task_row(self, parent):
+        """Build one recyclable to-do row; fill_task_row binds it to a task"""
+        row = self.theme.create(tk.Frame, parent, bg="bg_secondary", bd=1, relief="solid", padx=5)
+        row.task_id = None
+        row.check_var = tk.BooleanVar()
+
+        # Task checkbox - using update_task_state to allow multiple selections
+        checkbox = self.theme.create(tk.Checkbutton, row, variable=row.check_var, 
+                                 bg="bg_secondary", 
+                                 selectcolor="input_bg",
+                                 command=lambda: self.update_task_state(row))
+        checkbox.pack(side="left")
+
+        # Task text
+        row.task_label = self.theme.create(tk.Label, row, anchor="w", font=("Arial", 12),
+                                  bg="bg_secondary", fg="text_primary")
+        row.task_label.pack(side="left", padx=5, fill="x", expand=True)
+
+        # Delete button
+        delete_btn = self.theme.create(tk.Button, row, text="×", font=("Arial", 12, "bold"),
+                             command=lambda: self.delete_task(row),
+                             bg="bg_secondary", fg="red", 
+                             borderwidth=0, padx=5)
+        delete_btn.pack(side="right")
+        return row
+
+    def fill_task_row(self, row, task_id):
+        task = self.task_model.get(task_id)
+        row.task_id = task_id
+        row.check_var.set(task.completed)
+        if task.completed:
             # Strike through text when checked
-            task_label.configure(font=("Arial", 12, "overstrike"), fg=self.theme["text_secondary"])
+            row.task_label.configure(text=task.text, font=("Arial", 12, "overstrike"))
+            self.theme.bind(row.task_label, fg="text_secondary")
         else:
-            # Normal text when unchecked
-            task_label.configure(font=("Arial", 12), fg=self.theme["text_primary"])
-        
-        # Save tasks after state change
-        self.save_tasks()
+            row.task_label.configure(text=task.text, font=("Arial", 12))
+            self.theme.bind(row.task_label, fg="text_primary")
+
+    def update_task_state(self, row):
+        """Update the task state when checkbox is clicked"""
+        self.task_model.set_completed(row.task_id, row.check_var.get())
+        if self.task_status_var.get() == "All":
+            self.fill_task_row(row, row.task_id)
+            self.update_task_counts()
+        else:
+            # The task no longer matches the Open/Done filter
+            self.refresh_task_view()
 
-    def delete_task(self, task_frame):
-        task_frame.destroy()
-        self.save_tasks()
+    def delete_task(self, row):
+        self.task_model.delete(row.task_id)
+        self.refresh_task_view()
 
     def clear_completed_tasks(self):
         # Remove all checked tasks
-        for task_frame in self.tasks_container.winfo_children():
-            if hasattr(task_frame, 'check_var') and task_frame.check_var.get():
-                task_frame.destroy()
-        
-        # Save tasks
-        self.save_tasks()
-
-    def save_tasks(self):
-        tasks = []
-        for task_frame in self.tasks_container.winfo_children():
-            if hasattr(task_frame, 'task_text'):
-                tasks.append({
-                    "text": task_frame.task_text,
-                    "completed": task_frame.check_var.get()
-                })
-                
-        # Save to file
-        try:
-            with open("todo_list.json", "w") as f:
-                json.dump(tasks, f)
-        except Exception as e:
-            print(f"Error saving tasks: {e}")
+        self.task_model.clear_completed()
+        self.refresh_task_view()
+
+    def refresh_task_view(self):
+        view = self.task_model.view(status=self.task_status_var.get().lower(),
+                                    sort=TASK_SORT_LABELS[self.task_sort_var.get()],
+                                    query=self.task_search_var.get())
+        self.task_list.set_items(view)
+        self.update_task_counts()
+
+    def update_task_counts(self):
+        if not self.task_model.ready:
+            self.task_count_label.config(text=f"{len(self.task_list.items)} tasks, sorting...")
+            return
+        open_count, done_count = self.task_model.counts()
+        self.task_count_label.config(text=f"{open_count} open, {done_count} done")
+
+    def import_tasks(self):
+        """Stream a CSV/JSON Lines file into the task store on a worker thread"""
+        path = filedialog.askopenfilename(title="Import Tasks", filetypes=TASK_FILE_TYPES)
+        if not path:
+            return
+
+        def show_progress(fraction):
+            if "todo" in self.screens.frames:
+                self.task_count_label.config(text=f"Importing... {fraction:.0%}")
+
+        def import_file(job):
+            records = read_task_file(path, progress=lambda fraction: self.jobs.post(job, show_progress, fraction))
+            return self.task_store.add_many(records, cancelled=lambda: job.cancelled)
+
+        def imported(task_ids):
+            if self.task_model is not None and len(task_ids) <= TaskModel.MAX_INCREMENTAL:
+                self.task_model.add_loaded(task_ids)
+            if "todo" in self.screens.frames:
+                self.load_tasks()  # Rebuilds the model in the background if it missed the import
+            messagebox.showinfo("Import Tasks", f"Imported {len(task_ids)} tasks.")
+
+        def failed(error):
+            if "todo" in self.screens.frames:
+                self.update_task_counts()
+            messagebox.showerror("Import Tasks", f"Import failed, no tasks were added:\n{error}")
+
+        # Not owned by the screen, so leaving the to-do list does not abort the import
+        self.jobs.submit(import_file, key="task-import", priority=JobScheduler.PRIORITY_BULK,
+                         on_done=imported, on_error=failed)
+
+    def export_tasks(self):
+        path = filedialog.asksaveasfilename(title="Export Tasks", defaultextension=".csv",
+                                            filetypes=TASK_FILE_TYPES)
+        if not path:
+            return
+        self.jobs.submit(lambda job: write_task_file(path, self.task_store), key="task-export",
+                         priority=JobScheduler.PRIORITY_BULK,
+                         on_done=lambda count: messagebox.showinfo("Export Tasks", f"Exported {count} tasks."),
+                         on_error=lambda error: messagebox.showerror("Export Tasks", f"Export failed:\n{error}"))
 
     def load_tasks(self):
-        try:
-            if os.path.exists("todo_list.json"):
-                with open("todo_list.json", "r") as f:
-                    tasks = json.load(f)
-                    
-                for task in tasks:
-                    # Create task frame 
-                    task_frame = tk.Frame(self.tasks_container, bg=self.theme["bg_secondary"], bd=1, relief="solid", padx=5, pady=5)
-                    task_frame.pack(fill="x", pady=2)
-                    
-                    # Variable to store check state
-                    check_var = tk.BooleanVar(value=task["completed"])
-                    
-                    # Task checkbox - using update_task_state to allow multiple selections
-                    checkbox = tk.Checkbutton(task_frame, variable=check_var, 
-                                           bg=self.theme["bg_secondary"], 
-                                           selectcolor=self.theme["input_bg"])
-                    checkbox.pack(side="left")
-                    
-                    # Task text
-                    task_label = tk.Label(task_frame, text=task["text"], wraplength=400, justify="left",
-                                        font=("Arial", 12), bg=self.theme["bg_secondary"], fg=self.theme["text_primary"])
-                    task_label.pack(side="left", padx=5, fill="x", expand=True)
-                    
-                    # Delete button
-                    delete_btn = tk.Button(task_frame, text="×", font=("Arial", 12, "bold"),
-                                         command=lambda tf=task_frame: self.delete_task(tf),
-                                         bg=self.theme["bg_secondary"], fg="red", 
-                                         borderwidth=0, padx=5)
-                    delete_btn.pack(side="right")
-                    
-                    # Add to tasks list with various properties
-                    task_frame.task_text = task["text"]
-                    task_frame.check_var = check_var
-                    task_frame.task_label = task_label
-                    
-                    # Set initial state (strikethrough if completed)
-                    if task["completed"]:
-                        task_label.configure(font=("Arial", 12, "overstrike"), fg=self.theme["text_secondary"])
-                    
-                    # Configure the command after all attributes are set
-                    checkbox.configure(command=lambda tf=task_frame, cv=check_var, tl=task_label: 
-                                      self.update_task_state(tf, cv.get(), tl))
-                    
-        except Exception as e:
-            print(f"Error loading tasks: {e}")
-    
-    def show_theme_settings(self):
-        # Clear main content area
-        for widget in self.root.grid_slaves(row=0, column=1):
-            if widget:
-                widget.destroy()
+        if self.task_model is None:
+            # Show the tasks in creation order at once; sorting 100k takes a while
+            self.task_model = UnindexedTasks(self.task_store)
+        if not self.task_model.in_sync():
+            self.build_task_model()
+        self.refresh_task_view()
 
+    def build_task_model(self):
+        """Index the to-do list on a worker and switch the view over when done"""
+        def built(model):
+            if not model.in_sync():
+                self.build_task_model()  # Tasks changed while indexing
+                return
+            self.task_model = model
+            self.refresh_task_view()
+
+        self.jobs.submit(lambda job: TaskModel(self.task_store), owner="todo", key="task-model",
+                         on_done=built, on_error=lambda e: print(f"Error indexing tasks: {e}"))
+
+    def build_theme_settings(self, parent):
         # Create a frame for theme settings
-        theme_frame = tk.Frame(self.root, bg=self.theme["bg_primary"], padx=20, pady=20)
-        theme_frame.grid(row=0, column=1, sticky="nsew")
+        theme_frame = self.theme.create(tk.Frame, parent, bg="bg_primary", padx=20, pady=20)
 
         # Title
-        title = tk.Label(theme_frame, text="Theme Settings ", 
-                        font=("Arial", 16, "bold"), bg=self.theme["bg_primary"], fg=self.accent_color)
+        title = self.theme.create(tk.Label, theme_frame, text="Theme Settings ", 
+                        font=("Arial", 16, "bold"), bg="bg_primary", fg="accent")
         title.pack(pady=10)
         
         # Modern container with rounded corners effect
-        theme_container = tk.Frame(theme_frame, bg=self.theme["bg_secondary"], padx=25, pady=25, bd=0, relief="flat")
+        theme_container = self.theme.create(tk.Frame, theme_frame, bg="bg_secondary", padx=25, pady=25, bd=0, relief="flat")
         theme_container.pack(fill="both", expand=True, padx=20, pady=20)
         
         # Add a separator for visual appeal
-        separator = ttk.Separator(theme_container, orient="horizontal")
+        separator = ttk.Separator(theme_container, orient="horizontal", style="EduPal.TSeparator")
         separator.pack(fill="x", pady=20)
         
         # Dark mode toggle with improved styling
-        dark_mode_frame = tk.Frame(theme_container, bg=self.theme["bg_secondary"])
+        dark_mode_frame = self.theme.create(tk.Frame, theme_container, bg="bg_secondary")
         dark_mode_frame.pack(fill="x", pady=10)
         
-        dark_mode_label = tk.Label(dark_mode_frame, text="Dark Mode:", 
-                                font=("Arial", 14, "bold"), bg=self.theme["bg_secondary"], fg=self.theme["text_primary"])
+        dark_mode_label = self.theme.create(tk.Label, dark_mode_frame, text="Dark Mode:", 
+                                font=("Arial", 14, "bold"), bg="bg_secondary", fg="text_primary")
         dark_mode_label.pack(side="left", pady=5)
         
-        self.dark_mode_var = tk.BooleanVar(value=self.is_dark_mode)
-        dark_mode_check = tk.Checkbutton(dark_mode_frame, 
+        self.dark_mode_var = tk.BooleanVar(value=self.theme.dark)
+        dark_mode_check = self.theme.create(tk.Checkbutton, dark_mode_frame, 
                                         variable=self.dark_mode_var,
                                         onvalue=True, offvalue=False,
-                                        bg=self.theme["bg_secondary"], fg=self.theme["text_primary"],
-                                        selectcolor=self.theme["bg_secondary"],
+                                        bg="bg_secondary", fg="text_primary",
+                                        selectcolor="bg_secondary",
                                         command=self.preview_theme_change)
         dark_mode_check.pack(side="left", padx=10)
         
         # Add a visual indicator
-        self.dark_mode_indicator = tk.Canvas(dark_mode_frame, width=30, height=15, bg=self.theme["bg_secondary"], 
+        self.dark_mode_indicator = self.theme.create(tk.Canvas, dark_mode_frame, width=30, height=15, bg="bg_secondary", 
                                            highlightthickness=0)
         self.dark_mode_indicator.pack(side="left", padx=5)
         self.update_dark_mode_indicator()
+        self.theme.on_change("dark_mode_indicator", self.update_dark_mode_indicator)
         
         # Color picker section with improved layout
-        color_label = tk.Label(theme_container, text="Accent Color:", 
-                          font=("Arial", 14, "bold"), bg=self.theme["bg_secondary"], fg=self.theme["text_primary"])
+        color_label = self.theme.create(tk.Label, theme_container, text="Accent Color:", 
+                          font=("Arial", 14, "bold"), bg="bg_secondary", fg="text_primary")
         color_label.pack(anchor="w", pady=(20, 10))
         
         # Color sample - larger and more prominent
-        self.color_sample = tk.Canvas(theme_container, width=200, height=40, bg=self.accent_color, highlightthickness=1, 
-                                    highlightbackground=self.theme["text_secondary"])
+        self.color_sample = self.theme.create(tk.Canvas, theme_container, width=200, height=40, bg="accent", highlightthickness=1, 
+                                    highlightbackground="text_secondary")
         self.color_sample.pack(pady=10)
         
         # Predefined colors in a grid layout
-        presets_frame = tk.Frame(theme_container, bg=self.theme["bg_secondary"])
+        presets_frame = self.theme.create(tk.Frame, theme_container, bg="bg_secondary")
         presets_frame.pack(fill="x", pady=20)
         
-        presets_label = tk.Label(presets_frame, text="Preset Colors:", 
-                           font=("Arial", 12, "bold"), bg=self.theme["bg_secondary"], fg=self.theme["text_primary"])
+        presets_label = self.theme.create(tk.Label, presets_frame, text="Preset Colors:", 
+                           font=("Arial", 12, "bold"), bg="bg_secondary", fg="text_primary")
         presets_label.pack(anchor="w")
         
-        colors_frame = tk.Frame(presets_frame, bg=self.theme["bg_secondary"])
+        colors_frame = self.theme.create(tk.Frame, presets_frame, bg="bg_secondary")
         colors_frame.pack(pady=10)
         
         preset_colors = [
@@ -1274,34 +5249,38 @@ class EduPal:
             color_btn.grid(row=i//4, column=i%4, padx=5, pady=5)
         
         # Custom color button with improved styling
-        custom_btn = tk.Button(theme_container, text="Choose Custom Color", 
+        custom_btn = self.theme.create(tk.Button, theme_container, text="Choose Custom Color", 
                          command=self.choose_custom_color,
                          font=("Arial", 12),
-                         bg=self.accent_color, fg=self.theme["text_inverse"])
+                         bg="accent", fg="text_inverse")
         custom_btn.pack(pady=20)
         
         # Buttons container for better spacing
-        button_container = tk.Frame(theme_container, bg=self.theme["bg_secondary"])
+        button_container = self.theme.create(tk.Frame, theme_container, bg="bg_secondary")
         button_container.pack(fill="x", pady=10)
         
         # Apply button with modern styling
-        apply_btn = tk.Button(button_container, text="Apply Theme", 
+        apply_btn = self.theme.create(tk.Button, button_container, text="Apply Theme", 
                         command=self.apply_theme,
                         font=("Arial", 14, "bold"),
-                        bg=self.accent_color, fg=self.theme["text_inverse"],
+                        bg="accent", fg="text_inverse",
                         padx=20, pady=10)
         apply_btn.pack(side="left", padx=(0, 10))
         
         # Reset button with better contrast
-        reset_btn = tk.Button(button_container, text="Reset to Default", 
+        reset_btn = self.theme.create(tk.Button, button_container, text="Reset to Default", 
                         command=self.reset_theme,
                         font=("Arial", 12),
-                        bg=self.theme["bg_secondary"], fg=self.theme["text_primary"],
+                        bg="bg_secondary", fg="text_primary",
                         padx=10, pady=5)
         reset_btn.pack(side="left")
+
+        return theme_frame
     
     def update_dark_mode_indicator(self):
         """Update the visual indicator for dark mode"""
+        if not self.dark_mode_indicator.winfo_exists():
+            return
         self.dark_mode_indicator.delete("all")
         if self.dark_mode_var.get():
             # Dark mode - draw moon icon
@@ -1312,187 +5291,55 @@ class EduPal:
             self.dark_mode_indicator.create_oval(8, 2, 18, 12, fill="#FFC107", outline="")
             
     def preview_theme_change(self):
-        """Preview dark/light mode changes without fully applying theme"""
-        self.is_dark_mode = self.dark_mode_var.get()
-        if self.is_dark_mode:
-            self.theme = self.dark_theme.copy()
-        else:
-            self.theme = self.light_theme.copy()
-        
-        # Update just the theme settings screen
-        for widget in self.root.grid_slaves(row=0, column=1):
-            self.update_widget_colors(widget)
-            
-        self.update_dark_mode_indicator()
+        """Preview dark/light mode changes without saving them"""
+        self.theme.set_palette(dark=self.dark_mode_var.get())
     
     def choose_custom_color(self):
-        color = colorchooser.askcolor(initialcolor=self.accent_color)
+        color = colorchooser.askcolor(initialcolor=self.theme.accent)
         if color[1]:  # If color is chosen (not cancelled)
             self.change_theme_color(color[1])
     
     def change_theme_color(self, color):
-        self.accent_color = color
+        # Recolouring is cheap now, so the accent previews live
+        self.theme.set_palette(accent=color)
         self.color_sample.config(bg=color)
     
     def apply_theme(self):
-        # Update settings with current theme
-        self.settings["accent_color"] = self.accent_color
-        self.settings["dark_mode"] = self.is_dark_mode
-        
-        # Update color variables based on theme
-        if self.is_dark_mode:
-            self.theme = self.dark_theme.copy()
-        else:
-            self.theme = self.light_theme.copy()
-            
+        # Update settings with current theme; widgets already show it
+        self.settings["accent_color"] = self.theme.accent
+        self.settings["dark_mode"] = self.theme.dark
         self.save_settings()
         
-        # Apply to root
-        self.root.configure(bg=self.theme["bg_primary"])
-        
-        # Apply to all widgets
-        self.update_widget_colors(self.root)
-        
-        # Force a restart of the current screen to apply all changes correctly
-        current_screen = self.root.grid_slaves(row=0, column=1)
-        if current_screen:
-            # Store which screen we're on
-            if hasattr(current_screen[0], '_name'):
-                current_screen_name = current_screen[0]._name
-                if 'theme' in current_screen_name:
-                    self.show_theme_settings()
-                elif 'essay' in current_screen_name:
-                    self.show_essay_writer()
-                elif 'study' in current_screen_name:
-                    self.show_study_buddy()
-                elif 'timer' in current_screen_name:
-                    self.show_study_timer()
-                elif 'todo' in current_screen_name:
-                    self.show_todo_list()
-                else:
-                    self.show_dashboard()
-            else:
-                # If we can't determine the screen, just go to dashboard
-                self.show_dashboard()
-        else:
-            # If no screen detected, go to dashboard
-            self.show_dashboard()
-        
         # Show success message
         messagebox.showinfo("Theme Applied", "Theme settings have been applied successfully!")
 
-    def update_widget_colors(self, parent):
-        """Recursively update all widget colors based on current theme"""
-        for widget in parent.winfo_children():
-            try:
-                # Update based on widget type
-                if isinstance(widget, tk.Frame) or isinstance(widget, ttk.Frame):
-                    widget.configure(bg=self.theme["bg_primary"])
-                    
-                elif isinstance(widget, tk.LabelFrame):
-                    widget.configure(bg=self.theme["bg_primary"], fg=self.theme["text_primary"])
-                    
-                elif isinstance(widget, tk.Label):
-                    widget.configure(bg=self.theme["bg_primary"], fg=self.theme["text_primary"])
-                    # Special handling for headings
-                    if "bold" in str(widget["font"]):
-                        # Only set accent color for headings that are direct children of frames
-                        if widget.winfo_parent() and ("frame" in widget.winfo_parent().lower() or widget.winfo_parent().endswith("!frame")):
-                            if "!labelframe" not in widget.winfo_parent().lower():  # Don't override LabelFrame titles
-                                widget.configure(fg=self.accent_color)
-                        
-                elif isinstance(widget, tk.Button):
-                    # Check if it's an accent button or regular button
-                    if widget["bg"] == self.accent_color or widget["bg"] == "#FF5722" or widget["bg"] == "#4CAF50":
-                        # Keep accent buttons with their colors
-                        widget.configure(fg=self.theme["text_inverse"])
-                    else:
-                        # Regular buttons get theme colors
-                        widget.configure(bg=self.theme["bg_secondary"], fg=self.theme["text_primary"])
-                        
-                elif isinstance(widget, tk.Entry) or isinstance(widget, tk.Spinbox):
-                    widget.configure(bg=self.theme["input_bg"], fg=self.theme["input_text"],
-                                    insertbackground=self.theme["text_primary"])
-                    
-                elif isinstance(widget, tk.Text):
-                    widget.configure(bg=self.theme["input_bg"], fg=self.theme["input_text"],
-                                    insertbackground=self.theme["text_primary"])
-                    
-                    # Special configuration for chat history and session logs
-                    if "chat_history" in str(widget) or "session_log" in str(widget):
-                        if self.is_dark_mode:
-                            widget.tag_configure("sender", foreground="#7ADBFC")  # Light blue
-                            widget.tag_configure("message", foreground="#E8E8E8")  # Light text
-                            widget.tag_configure("heading", foreground="#7ADBFC")  # Light blue
-                            widget.tag_configure("timestamp", foreground="#BBBBBB")  # Gray text
-                        else:
-                            widget.tag_configure("sender", foreground="#0066CC")  # Dark blue
-                            widget.tag_configure("message", foreground="#333333")  # Dark text
-                            widget.tag_configure("heading", foreground="#0066CC")  # Dark blue
-                            widget.tag_configure("timestamp", foreground="#666666")  # Gray text
-                    
-                elif isinstance(widget, tk.Checkbutton) or isinstance(widget, tk.Radiobutton):
-                    widget.configure(bg=self.theme["bg_primary"], fg=self.theme["text_primary"],
-                                   selectcolor=self.theme["bg_secondary"])
-                    
-                elif isinstance(widget, tk.Canvas):
-                    widget.configure(bg=self.theme["bg_primary"])
-                    
-                elif isinstance(widget, tk.Listbox):
-                    widget.configure(bg=self.theme["input_bg"], fg=self.theme["input_text"],
-                                    selectbackground=self.accent_color, selectforeground=self.theme["text_inverse"])
-                    
-                # Handle ttk widgets by updating the style
-                elif isinstance(widget, ttk.Treeview):
-                    style = ttk.Style()
-                    style.configure("Treeview", 
-                                    background=self.theme["input_bg"], 
-                                    foreground=self.theme["input_text"],
-                                    fieldbackground=self.theme["input_bg"])
-                    style.map('Treeview', 
-                            background=[('selected', self.accent_color)],
-                            foreground=[('selected', self.theme["text_inverse"])])
-                    
-                # Recursively update any children
-                self.update_widget_colors(widget)
-                
-            except Exception as e:
-                # Skip widgets that can't be configured
-                continue
-    
     def reset_theme(self):
-        self.change_theme_color("#2A7FFF")
-        self.is_dark_mode = False
-        self.theme = self.light_theme.copy()
+        self.dark_mode_var.set(False)
+        self.theme.set_palette(dark=False, accent=ThemeManager.DEFAULT_ACCENT)
+        self.color_sample.config(bg=self.theme.accent)
+        self.settings["accent_color"] = self.theme.accent
         self.settings["dark_mode"] = False
         self.save_settings()
-        self.show_dashboard()
     
-    def show_calculator(self):
-        # Clear main content area
-        for widget in self.root.grid_slaves(row=0, column=1):
-            if widget:
-                widget.destroy()
-
+    def build_calculator(self, parent):
         # Create a frame for the calculator
-        calculator_frame = tk.Frame(self.root, bg=self.theme["bg_primary"], padx=20, pady=20)
-        calculator_frame.grid(row=0, column=1, sticky="nsew")
+        calculator_frame = self.theme.create(tk.Frame, parent, bg="bg_primary", padx=20, pady=20)
 
         # Title
-        title = tk.Label(calculator_frame, text="Calculator", 
-                       font=("Arial", 16, "bold"), bg=self.theme["bg_primary"], fg=self.accent_color)
+        title = self.theme.create(tk.Label, calculator_frame, text="Calculator", 
+                       font=("Arial", 16, "bold"), bg="bg_primary", fg="accent")
         title.pack(pady=10)
 
         # Entry field
-        entry_frame = tk.Frame(calculator_frame, bg=self.theme["bg_primary"])
+        entry_frame = self.theme.create(tk.Frame, calculator_frame, bg="bg_primary")
         entry_frame.pack(pady=10)
 
-        self.calc_entry = tk.Entry(entry_frame, font=('Arial', 16), width=30,
-                                 bg=self.theme["input_bg"], fg=self.theme["input_text"])
+        self.calc_entry = self.theme.create(tk.Entry, entry_frame, font=('Arial', 16), width=30,
+                                 bg="input_bg", fg="input_text")
         self.calc_entry.pack(side="left")
 
         # Button frame
-        button_frame = tk.Frame(calculator_frame, bg=self.theme["bg_primary"])
+        button_frame = self.theme.create(tk.Frame, calculator_frame, bg="bg_primary")
         button_frame.pack(pady=10)
 
         buttons = [
@@ -1507,10 +5354,127 @@ class EduPal:
                       command=lambda t=text: self.calc_button_click(t)) \
                 .grid(row=row, column=col, padx=2, pady=2)
 
+        # Function tabulation and plotting
+        plot_frame = self.theme.create(tk.LabelFrame, calculator_frame, text="Function Plot",
+                                 font=("Arial", 12, "bold"), bg="bg_primary",
+                                 fg="text_primary")
+        plot_frame.pack(fill="both", expand=True, pady=10)
+
+        plot_inputs = self.theme.create(tk.Frame, plot_frame, bg="bg_primary")
+        plot_inputs.pack(fill="x", padx=10, pady=5)
+
+        self.plot_vars = {}
+        for label, key, default, width in [("f(x) =", "expression", "sin(x) * x^2", 20), ("from", "x_min", "-10", 6),
+                                           ("to", "x_max", "10", 6), ("points", "points", "100000", 9)]:
+            self.theme.create(tk.Label, plot_inputs, text=label, font=("Arial", 11),
+                     bg="bg_primary", fg="text_primary").pack(side="left", padx=(5, 2))
+            self.plot_vars[key] = tk.StringVar(value=default)
+            self.theme.create(tk.Entry, plot_inputs, textvariable=self.plot_vars[key], width=width, font=("Arial", 11),
+                     bg="input_bg", fg="input_text").pack(side="left")
+
+        self.theme.create(tk.Button, plot_inputs, text="Plot", command=self.plot_function,
+                  bg="accent", fg="text_inverse",
+                  font=("Arial", 11), padx=10).pack(side="left", padx=10)
+
+        self.plot_status = self.theme.create(tk.Label, plot_frame, text="", font=("Arial", 10),
+                                  bg="bg_primary", fg="text_secondary")
+        self.plot_status.pack(anchor="w", padx=10)
+
+        plot_body = self.theme.create(tk.Frame, plot_frame, bg="bg_primary")
+        plot_body.pack(fill="both", expand=True, padx=10, pady=5)
+
+        self.plot_canvas = self.theme.create(tk.Canvas, plot_body, height=220, bg="input_bg", highlightthickness=0)
+        self.plot_canvas.pack(side="left", fill="both", expand=True)
+
+        self.plot_table = self.theme.create(tk.Text, plot_body, width=26, height=12, font=("Courier", 10),
+                                bg="input_bg", fg="input_text", state="disabled")
+        self.plot_table.pack(side="right", fill="y", padx=(10, 0))
+
+        return calculator_frame
+
+    def plot_function(self):
+        """Tabulate f(x) off the Tk thread, then draw the decimated curve"""
+        try:
+            expression = self.plot_vars["expression"].get()
+            x_min = float(self.plot_vars["x_min"].get())
+            x_max = float(self.plot_vars["x_max"].get())
+            points = int(self.plot_vars["points"].get())
+        except ValueError:
+            self.plot_status.config(text="Range and points must be numbers")
+            return
+        if x_max <= x_min:
+            self.plot_status.config(text="'to' must be greater than 'from'")
+            return
+        width = max(self.plot_canvas.winfo_width(), 100)
+        self.plot_status.config(text=f"Evaluating {points:,} points...")
+
+        def tabulate(job):
+            start = time.perf_counter()
+            xs, ys = self.math_engine.tabulate(expression, x_min, x_max, points)
+            low, high = decimate_for_plot(ys, width)
+            # A short table of evenly spaced samples
+            step = max(1, (points - 1) // 20)
+            table = [(float(xs[i]), float(ys[i])) for i in range(0, points, step)]
+            return low, high, table, time.perf_counter() - start
+
+        def show(result):
+            low, high, table, elapsed = result
+            self.draw_plot(low, high, x_min, x_max)
+            self.plot_table.config(state="normal")
+            self.plot_table.delete("1.0", tk.END)
+            self.plot_table.insert("1.0", "\n".join(f"{x:>10.4g} {y:>12.6g}" for x, y in table))
+            self.plot_table.config(state="disabled")
+            self.plot_status.config(text=f"{points:,} points evaluated in {elapsed * 1000:.0f} ms"
+                                         + ("" if NUMPY_AVAILABLE else " (install NumPy for faster plots)"))
+
+        self.jobs.submit(tabulate, owner="calculator", key="plot",
+                         priority=JobScheduler.PRIORITY_CHAT, on_done=show,
+                         on_error=lambda e: self.plot_status.config(text=f"Error: {e}"))
+
+    def draw_plot(self, low, high, x_min, x_max):
+        """Draw one min/max pair per pixel column, breaking the line at gaps"""
+        canvas = self.plot_canvas
+        canvas.delete("all")
+        width = max(canvas.winfo_width(), 100)
+        height = max(canvas.winfo_height(), 100)
+        finite = [v for v in low + high if math.isfinite(v)]
+        if not finite:
+            return
+        y_min, y_max = min(finite), max(finite)
+        if y_max == y_min:
+            y_min, y_max = y_min - 1, y_max + 1
+        margin = 10
+        scale_x = (width - 1) / max(len(low) - 1, 1)
+        scale_y = (height - 2 * margin) / (y_max - y_min)
+
+        def to_y(value):
+            return height - margin - (value - y_min) * scale_y
+
+        # Axes where they are in view
+        if y_min <= 0 <= y_max:
+            canvas.create_line(0, to_y(0), width, to_y(0), fill=self.theme["text_secondary"], tags="axis")
+        if x_min <= 0 <= x_max:
+            zero_x = (0 - x_min) / (x_max - x_min) * (width - 1)
+            canvas.create_line(zero_x, 0, zero_x, height, fill=self.theme["text_secondary"], tags="axis")
+
+        segment = []
+        for column, (lo, hi) in enumerate(zip(low, high)):
+            if math.isfinite(lo) and math.isfinite(hi):
+                x = column * scale_x
+                segment.extend((x, to_y(lo), x, to_y(hi)))
+                continue
+            if len(segment) >= 4:
+                canvas.create_line(*segment, fill=self.theme["accent"], width=2, tags="curve")
+            segment = []
+        if len(segment) >= 4:
+            canvas.create_line(*segment, fill=self.theme["accent"], width=2, tags="curve")
+        self.theme.bind_tag(canvas, "axis", fill="text_secondary")
+        self.theme.bind_tag(canvas, "curve", fill="accent")
+
     def calc_button_click(self, text):
         if text == '=':
             try:
-                result = eval(self.calc_entry.get())
+                result = self.math_engine.evaluate(self.calc_entry.get())
                 self.calc_entry.delete(0, tk.END)
                 self.calc_entry.insert(0, str(result))
             except Exception as e:
@@ -1522,6 +5486,185 @@ class EduPal:
     def run(self):
         self.root.mainloop()
 
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def run_batch(args):
+    """Generate one essay per topic line without starting the GUI"""
+    config = load_config()
+    # Every request (outline and section calls included) shares one rate and concurrency budget
+    llm = create_llm_gateway(config, limiter=RateLimiter(args.rate, burst=args.workers),
+                             max_concurrent=args.workers)
+    cache = ResponseCache(".edupal_cache")
+    os.makedirs(args.out, exist_ok=True)
+    source = sys.stdin if args.batch == "-" else open(args.batch, 'r', encoding="utf-8")
+
+    latencies = []
+    failures = []
+    lock = threading.Lock()
+    # Bound the number of topics in flight so huge inputs stay in constant memory
+    window = threading.Semaphore(args.workers * 2)
+
+    def generate_one(index, topic):
+        try:
+            start = time.perf_counter()
+            essay_text = generate_essay_text(llm, topic, args.words, not args.no_headers,
+                                             not args.no_bullets, cache=cache, regenerate=args.regenerate,
+                                             sectioned=args.sections, pool=section_pool)
+            elapsed = time.perf_counter() - start
+            slug = "".join(c if c.isalnum() else "_" for c in topic)[:40]
+            filename = os.path.join(args.out, f"essay_{index:04d}_{slug}.txt")
+            with open(filename, "w", encoding="utf-8") as f:
+                f.write(essay_text)
+            with lock:
+                latencies.append(elapsed)
+                print(f"[{index}] {elapsed:.2f}s {filename}", flush=True)
+        except Exception as e:
+            with lock:
+                failures.append((index, topic, str(e)))
+                print(f"[{index}] failed: {topic}: {e}", file=sys.stderr, flush=True)
+        finally:
+            window.release()
+
+    started = time.perf_counter()
+    count = 0
+    # Section requests go to their own pool: topics wait on their sections, so
+    # sharing the topic pool could leave every worker waiting
+    section_pool = ThreadPoolExecutor(max_workers=args.workers) if args.sections else None
+    try:
+        with source, ThreadPoolExecutor(max_workers=args.workers) as pool:
+            for line in source:
+                topic = line.strip()
+                if not topic:
+                    continue
+                count += 1
+                window.acquire()
+                pool.submit(generate_one, count, topic)
+    finally:
+        if section_pool is not None:
+            section_pool.shutdown()
+    wall = time.perf_counter() - started
+
+    print(f"\n{count} topics, {len(latencies)} essays, {len(failures)} failed in {wall:.1f}s "
+          f"({len(latencies) / wall * 60 if wall else 0:.1f} essays/min)")
+    if latencies:
+        print(f"latency avg {sum(latencies) / len(latencies):.2f}s, p50 {percentile(latencies, 0.5):.2f}s, "
+              f"p95 {percentile(latencies, 0.95):.2f}s, max {max(latencies):.2f}s")
+    return 1 if failures else 0
+
+
+def benchmark_llm(args):
+    """Load-test the essay and chat paths against the local fake backend"""
+    config = load_config()
+    fake_options = dict(config.get("fake_llm", {}))
+    fake_options.setdefault("seed", 0)
+    llm = LLMGateway(lambda: FakeLLMBackend(**fake_options), backend_name="fake")
+    topics = ["Photosynthesis", "The water cycle", "World War II", "Climate change", "The Roman Empire"]
+
+    def run(kind, index):
+        topic = topics[index % len(topics)]
+        start = time.perf_counter()
+        if kind == "essay":
+            generate_essay_text(llm, topic, args.words, True, True, sectioned=args.sections)
+        elif kind == "stream":
+            # Measure time to first chunk for the streaming path
+            for _ in llm.stream(build_essay_prompt(topic, args.words, True, True), max_tokens=args.words * 2):
+                return kind, time.perf_counter() - start
+        else:
+            generate_chat_reply(llm, f"What is {topic.lower()}?")
+        return kind, time.perf_counter() - start
+
+    results = {"essay": [], "stream": [], "chat": []}
+    errors = {"essay": 0, "stream": 0, "chat": 0}
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        futures = {pool.submit(run, kind, i): kind for i in range(args.bench_llm) for kind in results}
+        for future in as_completed(futures):
+            try:
+                kind, elapsed = future.result()
+                results[kind].append(elapsed)
+            except Exception:
+                errors[futures[future]] += 1
+    wall = time.perf_counter() - started
+
+    print(f"{args.bench_llm * len(results)} requests on {args.workers} workers in {wall:.2f}s")
+    for kind, latencies in results.items():
+        label = "first chunk" if kind == "stream" else "latency"
+        print(f"{kind:>6}: {len(latencies)} ok, {errors[kind]} failed, {label} "
+              f"p50 {percentile(latencies, 0.5):.3f}s, p95 {percentile(latencies, 0.95):.3f}s, "
+              f"max {max(latencies, default=0):.3f}s")
+
+
+def benchmark_render(line_count=5000):
+    """Time rendering a long essay with the per-line and the bulk strategies"""
+    root = tk.Tk()
+    root.withdraw()
+    text = tk.Text(root)
+    text.tag_configure("header", font=("Arial", 14, "bold"))
+    text.tag_configure("bullet", lmargin1=20, lmargin2=40)
+
+    pattern = ["# Section heading", "A regular paragraph of essay text that goes on for a while.",
+               "• A bullet point", "• Another bullet point", ""]
+    essay_text = "\n".join(pattern[i % len(pattern)] for i in range(line_count))
+
+    # Old approach: classify and insert one line at a time
+    start = time.perf_counter()
+    text.delete("1.0", tk.END)
+    for line in essay_text.split("\n"):
+        tag = classify_essay_line(line)
+        text.insert(tk.END, line + "\n", tag or ())
+    root.update_idletasks()
+    per_line = time.perf_counter() - start
+
+    # New approach: parse once, insert once, tag in bulk
+    start = time.perf_counter()
+    spans = parse_essay_spans(essay_text)
+    parsed = time.perf_counter() - start
+    text.delete("1.0", tk.END)
+    text.insert("1.0", essay_text + "\n")
+    for tag, ranges in spans.items():
+        text.tag_add(tag, *ranges)
+    root.update_idletasks()
+    bulk = time.perf_counter() - start
+
+    print(f"{line_count} lines: per-line insert {per_line * 1000:.1f} ms, "
+          f"bulk render {bulk * 1000:.1f} ms (parse {parsed * 1000:.1f} ms)")
+    root.destroy()
+
+
 if __name__ == "__main__":
-    app = EduPal()
-    app.run()
+    parser = argparse.ArgumentParser(description="EduPal - Your Educational Assistant")
+    parser.add_argument("--bench-render", type=int, metavar="LINES",
+                        help="benchmark essay rendering with the given number of lines and exit")
+    parser.add_argument("--bench-llm", type=int, metavar="REQUESTS",
+                        help="load-test essay, streaming and chat requests against the fake backend "
+                             "(tuned by the fake_llm section of config.json) and exit")
+    batch = parser.add_argument_group("batch essay generation (no GUI)")
+    batch.add_argument("--batch", metavar="TOPICS",
+                       help="file with one essay topic per line, or - for stdin")
+    batch.add_argument("--out", default="essays", help="directory for generated essays (default: essays)")
+    batch.add_argument("--workers", type=int, default=4, help="concurrent requests (default: 4)")
+    batch.add_argument("--rate", type=float, default=2.0,
+                       help="maximum requests per second, 0 for unlimited (default: 2)")
+    batch.add_argument("--words", type=int, default=250, help="approximate essay length (default: 250)")
+    batch.add_argument("--no-headers", action="store_true", help="do not add section headers")
+    batch.add_argument("--no-bullets", action="store_true", help="do not add bullet points")
+    batch.add_argument("--regenerate", action="store_true", help="ignore cached essays")
+    batch.add_argument("--sections", action="store_true",
+                       help="write an outline first, then all sections concurrently")
+    args = parser.parse_args()
+
+    if args.batch:
+        sys.exit(run_batch(args))
+    elif args.bench_llm:
+        benchmark_llm(args)
+    elif args.bench_render:
+        benchmark_render(args.bench_render)
+    else:
+        app = EduPal()
+        app.run()
@@ -0,0 +1,44 @@
+import argparse
+import json
+import threading
+import time
+
+import edupal
+
+
+def test_sectioned_batch_respects_rate_and_workers(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    with open("config.json", "w") as f:
+        json.dump({"llm_backend": "fake", "fake_llm": {"latency": "constant", "latency_mean": 0.05,
+                                                        "tokens_per_second": 1e6, "seed": 0}}, f)
+    with open("topics.txt", "w") as f:
+        f.write("\n".join(["Photosynthesis", "The water cycle", "Volcanoes", "The Roman Empire"]))
+
+    calls = []
+    active = [0, 0]  # now, most at once
+    lock = threading.Lock()
+    generate = edupal.FakeLLMBackend.generate
+
+    def counting_generate(self, *args, **kwargs):
+        with lock:
+            calls.append(time.monotonic())
+            active[0] += 1
+            active[1] = max(active)
+        try:
+            return generate(self, *args, **kwargs)
+        finally:
+            with lock:
+                active[0] -= 1
+
+    monkeypatch.setattr(edupal.FakeLLMBackend, "generate", counting_generate)
+    args = argparse.Namespace(batch="topics.txt", out="essays", workers=2, rate=20.0, words=200,
+                              no_headers=False, no_bullets=False, regenerate=False, sections=True)
+    assert edupal.run_batch(args) == 0
+
+    assert len(calls) >= 4 * 4  # An outline and at least three sections per topic
+    assert active[1] <= args.workers
+    # Token bucket: at most `rate` calls per second plus the initial burst
+    for i, start in enumerate(calls):
+        in_window = sum(1 for t in calls[i:] if t - start < 1.0)
+        assert in_window <= args.rate + args.workers
+    assert (len(calls) - args.workers) / (calls[-1] - calls[0]) <= args.rate * 1.1
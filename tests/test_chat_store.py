@@ -0,0 +1,82 @@
+import pytest
+
+import edupal
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = edupal.ChatStore(str(tmp_path / "edupal.db"))
+    yield store
+    store.close()
+
+
+def fill(store, count):
+    ids = []
+    for i in range(count):
+        ids.append(store.add("You" if i % 2 == 0 else "AI Assistant", f"message {i} about topic{i % 7}"))
+    return ids
+
+
+def test_latest_page_is_oldest_first(store):
+    ids = fill(store, 120)
+    page = store.page(limit=50)
+    assert [row[0] for row in page] == ids[-50:]
+    assert page[-1][2:] == ("AI Assistant", "message 119 about topic0")
+
+
+def test_paging_backwards_and_forwards_covers_everything_once(store):
+    ids = fill(store, 120)
+    seen = []
+    page = store.page(limit=50)
+    while page:
+        seen = [row[0] for row in page] + seen
+        page = store.page(before_id=page[0][0], limit=50)
+    assert seen == ids
+    forward = store.page(after_id=ids[9], limit=5)
+    assert [row[0] for row in forward] == ids[10:15]
+    assert store.page(after_id=ids[-1]) == []
+
+
+def test_empty_store(store):
+    assert store.page() == []
+    assert store.search("anything") == []
+    assert store.search("  ?! ") == []
+
+
+def test_search_matches_every_word(store):
+    fill(store, 70)
+    store.add("You", "How does photosynthesis work in desert plants?")
+    store.add("AI Assistant", "Desert plants often use CAM photosynthesis.")
+    store.add("You", "What is the capital of France?")
+    results = [row[3] for row in store.search("photosynthesis desert")]
+    assert sorted(results) == ["Desert plants often use CAM photosynthesis.",
+                               "How does photosynthesis work in desert plants?"]
+    assert [row[3] for row in store.search("capital")] == ["What is the capital of France?"]
+    assert len(store.search("topic3", limit=5)) == 5
+
+
+def test_search_prefixes_and_punctuation(store):
+    store.add("You", "Explain Newton's second law")
+    if store.fts:
+        assert store.search("newt")  # Prefix match while typing
+    assert store.search('newton"s "law') and store.search("LAW")
+
+
+def test_history_survives_reopen(tmp_path):
+    path = str(tmp_path / "edupal.db")
+    store = edupal.ChatStore(path)
+    fill(store, 3)
+    store.close()
+    store = edupal.ChatStore(path)
+    try:
+        assert [row[3] for row in store.page()] == [f"message {i} about topic{i}" for i in range(3)]
+        assert store.search("message 2")
+    finally:
+        store.close()
+
+
+def test_like_fallback_without_fts(store):
+    store.fts = False
+    store.add("You", "Photosynthesis in leaves")
+    store.add("You", "Respiration in cells")
+    assert [row[3] for row in store.search("leaves photo")] == ["Photosynthesis in leaves"]
@@ -0,0 +1,70 @@
+import edupal
+
+
+def chat(context, rounds, summarize=None):
+    for i in range(rounds):
+        for speaker, text in [("User", f"Question {i}: how does topic {i} relate to photosynthesis and light?"),
+                              ("AI Assistant", f"Answer {i}: topic {i} matters because chlorophyll absorbs "
+                                               f"light. Further detail follows here.")]:
+            if context.add(speaker, text):
+                context.fold(summarize)
+
+
+def test_prompt_stays_within_budget():
+    context = edupal.ConversationContext(budget=200, summary_budget=60)
+    chat(context, 100)
+    assert context.summary
+    assert edupal.estimate_tokens(context.summary) <= 60
+    assert edupal.estimate_tokens(context.render()) <= 200 + len(context.recent) * 2 + 10
+    assert "Answer 99" in context.render()
+
+
+def test_local_summary_starts_at_a_turn_boundary():
+    context = edupal.ConversationContext(budget=200, summary_budget=60)
+    chat(context, 50)
+    assert context.summary.startswith(("User: ", "AI Assistant: "))
+    assert "Summary of earlier conversation: : " not in context.render()
+
+
+def test_model_summary_is_clipped_at_a_word():
+    context = edupal.ConversationContext(budget=200, summary_budget=20)
+    chat(context, 20, summarize=lambda summary, turns: "Earlier: " + ", ".join(["(osmosis)"] * 40))
+    assert context.summary[0].isalnum()
+    assert edupal.estimate_tokens(context.summary) <= 20
+
+
+def test_clip_tokens_keeps_whole_words():
+    text = "User: one two three. AI Assistant: four five six."
+    assert edupal.clip_tokens(text, 100) == text
+    assert edupal.clip_tokens(text, 3) == "User: one"
+    tail = edupal.clip_tokens(text, 5, keep_tail=True)
+    assert text.endswith(tail) and tail[0].isalnum()
+    assert edupal.clip_tokens("a: b", 2, keep_tail=True) == "b"
+
+
+def fake_llm():
+    backend = edupal.FakeLLMBackend(latency="constant", latency_mean=0.0, tokens_per_second=1e6, seed=0)
+    llm = edupal.LLMGateway(lambda: backend, backend_name="fake")
+    return llm, backend
+
+
+def test_chat_cache_is_keyed_on_the_bare_question(tmp_path):
+    llm, backend = fake_llm()
+    cache = edupal.ResponseCache(str(tmp_path / "cache"))
+    first = edupal.generate_chat_reply(llm, "What is osmosis?", cache=cache)
+    assert edupal.generate_chat_reply(llm, "What is osmosis?", cache=cache) == first
+    assert backend.calls == 1
+    edupal.generate_chat_reply(llm, "What is osmosis?", cache=cache, fresh=True)
+    assert backend.calls == 2
+
+
+def test_chat_with_history_skips_the_cache(tmp_path):
+    llm, backend = fake_llm()
+    cache = edupal.ResponseCache(str(tmp_path / "cache"))
+    history = "User: tell me about cells\nAI Assistant: Cells are the units of life."
+    edupal.generate_chat_reply(llm, "What is osmosis?", cache=cache, history=history)
+    edupal.generate_chat_reply(llm, "What is osmosis?", cache=cache, history=history)
+    assert backend.calls == 2
+    assert cache.stats["misses"] == 0 and not cache.memory
+    edupal.generate_chat_reply(llm, "What is osmosis?", cache=cache)
+    assert backend.calls == 3  # Answers given in a conversation are not reused later either
@@ -0,0 +1,67 @@
+import random
+
+import pytest
+
+import edupal
+
+
+def fake_stream(topic="Photosynthesis", words=300):
+    backend = edupal.FakeLLMBackend(latency="constant", latency_mean=0.0, tokens_per_second=1e6, seed=0)
+    prompt = edupal.build_essay_prompt(topic, words, True, True)
+    return list(backend.stream(prompt, max_tokens=words * 2))
+
+
+def resplit(chunks, seed):
+    """Cut the streamed text at random points, including inside markers and newlines"""
+    text = "".join(chunks)
+    rng = random.Random(seed)
+    cuts = sorted(rng.sample(range(1, len(text)), len(text) // 3))
+    return [text[start:end] for start, end in zip([0] + cuts, cuts + [len(text)])]
+
+
+def formatted(chunks):
+    formatter = edupal.EssayStreamFormatter()
+    lines = []
+    for chunk in chunks:
+        lines.extend(formatter.feed(chunk))
+    lines.extend(formatter.finish())
+    return formatter, lines
+
+
+@pytest.mark.parametrize("seed", [None, 1, 2, 3])
+def test_fake_stream_formats_like_the_whole_text(seed):
+    chunks = fake_stream()
+    if seed is not None:
+        chunks = resplit(chunks, seed)
+    text = "".join(chunks)
+    formatter, lines = formatted(chunks)
+    assert formatter.text() == text
+    assert "".join(line for line, _ in lines) == text + ("" if text.endswith("\n") else "\n")
+    assert lines == [(line + "\n", edupal.classify_essay_line(line))
+                     for line in (text[:-1] if text.endswith("\n") else text).split("\n")]
+    tags = {tag for _, tag in lines}
+    assert {"header", "bullet"} <= tags
+
+
+def test_markers_split_across_chunks():
+    chunks = ["TITLE: PHOTO", "SYNTHESIS\n\n", "#", " Introd", "uction", "\n", "Plants use light.\n",
+              "•", " Chlorophyll absorbs", " red light\n• Water", " is split\nIn short", ", sugar."]
+    _, lines = formatted(chunks)
+    assert lines == [
+        ("TITLE: PHOTOSYNTHESIS\n", "header"),
+        ("\n", None),
+        ("# Introduction\n", "header"),
+        ("Plants use light.\n", None),
+        ("• Chlorophyll absorbs red light\n", "bullet"),
+        ("• Water is split\n", "bullet"),
+        ("In short, sugar.\n", None),
+    ]
+
+
+def test_partial_line_waits_for_its_newline():
+    formatter = edupal.EssayStreamFormatter()
+    assert formatter.feed("# Concl") == []
+    assert formatter.pending == "# Concl"
+    assert formatter.feed("usion\nThe") == [("# Conclusion\n", "header")]
+    assert formatter.finish() == [("The\n", None)]
+    assert formatter.finish() == []
@@ -0,0 +1,144 @@
+import threading
+
+import edupal
+
+
+class FakeRoot:
+    """Collects root.after callbacks; raises like Tk once destroyed"""
+
+    def __init__(self):
+        self.callbacks = []
+        self.destroyed = False
+
+    def after(self, ms, callback):
+        if self.destroyed:
+            raise edupal.tk.TclError("can't invoke \"after\" command: application has been destroyed")
+        self.callbacks.append(callback)
+
+    def run_pending(self):
+        callbacks, self.callbacks = self.callbacks, []
+        for callback in callbacks:
+            callback()
+
+
+def test_results_are_delivered_on_the_root():
+    root = FakeRoot()
+    jobs = edupal.JobScheduler(root, workers=2)
+    results = []
+    jobs.submit(lambda job: 42, on_done=results.append)
+    for _ in range(500):
+        if root.callbacks:
+            break
+        edupal.time.sleep(0.01)
+    root.run_pending()
+    assert results == [42]
+    assert jobs.shutdown(timeout=5) is True
+
+
+def test_shutdown_waits_for_running_jobs():
+    root = FakeRoot()
+    jobs = edupal.JobScheduler(root)
+    started = threading.Event()
+    writes = []
+
+    def work(job):
+        started.set()
+        while not job.cancelled:
+            edupal.time.sleep(0.01)
+        writes.append("flushed")
+
+    done = []
+    jobs.submit(work, on_done=done.append)
+    assert started.wait(5)
+    assert jobs.shutdown(timeout=5) is True
+    assert writes == ["flushed"]  # The job finished before shutdown returned
+    root.run_pending()
+    assert done == [] and root.callbacks == []
+
+
+def test_shutdown_timeout_reports_stuck_workers():
+    root = FakeRoot()
+    jobs = edupal.JobScheduler(root)
+    release = threading.Event()
+    started = threading.Event()
+    jobs.submit(lambda job: (started.set(), release.wait(5)))
+    assert started.wait(5)
+    assert jobs.shutdown(timeout=0.05) is False
+    release.set()
+    for worker in jobs.workers:
+        worker.join(5)
+
+
+def test_late_results_after_destroy_are_dropped():
+    root = FakeRoot()
+    jobs = edupal.JobScheduler(root)
+    job = edupal.Job(lambda job: None, None, None, jobs.PRIORITY_CHAT, None, None)
+    root.destroyed = True
+    jobs.post(job, lambda value: None, 1)  # Must not raise TclError
+    jobs.shutdown(timeout=1)
+    root.destroyed = False
+    jobs.post(job, lambda value: None, 1)
+    assert root.callbacks == []
+
+
+class FakeFrame:
+    def __init__(self, widgets):
+        self.children = [FakeFrame(0) for _ in range(widgets - 1)] if widgets else []
+        self.gridded = False
+        self.destroyed = False
+
+    def winfo_children(self):
+        return self.children
+
+    def grid(self, **options):
+        self.gridded = True
+
+    def grid_remove(self):
+        self.gridded = False
+
+    def destroy(self):
+        self.destroyed = True
+
+
+def test_screen_eviction_cancels_owned_jobs():
+    root = FakeRoot()
+    jobs = edupal.JobScheduler(root)
+    frames = {}
+    screens = edupal.ScreenManager(None, max_widgets=250, can_evict=lambda name: not jobs.has_owner(name),
+                                   on_evict=jobs.cancel_owner)
+    for name in ["study", "essay", "todo"]:
+        screens.register(name, lambda parent, name=name: frames.setdefault(name, FakeFrame(100)))
+
+    release = threading.Event()
+    screens.show("study")
+    job = jobs.submit(lambda job: release.wait(5), owner="study", on_done=lambda value: None)
+    screens.show("essay")
+    screens.show("todo")  # Over budget, but the study screen has a job in flight
+    assert "study" in screens.frames and "essay" not in screens.frames
+    assert frames["essay"].destroyed and not frames["study"].destroyed
+
+    release.set()
+    while job in jobs.active:
+        edupal.time.sleep(0.01)
+    screens.show("essay")  # Now the study screen is the least recently used idle screen
+    assert "study" not in screens.frames and frames["study"].destroyed
+    assert frames["essay"].gridded and not frames["todo"].gridded
+    jobs.shutdown(timeout=5)
+
+
+def test_evicting_a_screen_cancels_its_pending_jobs():
+    root = FakeRoot()
+    jobs = edupal.JobScheduler(root, workers=1)
+    release = threading.Event()
+    jobs.submit(lambda job: release.wait(5))  # Keeps the only worker busy
+    delivered = []
+    pending = jobs.submit(lambda job: "indexed", owner="study", on_done=delivered.append)
+    screens = edupal.ScreenManager(None, on_evict=jobs.cancel_owner)
+    screens.register("study", lambda parent: FakeFrame(10))
+    screens.show("study")
+    screens.evict("study")
+    assert pending.cancelled
+    release.set()
+    assert jobs.shutdown(timeout=5)
+    root.run_pending()
+    assert delivered == []
@@ -0,0 +1,97 @@
+import pytest
+
+import edupal
+
+
+@pytest.fixture
+def engine():
+    return edupal.MathEngine()
+
+
+@pytest.mark.parametrize("expression, expected", [
+    ("2+2", 4),
+    ("what is 3 * (4 - 1)?", 9),
+    ("2^10", 1024),
+    ("-2^2", -4),
+    ("7/2", 3.5),
+    ("2^0.5", 2 ** 0.5),
+])
+def test_arithmetic(engine, expression, expected):
+    assert engine.evaluate(expression) == pytest.approx(expected)
+
+
+@pytest.mark.parametrize("expression", [
+    "9^9^9",
+    "2^4000",
+    "10^20000",
+    "*".join(["9" * 100] * 15),  # Each factor is fine, the product is not
+    "(2^2000)*(2^2000)*(2^2000)",
+    "1" * 150,  # Literal too long
+    "+".join(["1"] * 120),  # Expression too long
+])
+def test_huge_results_are_refused(engine, expression):
+    with pytest.raises(edupal.MathLimitError):
+        engine.evaluate(expression)
+
+
+def test_time_limit(engine):
+    engine.TIME_LIMIT = -1  # Already past the deadline at the first operation
+    with pytest.raises(edupal.MathLimitError, match="too long"):
+        engine.evaluate("1+1")
+
+
+def test_division_by_zero_is_not_a_limit_error(engine):
+    # Anything but MathLimitError makes the chat fall back to the assistant
+    with pytest.raises(ZeroDivisionError):
+        engine.evaluate("1/0")
+
+
+def test_complex_results_are_rejected(engine):
+    with pytest.raises(ValueError) as error:
+        engine.evaluate("(-8)^0.5")
+    assert not isinstance(error.value, edupal.MathLimitError)
+
+
+@pytest.mark.parametrize("expression", [
+    "__import__('os').system('echo hi')",
+    "(1).real",
+    "().__class__.__bases__",
+    "x + 1",
+    "abs(-1)",
+    "[1, 2][0]",
+])
+def test_names_calls_and_attributes_are_rejected(engine, expression):
+    with pytest.raises(ValueError):
+        engine.compile(expression)
+    # evaluate() strips everything but digits and operators before parsing
+    try:
+        result = engine.evaluate(expression)
+    except ValueError:
+        return
+    assert type(result) in (int, float)
+
+
+def test_compiled_expressions_are_cached(engine):
+    engine.cache_size = 2
+    first = engine.compile("1+2")
+    assert engine.compile("1+2") is first
+    engine.compile("3+4")
+    engine.compile("5+6")
+    assert "1+2" not in engine.compiled
+
+
+def test_is_math_question(engine):
+    assert engine.is_math_question("12 * 7")
+    assert engine.is_math_question("(3+4)/2")
+    assert not engine.is_math_question("what is photosynthesis")
+    assert not engine.is_math_question("1984")
+
+
+def test_plot_functions_reject_unknown_names(engine):
+    f = engine.compile_function("sqrt(x) + 1")
+    ys = list(f(edupal.np.array([4.0, -1.0]) if edupal.NUMPY_AVAILABLE else [4.0, -1.0]))
+    assert ys[0] == 3.0 and ys[1] != ys[1]  # NaN outside the domain
+    with pytest.raises(ValueError):
+        engine.compile_function("__import__('os')")
+    with pytest.raises(ValueError):
+        engine.compile_function("x.real")
@@ -0,0 +1,105 @@
+import os
+
+import pytest
+
+import edupal
+
+
+def text_sources(texts):
+    """NotesIndex sources from {key: text}; the text doubles as the version"""
+    return {key: ([text], lambda text=text: text) for key, text in texts.items()}
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = edupal.NotesIndex(str(tmp_path / "index"), max_segments=3)
+    yield index
+    index.close()
+
+
+def keys(hits):
+    return [key for _, _, key, _ in hits]
+
+
+NOTES = {
+    "bio.md": "Photosynthesis turns light energy into chemical energy in chloroplasts.\n\n"
+              "Mitochondria release energy from glucose.",
+    "physics.md": "Newton's second law: force equals mass times acceleration.",
+    "task:1": "To-do: revise the water cycle",
+}
+
+
+def test_build_and_search(index):
+    assert index.refresh(text_sources(NOTES)) == 4  # bio.md has two passages
+    hits = index.search("where does photosynthesis happen")
+    assert keys(hits)[0] == "bio.md"
+    assert hits[0][3].startswith("Photosynthesis")
+    assert hits[0][1] == pytest.approx(1 / 3)  # Only "photosynthesis" of where/photosynthesis/happen
+    assert keys(index.search("newton force")) == ["physics.md"]
+    assert index.search("quantum chromodynamics") == []
+    assert index.search("") == []
+
+
+def test_unchanged_sources_are_not_reindexed(index):
+    index.refresh(text_sources(NOTES))
+    segments = [segment["name"] for segment in index.segments]
+    index.refresh(text_sources(NOTES))
+    assert [segment["name"] for segment in index.segments] == segments
+
+
+def test_changed_and_removed_sources_are_tombstoned(index):
+    index.refresh(text_sources(NOTES))
+    notes = dict(NOTES, **{"physics.md": "Gravity pulls masses together."})
+    del notes["task:1"]
+    assert index.refresh(text_sources(notes)) == 3
+    assert index.search("newton force") == []
+    assert index.search("water cycle") == []
+    assert keys(index.search("gravity")) == ["physics.md"]
+
+
+def test_reload_from_disk(index, tmp_path):
+    index.refresh(text_sources(NOTES))
+    index.refresh(text_sources(dict(NOTES, **{"task:1": "To-do: essay draft"})))
+    index.close()
+    reloaded = edupal.NotesIndex(str(tmp_path / "index"))
+    try:
+        assert keys(reloaded.search("essay draft")) == ["task:1"]
+        assert reloaded.search("water cycle") == []  # Tombstone survived the reload
+        assert keys(reloaded.search("photosynthesis"))[0] == "bio.md"
+        assert reloaded.refresh(text_sources(dict(NOTES, **{"task:1": "To-do: essay draft"}))) == 4
+    finally:
+        reloaded.close()
+
+
+def test_merge_keeps_live_passages_only(index, tmp_path):
+    notes = dict(NOTES)
+    for i in range(6):
+        notes[f"note{i}.txt"] = f"Fresh note {i} about volcanoes."
+        if i == 2:
+            del notes["physics.md"]
+        index.refresh(text_sources(notes))
+    assert len(index.segments) <= 3
+    names = {segment["name"] for segment in index.segments}
+    on_disk = {name.split(".")[0] for name in os.listdir(tmp_path / "index") if name.startswith("seg")}
+    assert on_disk == names  # Merged segments were deleted
+    assert len(index.search("volcanoes", limit=10)) == 6
+    assert index.search("newton force") == []
+    index.close()
+    reloaded = edupal.NotesIndex(str(tmp_path / "index"))
+    try:
+        assert len(reloaded.search("volcanoes", limit=10)) == 6
+        assert keys(reloaded.search("chloroplasts")) == ["bio.md"]
+    finally:
+        reloaded.close()
+
+
+@pytest.mark.parametrize("numpy", [True, False])
+def test_scoring_with_and_without_numpy(index, monkeypatch, numpy):
+    if numpy and not edupal.NUMPY_AVAILABLE:
+        pytest.skip("numpy is not installed")
+    monkeypatch.setattr(edupal, "NUMPY_AVAILABLE", numpy)
+    index.refresh(text_sources({"a.md": "energy energy energy", "b.md": "energy and light",
+                                "c.md": "unrelated words"}))
+    hits = index.search("energy", limit=5)
+    assert keys(hits) == ["a.md", "b.md"]
+    assert hits[0][0] > hits[1][0] > 0
@@ -0,0 +1,53 @@
+import math
+
+import pytest
+
+import edupal
+
+
+@pytest.fixture(params=[True, False] if edupal.NUMPY_AVAILABLE else [False])
+def numpy(request, monkeypatch):
+    monkeypatch.setattr(edupal, "NUMPY_AVAILABLE", request.param)
+    return request.param
+
+
+def test_tabulate_evenly_spaced(numpy):
+    xs, ys = edupal.MathEngine().tabulate("x^2 - 1", -2, 2, 5)
+    assert list(xs) == pytest.approx([-2, -1, 0, 1, 2])
+    assert list(ys) == pytest.approx([3, 0, -1, 0, 3])
+
+
+def test_tabulate_marks_points_outside_the_domain(numpy):
+    xs, ys = edupal.MathEngine().tabulate("log(x) + 1/x", -1, 1, 3)
+    assert all(math.isnan(y) or math.isinf(y) for y in list(ys)[:2])
+    assert list(ys)[2] == pytest.approx(1.0)
+
+
+def test_tabulate_point_limits():
+    engine = edupal.MathEngine()
+    for points in (1, edupal.MAX_PLOT_POINTS + 1):
+        with pytest.raises(edupal.MathLimitError):
+            engine.tabulate("x", 0, 1, points)
+
+
+def test_decimate_keeps_each_columns_extremes(numpy):
+    ys = [math.sin(i / 100) for i in range(10000)]
+    low, high = edupal.decimate_for_plot(ys, 100)
+    assert len(low) == len(high) == 100
+    assert min(low) == pytest.approx(min(ys)) and max(high) == pytest.approx(max(ys))
+    for column in (0, 37, 99):
+        chunk = ys[column * 100:(column + 1) * 100]
+        assert (low[column], high[column]) == pytest.approx((min(chunk), max(chunk)))
+
+
+def test_decimate_breaks_on_gaps(numpy):
+    ys = [1.0, 2.0, math.nan, math.inf, 5.0, -math.inf]
+    low, high = edupal.decimate_for_plot(ys, 3)
+    assert (low[0], high[0]) == (1.0, 2.0)
+    assert math.isnan(low[1]) and math.isnan(high[1])
+    assert (low[2], high[2]) == (5.0, 5.0)
+
+
+def test_decimate_never_widens_short_series(numpy):
+    low, high = edupal.decimate_for_plot([3.0, 1.0], 800)
+    assert low == high == [3.0, 1.0]
@@ -0,0 +1,98 @@
+import pytest
+
+import edupal
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = edupal.QuestionCache(str(tmp_path / "edupal.db"))
+    yield cache
+    cache.close()
+
+
+def test_near_duplicate_questions_hit(cache):
+    cache.store("What is photosynthesis?", "Plants make sugar from light.")
+    for question in ["explain photosynthesis", "Define photosynthesis please", "what's photosynthesis"]:
+        assert cache.lookup(question) == "Plants make sugar from light."
+    cache.store("capital of France", "Paris")
+    assert cache.lookup("What is the capital of france?") == "Paris"
+    assert cache.stats["hits"] == 4
+
+
+def test_different_questions_miss(cache):
+    cache.store("capital of France", "Paris")
+    cache.store("Newton's first law", "Inertia")
+    assert cache.lookup("capital of Germany") is None
+    assert cache.lookup("Newton's third law") is None
+    assert cache.lookup("how does photosynthesis work") is None
+    assert cache.stats["misses"] == 3
+
+
+def test_follow_up_questions_are_not_shared(cache):
+    cache.store("explain it again", "Sure")
+    assert cache.stats["stores"] == 0
+    assert cache.lookup("explain it again") is None
+    assert cache.stats["skipped"] == 1
+    assert cache.hit_rate() == 0.0
+
+
+def test_threshold_is_configurable(tmp_path):
+    strict = edupal.QuestionCache(str(tmp_path / "strict.db"), threshold=1.0)
+    loose = edupal.QuestionCache(str(tmp_path / "loose.db"), threshold=0.5)
+    try:
+        for cache in (strict, loose):
+            cache.store("speed of light in vacuum", "c")
+        assert strict.lookup("speed of light") is None
+        assert loose.lookup("speed of light") == "c"
+    finally:
+        strict.close()
+        loose.close()
+
+
+def test_store_replaces_near_duplicate(cache):
+    cache.store("what is osmosis", "old answer")
+    cache.store("explain osmosis", "fresh answer")
+    assert len(cache.entries) == 1
+    assert cache.lookup("define osmosis") == "fresh answer"
+
+
+def test_lru_eviction(tmp_path):
+    cache = edupal.QuestionCache(str(tmp_path / "edupal.db"), max_entries=3)
+    try:
+        for topic in ["volcano", "glacier", "desert"]:
+            cache.store(f"what is a {topic}", topic)
+        assert cache.lookup("what is a volcano") == "volcano"  # Now most recently used
+        cache.store("what is a canyon", "canyon")
+        assert cache.stats["evictions"] == 1
+        assert cache.lookup("what is a glacier") is None
+        assert cache.lookup("what is a volcano") == "volcano"
+    finally:
+        cache.close()
+
+
+def test_expired_entries_miss(tmp_path, monkeypatch):
+    cache = edupal.QuestionCache(str(tmp_path / "edupal.db"), ttl=60)
+    try:
+        cache.store("what is a volcano", "volcano")
+        now = edupal.time.time()
+        monkeypatch.setattr(edupal.time, "time", lambda: now + 120)
+        assert cache.lookup("what is a volcano") is None
+    finally:
+        cache.close()
+
+
+def test_entries_persist_between_sessions(tmp_path):
+    path = str(tmp_path / "edupal.db")
+    cache = edupal.QuestionCache(path)
+    cache.store("what is photosynthesis", "Plants make sugar from light.")
+    cache.store("what is osmosis", "old")
+    cache.store("define osmosis", "new")
+    cache.close()
+    cache = edupal.QuestionCache(path)
+    try:
+        assert cache.lookup("explain photosynthesis") == "Plants make sugar from light."
+        assert cache.lookup("osmosis") == "new"
+        assert len(cache.entries) == 2
+        assert cache.hit_rate() == 1.0
+    finally:
+        cache.close()
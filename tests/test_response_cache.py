@@ -0,0 +1,37 @@
+import os
+
+import edupal
+
+
+def disk_usage(directory):
+    return sum(os.path.getsize(os.path.join(directory, name))
+               for name in os.listdir(directory) if name.endswith(".json"))
+
+
+def test_put_evicts_oldest_without_scanning(tmp_path, monkeypatch):
+    directory = str(tmp_path / "cache")
+    cache = edupal.ResponseCache(directory, max_disk_bytes=2000)
+
+    def no_scan(*args):
+        raise AssertionError("put() must not list the cache directory")
+
+    monkeypatch.setattr(edupal.os, "scandir", no_scan)
+    for i in range(20):
+        cache.put(f"key{i}", "x" * 200)
+    assert cache.disk_bytes == disk_usage(directory) <= 2000
+    assert cache.stats["evictions"] > 0
+    assert not os.path.exists(os.path.join(directory, "key0.json"))
+    assert os.path.exists(os.path.join(directory, "key19.json"))
+
+
+def test_running_total_survives_restart_and_overwrites(tmp_path):
+    directory = str(tmp_path / "cache")
+    cache = edupal.ResponseCache(directory)
+    cache.put("a", "first")
+    cache.put("b", "second")
+    cache.put("a", "a much longer replacement value")
+    assert cache.disk_bytes == disk_usage(directory)
+    restarted = edupal.ResponseCache(directory)
+    assert restarted.disk_bytes == disk_usage(directory)
+    assert restarted.get("a") == "a much longer replacement value"
+    assert restarted.hit_rate() == 1.0
@@ -0,0 +1,90 @@
+import pytest
+
+import edupal
+
+
+@pytest.fixture
+def router():
+    return edupal.IntentRouter()
+
+
+@pytest.mark.parametrize("message", [
+    "What time is it?",
+    "what time is it now",
+    "What's the time?",
+    "what is the current time",
+    "current time",
+    "tell me the time",
+])
+def test_clock_questions_answered_locally(router, message):
+    assert router.route(message).startswith("It's ")
+    assert router.counts["datetime"] == 1
+
+
+@pytest.mark.parametrize("message", [
+    "What's the date?",
+    "what day is it today",
+    "what day is tomorrow",
+    "today's date",
+])
+def test_date_questions_answered_locally(router, message):
+    assert router.route(message) is not None
+    assert router.counts["datetime"] == 1
+
+
+@pytest.mark.parametrize("message", [
+    "time",
+    "What is time?",
+    "what is the time complexity of quicksort",
+    "what time period was the renaissance",
+    "what is date",
+    "what day did world war 2 end",
+    "explain time dilation",
+])
+def test_near_misses_go_to_the_model(router, message):
+    assert router.route(message) is None
+    assert router.saved == 0
+
+
+def test_conversions_and_glossary(router):
+    assert "km" in router.route("convert 5 miles to km")
+    assert router.route("what is photosynthesis").lower().startswith("photosynthesis")
+    assert router.route("what is photosynthesis in desert plants") is None
+    assert router.saved == 2
+
+
+def test_registered_intents_only_see_their_phrases(router):
+    seen = []
+    router.add("timer", ["timer"], lambda message, matches: seen.append(matches) or "ok")
+    assert router.route("explain photosynthesis") is None
+    assert router.route("start a timer") == "ok"
+    assert seen == [["timer"]]
+
+
+@pytest.mark.parametrize("message, groups", [
+    ("start timer", (None, None, None, None)),
+    ("start a 25 minute timer", ("25", "minute", None, None)),
+    ("set a timer for 10 minutes", (None, None, "10", "minutes")),
+    ("can you start a pomodoro for 1 hour?", (None, None, "1", "hour")),
+    ("begin my study timer.", (None, None, None, None)),
+])
+def test_timer_start_commands(message, groups):
+    assert edupal.TIMER_START_PATTERN.match(message).groups() == groups
+
+
+@pytest.mark.parametrize("message", ["pause the timer", "stop timer", "please reset my pomodoro"])
+def test_timer_control_commands(message):
+    assert edupal.TIMER_CONTROL_PATTERN.match(message)
+
+
+@pytest.mark.parametrize("message", [
+    "start studying for the timer test",
+    "how do i set a timer in python",
+    "set up a timer in javascript",
+    "stop the timer interrupt on an arduino",
+    "reset the timer register",
+    "start by explaining how a kitchen timer works",
+])
+def test_timer_near_misses(message):
+    assert not edupal.TIMER_START_PATTERN.match(message)
+    assert not edupal.TIMER_CONTROL_PATTERN.match(message)
@@ -0,0 +1,72 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import edupal
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "edupal.db")
+
+
+@pytest.fixture
+def store(path):
+    store = edupal.SessionStore(path)
+    yield store
+    store.close()
+
+
+MONDAY = datetime(2024, 3, 4, 9, 0)
+
+
+def test_daily_weekly_and_all_time_totals(store):
+    store.record("work", "Math", 1500, when=MONDAY)
+    store.record("work", "Biology", 900, when=MONDAY + timedelta(hours=2))
+    store.record("work", "Math", 1500, when=MONDAY + timedelta(days=2))
+    store.record("work", "Math", 600, when=MONDAY + timedelta(days=7))  # Next week
+    assert store.total("day", when=MONDAY) == 2400
+    assert store.total("day", when=MONDAY, subject="Math") == 1500
+    assert store.total("week", when=MONDAY + timedelta(days=6)) == 3900
+    assert store.total("week", when=MONDAY + timedelta(days=7)) == 600
+    assert store.total("all") == 4500
+    assert store.total("day", when=MONDAY + timedelta(days=1)) == 0.0
+    assert store.subject_totals() == [("Math", 3600), ("Biology", 900)]
+
+
+def test_breaks_are_logged_but_not_counted(store):
+    store.record("work", "Math", 1500, when=MONDAY)
+    store.record("break", "Math", 300, when=MONDAY)
+    assert store.total("all") == 1500
+    assert store.db.execute("SELECT COUNT(*) FROM session_events").fetchone()[0] == 2
+
+
+def test_blank_subject_counts_as_general(store):
+    store.record("work", "  ", 60, when=MONDAY)
+    assert store.subject_totals() == [("General", 60)]
+
+
+def test_iso_weeks_span_the_new_year(store):
+    store.record("work", "Math", 100, when=datetime(2024, 12, 30, 12))
+    store.record("work", "Math", 200, when=datetime(2025, 1, 2, 12))
+    assert store.total("week", when=datetime(2025, 1, 5)) == 300
+    assert store.total("day", when=datetime(2025, 1, 2)) == 200
+
+
+def test_totals_survive_reopen_and_match_the_history(path):
+    store = edupal.SessionStore(path)
+    for day in range(10):
+        store.record("work", ["Math", "History"][day % 2], 25 * 60, when=MONDAY + timedelta(days=day))
+        store.record("break", "Math", 5 * 60, when=MONDAY + timedelta(days=day))
+    store.close()
+    store = edupal.SessionStore(path)
+    try:
+        assert store.total("all") == 10 * 25 * 60
+        assert store.total("week", when=MONDAY) == 7 * 25 * 60
+        assert dict(store.subject_totals()) == {"Math": 5 * 25 * 60, "History": 5 * 25 * 60}
+        summed = store.db.execute("SELECT SUM(seconds) FROM session_events WHERE kind = 'work'").fetchone()[0]
+        assert summed == store.total("all")
+        sessions = store.totals[("all", "all", store.ALL_SUBJECTS)][1]
+        assert sessions == 10
+    finally:
+        store.close()
@@ -0,0 +1,103 @@
+import json
+import threading
+import time
+
+import edupal
+
+
+def count_writes(store, monkeypatch):
+    writes = []
+    write = store._write
+
+    def counting_write(generation, snapshot):
+        writes.append(generation)
+        write(generation, snapshot)
+
+    monkeypatch.setattr(store, "_write", counting_write)
+    return writes
+
+
+def test_quick_changes_are_written_once(tmp_path, monkeypatch):
+    path = tmp_path / "settings.json"
+    store = edupal.SettingsStore(str(path), defaults={"accent_color": "#000000"}, delay=0.2)
+    writes = count_writes(store, monkeypatch)
+    for i in range(100):
+        store["volume"] = i  # e.g. a slider drag
+    store["accent_color"] = "#FF5722"
+    deadline = time.monotonic() + 5
+    while not writes and time.monotonic() < deadline:
+        time.sleep(0.05)
+    time.sleep(0.3)
+    assert len(writes) == 1
+    assert json.loads(path.read_text()) == {"accent_color": "#FF5722", "volume": 99}
+    store.close()
+    assert len(writes) == 1  # Nothing left to flush
+
+
+def test_unchanged_values_do_not_write(tmp_path, monkeypatch):
+    store = edupal.SettingsStore(str(tmp_path / "settings.json"), defaults={"dark_mode": True}, delay=0)
+    writes = count_writes(store, monkeypatch)
+    store["dark_mode"] = True
+    store.close()
+    assert writes == []
+
+
+def test_file_is_always_valid_json(tmp_path):
+    path = tmp_path / "settings.json"
+    store = edupal.SettingsStore(str(path), delay=0)
+    store["ready"] = True
+    store.flush()
+    errors = []
+    done = threading.Event()
+
+    def read_continuously():
+        while not done.is_set():
+            try:
+                json.loads(path.read_text())
+            except ValueError as e:
+                errors.append(e)
+
+    reader = threading.Thread(target=read_continuously)
+    reader.start()
+    for i in range(300):
+        store["counter"] = i
+        store["notes_folders"] = [f"folder {j}" for j in range(i % 20)]
+    store.close()
+    done.set()
+    reader.join()
+    assert errors == []
+    assert json.loads(path.read_text())["counter"] == 299
+
+
+def test_changes_do_not_wait_for_the_disk(tmp_path, monkeypatch):
+    store = edupal.SettingsStore(str(tmp_path / "settings.json"), delay=0)
+    writing = threading.Event()
+    release = threading.Event()
+    fsync = edupal.os.fsync
+
+    def slow_fsync(fd):
+        writing.set()
+        release.wait(5)
+        fsync(fd)
+
+    monkeypatch.setattr(edupal.os, "fsync", slow_fsync)
+    store["theme"] = "dark"
+    assert writing.wait(5)
+    started = time.perf_counter()
+    store["theme"] = "light"  # The writer is stuck in fsync
+    assert store["theme"] == "light"
+    assert time.perf_counter() - started < 0.5
+    release.set()
+    store.close()
+    assert json.loads((tmp_path / "settings.json").read_text()) == {"theme": "light"}
+
+
+def test_older_snapshot_never_replaces_newer(tmp_path):
+    path = tmp_path / "settings.json"
+    store = edupal.SettingsStore(str(path), delay=60)
+    store["step"] = 1
+    store["step"] = 2
+    store.flush()
+    store._write(1, {"step": 1})  # A slow writer finishing late
+    assert json.loads(path.read_text()) == {"step": 2}
+    store.close()
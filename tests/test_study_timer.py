@@ -0,0 +1,82 @@
+import pytest
+
+import edupal
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def timer(clock):
+    return edupal.StudyTimer(work_seconds=25 * 60, break_seconds=5 * 60, clock=clock)
+
+
+def test_deadline_does_not_drift_with_late_ticks(timer, clock):
+    timer.start()
+    assert timer.display_seconds() == 25 * 60
+    for _ in range(600):
+        clock.advance(1.37)  # Irregular, late UI ticks
+        timer.poll()
+    assert timer.remaining() == pytest.approx(25 * 60 - 600 * 1.37)
+    clock.advance(0.4)
+    assert timer.next_tick_ms() in range(5, 1006)
+
+
+def test_pause_and_resume_keep_the_remaining_time(timer, clock):
+    timer.start()
+    clock.advance(100)
+    timer.pause()
+    clock.advance(3600)  # Time spent paused does not count
+    assert timer.remaining() == 25 * 60 - 100
+    assert timer.poll() is None
+    timer.start()
+    clock.advance(50)
+    assert timer.remaining() == 25 * 60 - 150
+
+
+def test_poll_switches_sessions(timer, clock):
+    timer.start()
+    clock.advance(25 * 60 - 0.5)
+    assert timer.poll() is None
+    clock.advance(1)
+    assert timer.poll() == "work"
+    assert (timer.session_type, timer.running, timer.remaining()) == ("break", False, 5 * 60)
+    assert timer.poll() is None  # Nothing runs until the next start
+    timer.start()
+    clock.advance(5 * 60)
+    assert timer.poll() == "break"
+    assert timer.session_type == "work"
+
+
+def test_configure_only_applies_to_an_untouched_session(timer, clock):
+    timer.configure(10 * 60, 2 * 60)
+    assert timer.remaining() == 10 * 60
+    timer.start()
+    clock.advance(60)
+    timer.pause()
+    timer.configure(20 * 60, 2 * 60)
+    assert timer.remaining() == 9 * 60
+    timer.reset()
+    assert timer.remaining() == 20 * 60 and timer.session_type == "work"
+
+
+def test_display_rounds_up(timer, clock):
+    timer.start()
+    clock.advance(0.2)
+    assert timer.display_seconds() == 25 * 60
+    clock.advance(25 * 60)
+    assert timer.display_seconds() == 0
+
@@ -0,0 +1,100 @@
+import pytest
+
+import edupal
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = edupal.TaskStore(str(tmp_path / "todo_list.json"))
+    yield store
+    store.close()
+
+
+@pytest.fixture
+def model(store):
+    for text in ["Write essay due:2024-05-02 #english", "buy milk", "Algebra homework due:2024-04-30 #math",
+                 "read chapter 3 #english"]:
+        store.add(text)
+    return edupal.TaskModel(store)
+
+
+def texts(model, ids):
+    return [model.get(task_id).text for task_id in ids]
+
+
+def test_sort_indexes(model):
+    assert texts(model, model.view()) == ["Write essay due:2024-05-02 #english", "buy milk",
+                                          "Algebra homework due:2024-04-30 #math", "read chapter 3 #english"]
+    assert texts(model, model.view(sort="due"))[:2] == ["Algebra homework due:2024-04-30 #math",
+                                                        "Write essay due:2024-05-02 #english"]
+    assert texts(model, model.view(sort="alpha")) == ["Algebra homework due:2024-04-30 #math", "buy milk",
+                                                      "read chapter 3 #english", "Write essay due:2024-05-02 #english"]
+
+
+def test_indexes_follow_edits(model):
+    task = model.add("Biology lab due:2024-04-01")
+    assert model.view(sort="due")[0] == task.id
+    milk = model.search("milk").pop()
+    model.set_completed(milk, True)
+    assert model.counts() == (4, 1)
+    assert list(model.view(status="done")) == [milk]
+    assert model.clear_completed() == 1
+    model.delete(task.id)
+    assert len(model.view(sort="alpha")) == 3
+    for name in model.SORTS:
+        assert len(model.sorted[name]) == len(model.by_id) == 3
+    assert model.in_sync()
+
+
+def test_search_narrows_previous_matches(model):
+    assert len(model.search("#english")) == 2
+    assert len(model.search("e")) == 3
+    milk = next(task.id for task in model.by_id.values() if task.text == "buy milk")
+    essay_like = model.search("es")
+    assert model.search_cache[0] == "es"
+    assert texts(model, essay_like) == ["Write essay due:2024-05-02 #english"]
+    model.search("e")
+    model.by_id[milk].folded = "yes"  # Only a full scan can find it now
+    assert milk not in model.search("es")
+    assert milk in model.search("y")  # Not an extension of "es": scans every task again
+
+
+def test_search_cache_drops_deleted_tasks(model):
+    model.search("e")
+    algebra = next(task.id for task in model.by_id.values() if "algebra" in task.folded)
+    model.delete(algebra)
+    assert algebra not in model.search("ew")
+    assert model.search("#math") == set()
+    assert texts(model, model.view(query="#english essay")) == ["Write essay due:2024-05-02 #english"]
+
+
+def test_add_loaded_indexes_an_import(store, model):
+    ids = store.add_many([{"text": "Zoology notes"}, {"text": "Art project due:2024-01-01", "completed": True}])
+    assert not model.in_sync()
+    model.search("o")
+    model.add_loaded(ids)
+    assert model.in_sync()
+    assert texts(model, model.view(sort="alpha"))[0] == "Algebra homework due:2024-04-30 #math"
+    assert texts(model, model.view(sort="alpha"))[-1] == "Zoology notes"
+    assert model.view(sort="due")[0] == ids[1]
+    assert model.counts() == (5, 1)
+    assert ids[0] in model.search("oo")  # The narrowing cache was reset
+
+
+def test_outside_edits_mark_the_model_stale(store, model):
+    model.add("mine")
+    assert model.in_sync()
+    store.add("from the chat")
+    assert not model.in_sync()
+    rebuilt = edupal.TaskModel(store)
+    assert rebuilt.in_sync() and len(rebuilt.view()) == 6
+
+
+def test_unindexed_tasks_edit_the_store(store, model):
+    plain = edupal.UnindexedTasks(store)
+    task = plain.add("quick one")
+    plain.set_completed(task.id, True)
+    assert plain.get(task.id).completed
+    assert list(plain.view()) == store.ids()
+    assert plain.clear_completed() == 1
+    assert not model.in_sync() and not plain.in_sync()
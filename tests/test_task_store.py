@@ -0,0 +1,158 @@
+import json
+
+import pytest
+
+import edupal
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "todo_list.json")
+
+
+def texts(store):
+    return [task["text"] for task in store.all()]
+
+
+def reopen(store, path):
+    store.close()
+    return edupal.TaskStore(path)
+
+
+def test_ops_survive_reload(path):
+    store = edupal.TaskStore(path)
+    first = store.add("read chapter 1")
+    second = store.add("write summary")
+    store.set_completed(first, True)
+    store.delete(second)
+    store = reopen(store, path)
+    assert store.all() == [dict(store.get(first))]
+    assert store.get(first)["completed"] is True
+    store.close()
+
+
+def test_torn_last_line_is_dropped_and_truncated(path):
+    store = edupal.TaskStore(path)
+    store.add("kept")
+    store.journal.close()  # Simulate a crash: no close-time compaction
+    with open(path + ".journal", "a", encoding="utf-8") as f:
+        f.write('{"op": "add", "id": 9, "te')
+    store = edupal.TaskStore(path)
+    assert texts(store) == ["kept"]
+    store.add("after crash")
+    store.journal.close()
+    with open(path + ".journal", encoding="utf-8") as f:
+        assert all(json.loads(line) for line in f)  # No garbage left mid-file
+    store = edupal.TaskStore(path)
+    assert texts(store) == ["kept", "after crash"]
+    store.close()
+
+
+def test_compaction_then_reload(path):
+    store = edupal.TaskStore(path, compact_every=10)
+    ids = [store.add(f"task {i}") for i in range(25)]
+    store.set_completed(ids[3], True)
+    store.delete(ids[0])
+    if store.compactor is not None:
+        store.compactor.join()
+    store.compact()
+    with open(path, encoding="utf-8") as f:
+        assert len(json.load(f)) == 24
+    expected = store.all()
+    store = reopen(store, path)
+    assert store.all() == expected
+    assert store.add("next") == ids[-1] + 1
+    store.close()
+
+
+def test_add_many_commit(path):
+    store = edupal.TaskStore(path)
+    ids = store.add_many(({"text": f"imp{i}", "completed": i == 2} for i in range(5)), chunk_size=2)
+    assert len(ids) == 5
+    assert texts(store) == [f"imp{i}" for i in range(5)]
+    store = reopen(store, path)
+    assert texts(store) == [f"imp{i}" for i in range(5)]
+    assert store.get(ids[2])["completed"] is True
+    store.close()
+
+
+def test_add_many_abort(path):
+    store = edupal.TaskStore(path)
+    store.add("keep")
+    calls = []
+
+    def cancelled():
+        calls.append(1)
+        return len(calls) > 1
+
+    with pytest.raises(InterruptedError):
+        store.add_many(({"text": f"imp{i}"} for i in range(5)), chunk_size=2, cancelled=cancelled)
+    assert texts(store) == ["keep"]
+    store = reopen(store, path)
+    assert texts(store) == ["keep"]
+    store.close()
+
+
+def test_crash_before_commit_discards_batch(path):
+    store = edupal.TaskStore(path)
+    store.add("keep")
+    store.journal.close()
+    with open(path + ".journal", "a", encoding="utf-8") as f:
+        f.write(json.dumps({"op": "begin", "txn": 5}) + "\n")
+        for i in range(3):
+            f.write(json.dumps({"op": "add", "id": 10 + i, "text": f"imp{i}", "completed": False,
+                                "created": 0.0, "txn": 5}) + "\n")
+    store = edupal.TaskStore(path)
+    assert texts(store) == ["keep"]
+    assert store.add("next") == 2
+    store.close()
+
+
+def test_ops_of_a_transaction_without_begin_are_dropped(path):
+    with open(path + ".journal", "w", encoding="utf-8") as f:
+        f.write(json.dumps({"op": "add", "id": 1, "text": "keep", "completed": False, "created": 0.0}) + "\n")
+        f.write(json.dumps({"op": "add", "id": 2, "text": "orphan", "completed": False,
+                            "created": 0.0, "txn": 3}) + "\n")
+    store = edupal.TaskStore(path)
+    assert texts(store) == ["keep"]
+    store.close()
+
+
+def test_compaction_racing_an_open_transaction(path):
+    store = edupal.TaskStore(path)
+    store.add("keep")
+    calls = []
+
+    def records():
+        for i in range(1, 5):
+            if i == 3:
+                store.compact()  # A background compaction lands mid-import
+            yield {"text": f"imp{i}"}
+
+    def cancelled():
+        calls.append(1)
+        return len(calls) > 2
+
+    with pytest.raises(InterruptedError):
+        store.add_many(records(), chunk_size=2, cancelled=cancelled)
+    assert texts(store) == ["keep"]
+    store.journal.close()  # Reload from the journal, not a close-time snapshot
+    store = edupal.TaskStore(path)
+    assert texts(store) == ["keep"]
+    store.close()
+
+
+def test_compaction_waits_for_commit(path):
+    store = edupal.TaskStore(path)
+
+    def records():
+        for i in range(4):
+            if i == 2:
+                store.compact()
+            yield {"text": f"imp{i}"}
+
+    store.add_many(records(), chunk_size=2)
+    store.journal.close()  # Crash after the commit, before any compaction
+    store = edupal.TaskStore(path)
+    assert texts(store) == [f"imp{i}" for i in range(4)]
+    store.close()
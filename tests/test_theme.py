@@ -0,0 +1,95 @@
+import pytest
+
+import edupal
+
+
+class FakeStyle:
+    def __init__(self, root):
+        self.styles = {}
+
+    def configure(self, name, **options):
+        self.styles.setdefault(name, {}).update(options)
+
+    def map(self, name, **options):
+        pass
+
+
+class FakeWidget:
+    count = 0
+
+    def __init__(self, parent=None, **options):
+        FakeWidget.count += 1
+        self.path = f".w{FakeWidget.count}"
+        self.options = dict(options)
+        self.tags = {}
+        self.destroyed = False
+        self.on_destroy = []
+
+    def __str__(self):
+        return self.path
+
+    def configure(self, **options):
+        if self.destroyed:
+            raise edupal.tk.TclError(f'invalid command name "{self.path}"')
+        self.options.update(options)
+
+    def tag_configure(self, tag, **options):
+        if self.destroyed:
+            raise edupal.tk.TclError(f'invalid command name "{self.path}"')
+        self.tags.setdefault(tag, {}).update(options)
+
+    def bind(self, sequence, callback, add=None):
+        self.on_destroy.append(callback)
+
+    def destroy(self):
+        self.destroyed = True
+        for callback in self.on_destroy:
+            callback(None)
+
+
+@pytest.fixture
+def theme(monkeypatch):
+    monkeypatch.setattr(edupal.ttk, "Style", FakeStyle)
+    return edupal.ThemeManager(root=None, dark=True)
+
+
+def test_created_widgets_follow_palette_switches(theme):
+    label = theme.create(FakeWidget, None, bg="bg_primary", fg="accent", text="bg_primary?")
+    assert label.options["bg"] == edupal.ThemeManager.PALETTES["dark"]["bg_primary"]
+    assert label.options["text"] == "bg_primary?"  # Not a role name
+    theme.set_palette(dark=False, accent="#FF5722")
+    assert label.options == {"bg": "#F0F2F5", "fg": "#FF5722", "text": "bg_primary?"}
+    assert theme.style.styles["EduPal.Horizontal.TProgressbar"]["background"] == "#FF5722"
+
+
+def test_text_tags_follow_palette_switches(theme):
+    log = FakeWidget()
+    theme.bind_tag(log, "timestamp", foreground="chat_sender")
+    theme.bind_tag(log, "message", foreground="text_primary")
+    assert log.tags == {"timestamp": {"foreground": "#7ADBFC"}, "message": {"foreground": "#E8E8E8"}}
+    theme.set_palette(dark=False)
+    assert log.tags == {"timestamp": {"foreground": "#0066CC"}, "message": {"foreground": "#333333"}}
+
+
+def test_destroyed_widgets_are_forgotten(theme):
+    kept = theme.create(FakeWidget, None, bg="bg_secondary")
+    gone = theme.create(FakeWidget, None, bg="bg_secondary")
+    gone.destroy()
+    assert str(gone) not in theme.bindings
+    silent = theme.bind(FakeWidget(), fg="text_secondary")
+    silent.destroyed = True  # Destroyed without a Destroy event
+    text = FakeWidget()
+    theme.bind_tag(text, "heading", foreground="chat_sender")
+    text.destroyed = True
+    theme.set_palette(dark=False)
+    assert list(theme.bindings) == [str(kept)]
+    assert theme.tag_bindings == {}
+    assert kept.options["bg"] == "#FFFFFF"
+
+
+def test_listeners_run_after_each_switch(theme):
+    seen = []
+    theme.on_change("plot", lambda: seen.append(theme["bg_primary"]))
+    theme.on_change("plot", lambda: seen.append(theme["accent"]))  # Replaces the first
+    theme.set_palette(accent="#123456")
+    assert seen == ["#123456"]
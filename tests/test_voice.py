@@ -0,0 +1,68 @@
+import math
+import struct
+import wave
+
+import edupal
+
+
+def write_wav(path, segments, rate=16000):
+    """Write a 16-bit mono WAV from (seconds, amplitude) segments of a 440 Hz tone"""
+    frames = bytearray()
+    for seconds, amplitude in segments:
+        for i in range(int(seconds * rate)):
+            frames += struct.pack("<h", int(amplitude * math.sin(2 * math.pi * 440 * i / rate)))
+    with wave.open(str(path), "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(rate)
+        wav.writeframes(bytes(frames))
+
+
+class CountingRecognizer:
+    def __init__(self):
+        self.calls = []
+
+    def recognize(self, audio, sample_rate, sample_width):
+        self.calls.append(len(audio))
+        return f"word{len(self.calls)}"
+
+
+def run_pipeline(path):
+    recognizer = CountingRecognizer()
+    pipeline = edupal.VoicePipeline(edupal.WavFileSource(str(path), realtime=False), recognizer)
+    partials = []
+    return pipeline.run(partials.append), recognizer, partials
+
+
+def test_one_recognize_call_per_phrase(tmp_path):
+    path = tmp_path / "one.wav"
+    write_wav(path, [(0.5, 0), (0.6, 8000), (2.0, 0)])
+    transcript, recognizer, partials = run_pipeline(path)
+    assert transcript == "word1"
+    assert len(recognizer.calls) == 1
+    assert recognizer.calls[0] >= int(0.6 * 16000) * 2  # The whole tone went in one phrase
+    assert partials == ["word1"]
+
+
+def test_short_pause_splits_phrases(tmp_path):
+    path = tmp_path / "two.wav"
+    write_wav(path, [(0.5, 0), (0.6, 8000), (0.6, 0), (0.6, 8000), (2.0, 0)])
+    transcript, recognizer, _ = run_pipeline(path)
+    assert transcript == "word1 word2"
+    assert len(recognizer.calls) == 2
+
+
+def test_speech_running_to_end_of_file_is_recognized_once(tmp_path):
+    path = tmp_path / "cut.wav"
+    write_wav(path, [(0.5, 0), (0.6, 8000)])
+    transcript, recognizer, _ = run_pipeline(path)
+    assert transcript == "word1"
+    assert len(recognizer.calls) == 1
+
+
+def test_silence_only_never_recognizes(tmp_path):
+    path = tmp_path / "quiet.wav"
+    write_wav(path, [(1.0, 0)])
+    transcript, recognizer, _ = run_pipeline(path)
+    assert transcript == ""
+    assert recognizer.calls == []